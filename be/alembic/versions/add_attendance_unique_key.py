@@ -0,0 +1,34 @@
+"""add unique (student_id, class_id, date) key to attendance
+
+Revision ID: add_attendance_unique_key
+Revises: add_campus_rollups
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_attendance_unique_key'
+down_revision = 'add_campus_rollups'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keep only the newest record of each (student, class, date) before adding the key
+    op.execute("""
+        DELETE a1 FROM attendance a1
+        JOIN attendance a2
+          ON a1.student_id = a2.student_id
+         AND a1.class_id = a2.class_id
+         AND a1.date = a2.date
+         AND a1.attendance_id < a2.attendance_id
+    """)
+    op.create_unique_constraint(
+        'uq_attendance_student_class_date', 'attendance', ['student_id', 'class_id', 'date']
+    )
+
+
+def downgrade():
+    op.drop_constraint('uq_attendance_student_class_date', 'attendance', type_='unique')
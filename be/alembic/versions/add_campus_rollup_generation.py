@@ -0,0 +1,23 @@
+"""add generation to campus_rollups for deltas applied after commit
+
+Revision ID: add_campus_rollup_generation
+Revises: add_training_jobs
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_campus_rollup_generation'
+down_revision = 'add_training_jobs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('campus_rollups', sa.Column('generation', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    op.drop_column('campus_rollups', 'generation')
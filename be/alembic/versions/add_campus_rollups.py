@@ -0,0 +1,43 @@
+"""add campus rollups table
+
+Revision ID: add_campus_rollups
+Revises: add_class_risk_analytics
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_campus_rollups'
+down_revision = 'add_class_risk_analytics'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Aggregates per campus/department/class/academic year read by dashboards and reports.
+    # Populate with `python rebuild_campus_rollups.py` after upgrading.
+    op.create_table('campus_rollups',
+        sa.Column('scope', sa.Enum('campus', 'department', 'class', 'academic_year'), nullable=False),
+        sa.Column('scope_key', sa.String(length=100), nullable=False),
+        sa.Column('total_students', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_classes', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('present_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('absent_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('late_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('excused_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('graded_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('gpa_sum', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('risk_low', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('risk_medium', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('risk_high', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('open_disciplinary', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('computed_at', sa.TIMESTAMP(), nullable=True),
+        sa.Column('updated_at', sa.TIMESTAMP(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+        sa.PrimaryKeyConstraint('scope', 'scope_key')
+    )
+
+
+def downgrade():
+    op.drop_table('campus_rollups')
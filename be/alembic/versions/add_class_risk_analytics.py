@@ -0,0 +1,31 @@
+"""add precomputed class risk analytics table
+
+Revision ID: add_class_risk_analytics
+Revises: add_student_risk_features
+Create Date: 2025-06-03 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_class_risk_analytics'
+down_revision = 'add_student_risk_features'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Stored payloads of the class dropout risk analytics endpoints
+    op.create_table('class_risk_analytics',
+        sa.Column('class_id', sa.Integer(), nullable=False),
+        sa.Column('analytics', sa.JSON(), nullable=False),
+        sa.Column('ml_analytics', sa.JSON(), nullable=False),
+        sa.Column('computed_at', sa.TIMESTAMP(), nullable=False),
+        sa.ForeignKeyConstraint(['class_id'], ['classes.class_id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('class_id')
+    )
+
+
+def downgrade():
+    op.drop_table('class_risk_analytics')
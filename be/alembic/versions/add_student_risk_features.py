@@ -0,0 +1,44 @@
+"""add student risk feature store table
+
+Revision ID: add_student_risk_features
+Revises: update_disciplinary_record
+Create Date: 2025-06-02 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_student_risk_features'
+down_revision = 'update_disciplinary_record'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Materialized per-student features used by the dropout risk models
+    op.create_table('student_risk_features',
+        sa.Column('student_id', sa.Integer(), nullable=False),
+        sa.Column('attendance_rate', sa.Float(), nullable=False, server_default='100'),
+        sa.Column('avg_gpa', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('failed_subjects', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_subjects', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('minor_violations', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('moderate_violations', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('severe_violations', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('academic_status', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('family_income_level', sa.Integer(), nullable=False, server_default='2'),
+        sa.Column('scholarship_status', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('previous_academic_warning', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('dropped_classes', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('semester_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('grade_trend', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('attendance_trend', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.TIMESTAMP(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+        sa.ForeignKeyConstraint(['student_id'], ['students.student_id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('student_id')
+    )
+
+
+def downgrade():
+    op.drop_table('student_risk_features')
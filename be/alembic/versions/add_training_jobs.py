@@ -0,0 +1,44 @@
+"""add training_jobs table shared by all workers
+
+Revision ID: add_training_jobs
+Revises: add_users_updated_at_index
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_training_jobs'
+down_revision = 'add_users_updated_at_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Background training jobs; active_kind is unique so only one job per kind runs across workers
+    op.create_table('training_jobs',
+        sa.Column('job_id', sa.String(length=32), nullable=False),
+        sa.Column('kind', sa.String(length=50), nullable=False),
+        sa.Column('active_kind', sa.String(length=50), nullable=True),
+        sa.Column('options', sa.JSON(), nullable=True),
+        sa.Column('status', sa.Enum('pending', 'running', 'completed', 'failed'), nullable=False, server_default='pending'),
+        sa.Column('progress', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('stage', sa.String(length=50), nullable=False, server_default='queued'),
+        sa.Column('result', sa.JSON(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.TIMESTAMP(), nullable=False),
+        sa.Column('started_at', sa.TIMESTAMP(), nullable=True),
+        sa.Column('finished_at', sa.TIMESTAMP(), nullable=True),
+        sa.Column('heartbeat_at', sa.TIMESTAMP(), nullable=False),
+        sa.PrimaryKeyConstraint('job_id'),
+        sa.UniqueConstraint('active_kind')
+    )
+    op.create_index('ix_training_jobs_kind', 'training_jobs', ['kind'])
+    op.create_index('ix_training_jobs_created_at', 'training_jobs', ['created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_training_jobs_created_at', table_name='training_jobs')
+    op.drop_index('ix_training_jobs_kind', table_name='training_jobs')
+    op.drop_table('training_jobs')
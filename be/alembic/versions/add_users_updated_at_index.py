@@ -0,0 +1,23 @@
+"""add index on users.updated_at for search index catch-up
+
+Revision ID: add_users_updated_at_index
+Revises: add_attendance_unique_key
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_users_updated_at_index'
+down_revision = 'add_attendance_unique_key'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_users_updated_at', 'users', ['updated_at'])
+
+
+def downgrade():
+    op.drop_index('ix_users_updated_at', table_name='users')
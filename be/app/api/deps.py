@@ -9,6 +9,7 @@ from app.core.security import verify_password
 from app.db.database import get_db
 from app.models.models import User
 from app.schemas.schemas import TokenData
+from app.services.principal_cache import resolve_principal, attach_user
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
 
@@ -34,8 +35,7 @@ def get_current_user(
     except (JWTError, ValidationError):
         raise credentials_exception
 
-    user = db.query(User).filter(User.username == token_data.username).first()
-
-    if user is None:
+    principal = resolve_principal(db, token_data.username)
+    if principal is None:
         raise credentials_exception
-    return user
+    return attach_user(db, principal)
@@ -16,6 +16,8 @@ from app.api.v1.uploads import router as uploads_router
 from app.api.v1.class_dropout_risk import router as class_dropout_risk_router
 from app.api.v1.class_dropout_risk_ml import router as class_dropout_risk_ml_router
 from app.api.v1.endpoints.class_subject import router as class_subject_router
+from app.api.v1.endpoints.dashboard import router as dashboard_router
+from app.api.v1.metrics import router as metrics_router
 
 api_router = APIRouter()
 
@@ -67,3 +69,9 @@ api_router.include_router(model_performance_router, prefix="/model-performance",
 
 # Upload routes
 api_router.include_router(uploads_router, prefix="/uploads", tags=["uploads"])
+
+# Dashboard routes
+api_router.include_router(dashboard_router, prefix="/dashboard", tags=["dashboard"])
+
+# Metrics routes
+api_router.include_router(metrics_router, prefix="/metrics", tags=["metrics"])
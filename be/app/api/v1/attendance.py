@@ -2,16 +2,19 @@ from typing import List, Optional, Dict, Any
 from datetime import date
 from fastapi import APIRouter, Depends, HTTPException, Query, status, Body
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.database import get_db
+from app.db.database import get_db, get_async_db
 from app.models.models import User, Student, Teacher
 from app.models.attendance import Attendance
 from app.schemas.attendance import (
     AttendanceCreate, AttendanceUpdate, AttendanceResponse,
-    AttendanceSummary, BulkAttendanceCreate
+    AttendanceSummary, BulkAttendanceCreate, AttendanceReport
 )
 from app.crud import attendance as attendance_crud
 from app.api.v1.auth import get_current_active_user
+from app.services.auth import get_current_teacher_id, get_current_student_id, get_current_principal
+from app.services.principal_cache import Principal
 
 router = APIRouter()
 
@@ -26,8 +29,9 @@ async def read_attendance_records(
     end_date: Optional[date] = None,
     status: Optional[str] = None,
     include_details: bool = False,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user),
+    principal: Principal = Depends(get_current_principal)
 ):
     """
     Lấy danh sách điểm danh với các bộ lọc tùy chọn:
@@ -46,8 +50,8 @@ async def read_attendance_records(
     # Kiểm tra quyền
     if current_user.role == "student":
         # Sinh viên chỉ được xem điểm danh của bản thân
-        student = db.query(Student).filter(Student.user_id == current_user.user_id).first()
-        if not student:
+        current_student_id = principal.student_id
+        if current_student_id is None:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không tìm thấy thông tin sinh viên"
@@ -55,17 +59,17 @@ async def read_attendance_records(
         
         # Nếu không chỉ định student_id, sử dụng ID của sinh viên đang đăng nhập
         if student_id is None:
-            student_id = student.student_id
+            student_id = current_student_id
         
         # Nếu chỉ định student_id khác với ID của sinh viên đang đăng nhập, từ chối
-        elif student_id != student.student_id:
+        elif student_id != current_student_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không có quyền xem thông tin điểm danh của sinh viên khác"
             )
     
-    # Lấy danh sách bản ghi điểm danh
-    records = attendance_crud.get_attendance_records(
+    # Lấy danh sách bản ghi điểm danh (sinh viên và lớp học được nạp sẵn cho student_name/class_name)
+    records = await attendance_crud.get_attendance_records_async(
         db, 
         skip=skip, 
         limit=limit, 
@@ -74,17 +78,9 @@ async def read_attendance_records(
         date=date,
         start_date=start_date,
         end_date=end_date,
-        status=status,
-        include_details=include_details
+        status=status
     )
     
-    # Nếu yêu cầu chi tiết nhưng không dùng hybrid properties, thủ công lấy thông tin
-    if include_details and records:
-        # Đảm bảo thông tin student_name và class_name được điền đầy đủ 
-        for record in records:
-            # Hybrid properties bây giờ sẽ tự động lấy thông tin này
-            pass
-    
     return records
 
 @router.post("/", response_model=AttendanceResponse, status_code=status.HTTP_201_CREATED)
@@ -105,8 +101,8 @@ async def create_new_attendance(
     
     # Nếu là giáo viên, kiểm tra xem có phụ trách lớp này không
     if current_user.role == "teacher":
-        teacher = db.query(Teacher).filter(Teacher.user_id == current_user.user_id).first()
-        if not teacher:
+        current_teacher_id = get_current_teacher_id(db, current_user)
+        if current_teacher_id is None:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không tìm thấy thông tin giáo viên"
@@ -115,7 +111,7 @@ async def create_new_attendance(
         # Kiểm tra xem giáo viên có phụ trách lớp này không
         from app.models.models import Class
         class_obj = db.query(Class).filter(Class.class_id == attendance.class_id).first()
-        if not class_obj or class_obj.teacher_id != teacher.teacher_id:
+        if not class_obj or class_obj.teacher_id != current_teacher_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không có quyền tạo điểm danh cho lớp này"
@@ -134,8 +130,8 @@ async def get_attendance_summary(
     """
     # Kiểm tra quyền
     if current_user.role == "student":
-        student = db.query(Student).filter(Student.user_id == current_user.user_id).first()
-        if not student or student.student_id != student_id:
+        current_student_id = get_current_student_id(db, current_user)
+        if current_student_id is None or current_student_id != student_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không có quyền xem thống kê điểm danh của sinh viên khác"
@@ -150,6 +146,93 @@ async def get_attendance_summary(
     
     return attendance_crud.get_student_attendance_summary(db, student_id)
 
+@router.get("/reports/class/{class_id}", response_model=AttendanceReport)
+def get_class_attendance_report(
+    class_id: int,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+    principal: Principal = Depends(get_current_principal)
+):
+    """
+    Báo cáo điểm danh của một lớp: số buổi theo trạng thái của từng sinh viên và theo tuần,
+    tùy chọn giới hạn trong khoảng thời gian (start_date, end_date).
+    Chỉ admin, cố vấn và giáo viên phụ trách lớp mới có quyền.
+    """
+    if current_user.role not in ["admin", "counselor", "teacher"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Không đủ quyền xem báo cáo điểm danh"
+        )
+    
+    from app.models.models import Class
+    class_obj = db.query(Class).filter(Class.class_id == class_id).first()
+    if not class_obj:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Không tìm thấy lớp học"
+        )
+    
+    # Giáo viên chỉ xem được lớp mình phụ trách
+    if current_user.role == "teacher" and class_obj.teacher_id != principal.teacher_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Không có quyền xem báo cáo điểm danh của lớp này"
+        )
+    
+    report = attendance_crud.get_attendance_report(
+        db,
+        class_id=class_id,
+        start_date=start_date,
+        end_date=end_date
+    )
+    report["class_name"] = class_obj.class_name
+    return report
+
+@router.get("/reports/period", response_model=AttendanceReport)
+def get_period_attendance_report(
+    start_date: date,
+    end_date: date,
+    class_id: Optional[int] = None,
+    student_ids: Optional[List[int]] = Query(None, description="Giới hạn trong các sinh viên này"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+    principal: Principal = Depends(get_current_principal)
+):
+    """
+    Báo cáo điểm danh trong khoảng thời gian cho nhiều sinh viên cùng lúc, theo sinh viên và theo tuần.
+    Giáo viên chỉ thấy điểm danh của các lớp mình phụ trách.
+    """
+    if current_user.role not in ["admin", "counselor", "teacher"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Không đủ quyền xem báo cáo điểm danh"
+        )
+    if start_date > end_date:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="start_date phải trước hoặc bằng end_date"
+        )
+    
+    teacher_id = None
+    if current_user.role == "teacher":
+        if principal.teacher_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Không tìm thấy thông tin giáo viên"
+            )
+        teacher_id = principal.teacher_id
+    
+    return attendance_crud.get_attendance_report(
+        db,
+        class_id=class_id,
+        student_ids=student_ids,
+        start_date=start_date,
+        end_date=end_date,
+        teacher_id=teacher_id
+    )
+
 @router.post("/bulk", response_model=List[AttendanceResponse], status_code=status.HTTP_201_CREATED)
 async def create_bulk_attendance(
     bulk_data: BulkAttendanceCreate,
@@ -168,8 +251,8 @@ async def create_bulk_attendance(
     
     # Nếu là giáo viên, kiểm tra xem có phụ trách lớp này không
     if current_user.role == "teacher":
-        teacher = db.query(Teacher).filter(Teacher.user_id == current_user.user_id).first()
-        if not teacher:
+        current_teacher_id = get_current_teacher_id(db, current_user)
+        if current_teacher_id is None:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không tìm thấy thông tin giáo viên"
@@ -178,7 +261,7 @@ async def create_bulk_attendance(
         # Kiểm tra xem giáo viên có phụ trách lớp này không
         from app.models.models import Class
         class_obj = db.query(Class).filter(Class.class_id == bulk_data.class_id).first()
-        if not class_obj or class_obj.teacher_id != teacher.teacher_id:
+        if not class_obj or class_obj.teacher_id != current_teacher_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không có quyền tạo điểm danh cho lớp này"
@@ -209,8 +292,8 @@ async def read_attendance(
     
     # Kiểm tra quyền
     if current_user.role == "student":
-        student = db.query(Student).filter(Student.user_id == current_user.user_id).first()
-        if not student or db_attendance.student_id != student.student_id:
+        current_student_id = get_current_student_id(db, current_user)
+        if current_student_id is None or db_attendance.student_id != current_student_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không có quyền xem bản ghi điểm danh này"
@@ -246,12 +329,12 @@ async def update_attendance_record(
     
     # Nếu là giáo viên, kiểm tra xem có phụ trách lớp này không
     if current_user.role == "teacher":
-        teacher = db.query(Teacher).filter(Teacher.user_id == current_user.user_id).first()
-        print(f"Found teacher: {teacher is not None}")
-        if teacher:
-            print(f"Teacher ID: {teacher.teacher_id}")
+        current_teacher_id = get_current_teacher_id(db, current_user)
+        print(f"Found teacher: {current_teacher_id is not None}")
+        if current_teacher_id is not None:
+            print(f"Teacher ID: {current_teacher_id}")
         
-        if not teacher:
+        if current_teacher_id is None:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không tìm thấy thông tin giáo viên"
@@ -263,9 +346,9 @@ async def update_attendance_record(
         print(f"Found class: {class_obj is not None}")
         if class_obj:
             print(f"Class teacher_id: {class_obj.teacher_id}")
-            print(f"Teacher ID matches: {class_obj.teacher_id == teacher.teacher_id}")
+            print(f"Teacher ID matches: {class_obj.teacher_id == current_teacher_id}")
         
-        if not class_obj or class_obj.teacher_id != teacher.teacher_id:
+        if not class_obj or class_obj.teacher_id != current_teacher_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không có quyền cập nhật điểm danh cho lớp này"
@@ -298,8 +381,8 @@ async def delete_attendance_record(
     
     # Nếu là giáo viên, kiểm tra xem có phụ trách lớp này không
     if current_user.role == "teacher":
-        teacher = db.query(Teacher).filter(Teacher.user_id == current_user.user_id).first()
-        if not teacher:
+        current_teacher_id = get_current_teacher_id(db, current_user)
+        if current_teacher_id is None:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không tìm thấy thông tin giáo viên"
@@ -308,7 +391,7 @@ async def delete_attendance_record(
         # Kiểm tra xem giáo viên có phụ trách lớp này không
         from app.models.models import Class
         class_obj = db.query(Class).filter(Class.class_id == db_attendance.class_id).first()
-        if not class_obj or class_obj.teacher_id != teacher.teacher_id:
+        if not class_obj or class_obj.teacher_id != current_teacher_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không có quyền xóa điểm danh cho lớp này"
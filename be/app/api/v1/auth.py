@@ -5,6 +5,7 @@ from datetime import timedelta
 
 from app.db.database import get_db
 from app.services.auth import authenticate_user, create_access_token, get_current_active_user
+from app.services.last_login import last_login_recorder
 from app.schemas.schemas import Token, UserResponse, LoginRequest
 from app.core.config import settings
 from app.models.models import User
@@ -30,6 +31,8 @@ async def login_for_access_token(form_data: LoginRequest, db: Session = Depends(
             detail="Tài khoản đã bị vô hiệu hóa hoặc tạm ngưng, vui lòng liên hệ quản trị viên",
         )
     
+    last_login_recorder.record(user)
+    
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         subject=user.username, role=user.role, expires_delta=access_token_expires
@@ -56,6 +59,8 @@ async def login_oauth(form_data: OAuth2PasswordRequestForm = Depends(), db: Sess
             detail="Tài khoản đã bị vô hiệu hóa hoặc tạm ngưng, vui lòng liên hệ quản trị viên",
         )
     
+    last_login_recorder.record(user)
+    
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         subject=user.username, role=user.role, expires_delta=access_token_expires
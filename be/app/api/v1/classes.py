@@ -1,5 +1,5 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
 
 from app.db.database import get_db
@@ -10,7 +10,10 @@ from app.schemas.schemas import (
     StudentResponse
 )
 from app.crud import class_crud
-from app.services.auth import get_current_active_user, check_admin_role, check_teacher_role
+from app.services.auth import (
+    get_current_active_user, check_admin_role, check_teacher_role,
+    get_current_teacher_id, get_current_student_id
+)
 
 router = APIRouter()
 
@@ -39,18 +42,18 @@ async def read_classes(
     
     # Nếu là giáo viên, chỉ xem được lớp của mình
     if current_user.role == "teacher":
-        teacher = db.query(Teacher).filter(Teacher.user_id == current_user.user_id).first()
-        if not teacher:
+        current_teacher_id = get_current_teacher_id(db, current_user)
+        if current_teacher_id is None:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không tìm thấy thông tin giáo viên"
             )
-        teacher_id = teacher.teacher_id
+        teacher_id = current_teacher_id
     
     # Nếu là sinh viên, chỉ xem được lớp mình tham gia
     elif current_user.role == "student":
-        student = db.query(Student).filter(Student.user_id == current_user.user_id).first()
-        if not student:
+        current_student_id = get_current_student_id(db, current_user)
+        if current_student_id is None:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không tìm thấy thông tin sinh viên"
@@ -60,7 +63,7 @@ async def read_classes(
         enrolled_class_ids = (
             db.query(ClassStudent.class_id)
             .filter(
-                ClassStudent.student_id == student.student_id,
+                ClassStudent.student_id == current_student_id,
                 ClassStudent.status == "enrolled"
             )
             .all()
@@ -108,7 +111,7 @@ async def read_class(
     """
     Lấy thông tin chi tiết về một lớp học.
     """
-    db_class = class_crud.get_class(db, class_id=class_id)
+    db_class = class_crud.get_class(db, class_id=class_id, options=class_crud.CLASS_RESPONSE_OPTIONS)
     if db_class is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -138,8 +141,8 @@ async def update_class_info(
     if current_user.role == "teacher":
         # Trong trường hợp này, cần kiểm tra xem teacher_id trong db_class có phải
         # là ID của giáo viên đang đăng nhập không
-        teacher = db.query(Teacher).filter(Teacher.user_id == current_user.user_id).first()
-        if not teacher or db_class.teacher_id != teacher.teacher_id:
+        current_teacher_id = get_current_teacher_id(db, current_user)
+        if current_teacher_id is None or db_class.teacher_id != current_teacher_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không có quyền chỉnh sửa lớp này"
@@ -183,8 +186,8 @@ async def read_class_students(
     
     # Kiểm tra quyền (sinh viên chỉ có thể xem lớp của mình)
     if current_user.role == "student":
-        student = db.query(Student).filter(Student.user_id == current_user.user_id).first()
-        if not student:
+        current_student_id = get_current_student_id(db, current_user)
+        if current_student_id is None:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không tìm thấy thông tin sinh viên"
@@ -193,7 +196,7 @@ async def read_class_students(
         # Kiểm tra xem sinh viên có trong lớp này không
         enrollment = db.query(ClassStudent).filter(
             ClassStudent.class_id == class_id,
-            ClassStudent.student_id == student.student_id,
+            ClassStudent.student_id == current_student_id,
             ClassStudent.status == "enrolled"
         ).first()
         
@@ -235,8 +238,8 @@ async def add_students_to_class(
                 detail="Không tìm thấy lớp học"
             )
         
-        teacher = db.query(Teacher).filter(Teacher.user_id == current_user.user_id).first()
-        if not teacher or db_class.teacher_id != teacher.teacher_id:
+        current_teacher_id = get_current_teacher_id(db, current_user)
+        if current_teacher_id is None or db_class.teacher_id != current_teacher_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không có quyền quản lý lớp này"
@@ -270,8 +273,8 @@ async def remove_student_from_class(
                 detail="Không tìm thấy lớp học"
             )
         
-        teacher = db.query(Teacher).filter(Teacher.user_id == current_user.user_id).first()
-        if not teacher or db_class.teacher_id != teacher.teacher_id:
+        current_teacher_id = get_current_teacher_id(db, current_user)
+        if current_teacher_id is None or db_class.teacher_id != current_teacher_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không có quyền quản lý lớp này"
@@ -282,14 +285,21 @@ async def remove_student_from_class(
 @router.get("/{class_id}/available-students", response_model=List[StudentResponse])
 async def get_available_students(
     class_id: int,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    after_id: Optional[int] = Query(None, description="student_id from the X-Next-After-Id header of the previous page"),
+    search: Optional[str] = Query(None, description="Search student code or name"),
+    max_course_load: Optional[int] = Query(None, ge=1, description="Exclude students enrolled in this many classes or more"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
     Get list of students not currently enrolled in the class.
     Only admin and teachers in charge of the class have access.
+    
+    Pages are keyset-paginated: pass the X-Next-After-Id header of a response as
+    `after_id` to get the next page (`skip` is only used without `after_id`).
     """
     # Check permissions
     if current_user.role not in ["admin", "teacher"]:
@@ -307,11 +317,22 @@ async def get_available_students(
                 detail="Class not found"
             )
         
-        teacher = db.query(Teacher).filter(Teacher.user_id == current_user.user_id).first()
-        if not teacher or db_class.teacher_id != teacher.teacher_id:
+        current_teacher_id = get_current_teacher_id(db, current_user)
+        if current_teacher_id is None or db_class.teacher_id != current_teacher_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Not authorized to manage this class"
             )
     
-    return class_crud.get_available_students(db=db, class_id=class_id, skip=skip, limit=limit)
+    students, next_after_id = class_crud.get_available_students(
+        db=db,
+        class_id=class_id,
+        skip=skip,
+        limit=limit,
+        after_id=after_id,
+        search=search,
+        max_course_load=max_course_load
+    )
+    if next_after_id is not None:
+        response.headers["X-Next-After-Id"] = str(next_after_id)
+    return students
@@ -8,7 +8,7 @@ from app.models.models import User, Student, Teacher, DisciplinaryRecord
 from app.schemas.schemas import DisciplinaryRecordCreate, DisciplinaryRecordUpdate, DisciplinaryRecordResponse
 from app.crud import disciplinary_record as disciplinary_crud
 from app.api.v1.auth import get_current_active_user
-from app.services.auth import check_admin_role
+from app.services.auth import check_admin_role, get_current_student_id
 
 router = APIRouter()
 
@@ -34,8 +34,8 @@ async def read_disciplinary_records(
     # Kiểm tra quyền
     if current_user.role == "student":
         # Sinh viên chỉ được xem biên bản của bản thân
-        student = db.query(Student).filter(Student.user_id == current_user.user_id).first()
-        if not student:
+        current_student_id = get_current_student_id(db, current_user)
+        if current_student_id is None:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không tìm thấy thông tin sinh viên"
@@ -44,8 +44,8 @@ async def read_disciplinary_records(
         # Nếu người dùng không chỉ định student_id thì sử dụng ID của họ
         # Nếu chỉ định student_id khác với ID của họ thì từ chối
         if student_id is None:
-            student_id = student.student_id
-        elif student_id != student.student_id:
+            student_id = current_student_id
+        elif student_id != current_student_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không có quyền xem biên bản kỷ luật của sinh viên khác"
@@ -101,8 +101,8 @@ async def read_disciplinary_record(
     
     # Kiểm tra quyền
     if current_user.role == "student":
-        student = db.query(Student).filter(Student.user_id == current_user.user_id).first()
-        if not student or db_record.student_id != student.student_id:
+        current_student_id = get_current_student_id(db, current_user)
+        if current_student_id is None or db_record.student_id != current_student_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không có quyền xem biên bản kỷ luật này"
@@ -1,5 +1,5 @@
 from typing import List, Optional, Dict, Any
-from fastapi import APIRouter, Depends, HTTPException, status, Query, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
 import json
 
@@ -7,26 +7,33 @@ from app.db.database import get_db
 from app.models.models import User, Student
 from app.services.auth import get_current_active_user, check_admin_role, check_counselor_role, check_teacher_role
 from app.services.dropout_risk_ml_service import MLDropoutRiskPredictionService
+from app.services.training_jobs import training_jobs, ModelNotReady, ML_MODELS_JOB
+from app.services.prediction_cache import prediction_cache
 
 router = APIRouter()
 
-@router.post("/train-models", response_model=Dict[str, Any])
+@router.post("/train-models", response_model=Dict[str, Any], status_code=status.HTTP_202_ACCEPTED)
 async def train_ml_models(
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
+    search_strategy: Optional[str] = Query(None, pattern="^(grid|random|halving)$", description="Chiến lược tìm siêu tham số"),
+    search_budget: Optional[int] = Query(None, ge=1, description="Số ứng viên tối đa cho chiến lược random"),
+    warm_start: Optional[bool] = Query(None, description="Tìm kiếm quanh best_params của mô hình trước"),
     current_user: User = Depends(check_admin_role)
 ):
     """
-    Huấn luyện lại mô hình Random Forest và Logistic Regression
-    Chỉ admin mới có quyền thực hiện
+    Huấn luyện lại mô hình Random Forest và Logistic Regression trong process nền
+    Chỉ admin mới có quyền thực hiện. Nếu đang có job huấn luyện, trả về job đó.
     """
     try:
-        ml_service = MLDropoutRiskPredictionService(db)
-        results = ml_service.train_models()
+        job = training_jobs.submit(
+            ML_MODELS_JOB,
+            search_strategy=search_strategy,
+            search_budget=search_budget,
+            warm_start=warm_start
+        )
         
         return {
-            "message": "Huấn luyện mô hình thành công",
-            "results": results
+            "message": "Đã tiếp nhận yêu cầu huấn luyện mô hình",
+            "job": job.to_dict()
         }
     except Exception as e:
         raise HTTPException(
@@ -34,6 +41,91 @@ async def train_ml_models(
             detail=f"Lỗi khi huấn luyện mô hình: {str(e)}"
         )
 
+def _get_training_job_or_404(job_id: str):
+    job = training_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Không tìm thấy job huấn luyện")
+    return job
+
+@router.get("/training-jobs", response_model=List[Dict[str, Any]])
+async def list_training_jobs(
+    current_user: User = Depends(check_admin_role)
+):
+    """
+    Danh sách các job huấn luyện gần đây
+    """
+    return [job.to_dict() for job in training_jobs.list()]
+
+@router.get("/training-jobs/{job_id}", response_model=Dict[str, Any])
+async def get_training_job(
+    job_id: str,
+    current_user: User = Depends(check_admin_role)
+):
+    """
+    Trạng thái của job huấn luyện
+    """
+    return _get_training_job_or_404(job_id).to_dict()
+
+@router.get("/training-jobs/{job_id}/progress", response_model=Dict[str, Any])
+async def get_training_job_progress(
+    job_id: str,
+    current_user: User = Depends(check_admin_role)
+):
+    """
+    Tiến độ của job huấn luyện
+    """
+    job = _get_training_job_or_404(job_id)
+    return {
+        "job_id": job.job_id,
+        "status": job.status,
+        "progress": job.progress,
+        "stage": job.stage
+    }
+
+@router.get("/training-jobs/{job_id}/result", response_model=Dict[str, Any])
+async def get_training_job_result(
+    job_id: str,
+    current_user: User = Depends(check_admin_role)
+):
+    """
+    Kết quả huấn luyện (chỉ có khi job đã hoàn thành)
+    """
+    job = _get_training_job_or_404(job_id)
+    if job.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Job huấn luyện chưa hoàn thành"
+        )
+    if job.error:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Lỗi khi huấn luyện mô hình: {job.error}"
+        )
+    return {
+        "message": "Huấn luyện mô hình thành công",
+        "job_id": job.job_id,
+        "results": job.result
+    }
+
+@router.get("/prediction-cache/stats", response_model=Dict[str, Any])
+async def get_prediction_cache_stats(
+    current_user: User = Depends(check_admin_role)
+):
+    """
+    Thống kê cache kết quả dự đoán (hit/miss, kích thước)
+    """
+    return prediction_cache.stats()
+
+@router.delete("/prediction-cache", response_model=Dict[str, Any])
+async def clear_prediction_cache(
+    current_user: User = Depends(check_admin_role)
+):
+    """
+    Xóa toàn bộ cache kết quả dự đoán
+    """
+    prediction_cache.clear()
+    return {"message": "Đã xóa cache kết quả dự đoán"}
+
 @router.get("/model-performance", response_model=Dict[str, Any])
 async def get_model_performance(
     db: Session = Depends(get_db),
@@ -86,6 +178,8 @@ async def predict_student_dropout_risk_ml(
                 result["risk_factors"] = {}
         
         return result
+    except ModelNotReady:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -104,7 +198,7 @@ async def predict_all_students_ml(
     """
     try:
         ml_service = MLDropoutRiskPredictionService(db)
-        results = ml_service.predict_all_students()
+        results = ml_service.predict_all_students(use_ensemble=use_ensemble)
         
         # Đảm bảo risk_factors là dictionary cho mỗi kết quả
         for result in results:
@@ -115,6 +209,8 @@ async def predict_all_students_ml(
                     result["risk_factors"] = {}
         
         return results
+    except ModelNotReady:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -235,6 +331,8 @@ async def compare_models_prediction(
                 "suggested_actions": ml_service._get_recommendations(result_ensemble["risk_factors"])
             }
         }
+    except ModelNotReady:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -1,9 +1,10 @@
 from typing import List, Optional, Dict, Any
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import json
 
-from app.db.database import get_db
+from app.db.database import get_db, get_async_db
 from app.models.models import User, Student
 from app.schemas.schemas import DropoutRiskCreate, DropoutRiskUpdate, DropoutRiskResponse
 from app.crud.dropout_risk import (
@@ -11,12 +12,19 @@ from app.crud.dropout_risk import (
     get_dropout_risks, 
     get_dropout_risks_by_student,
     get_latest_dropout_risk_by_student,
+    get_dropout_risks_async,
+    get_dropout_risks_by_student_async,
     create_dropout_risk, 
     update_dropout_risk, 
     delete_dropout_risk
 )
-from app.services.auth import get_current_active_user, check_admin_role, check_counselor_role, check_teacher_role
+from app.services.auth import (
+    get_current_active_user, check_admin_role, check_counselor_role, check_teacher_role,
+    get_current_student_id, get_current_principal
+)
+from app.services.principal_cache import Principal
 from app.services.dropout_risk_prediction import DropoutRiskPredictionService
+from app.services.risk_scoring import RiskScoringEngine, SCORERS, RULE_BASED
 
 router = APIRouter()
 
@@ -27,8 +35,9 @@ async def read_dropout_risks(
     min_risk: Optional[float] = None,
     max_risk: Optional[float] = None,
     student_id: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user),
+    principal: Principal = Depends(get_current_principal)
 ):
     """
     Lấy danh sách đánh giá nguy cơ bỏ học
@@ -36,17 +45,16 @@ async def read_dropout_risks(
     - Có thể lọc theo student_id, min_risk, max_risk
     """
     if current_user.role == "student":
-        student = db.query(Student).filter(Student.user_id == current_user.user_id).first()
-        if not student:
+        if principal.student_id is None:
             return []
-        risks = get_dropout_risks_by_student(db, student_id=student.student_id)
+        risks = await get_dropout_risks_by_student_async(db, student_id=principal.student_id)
     else:
         # Nếu có student_id, lấy của student đó
         if student_id is not None:
-            risks = get_dropout_risks_by_student(db, student_id=student_id)
+            risks = await get_dropout_risks_by_student_async(db, student_id=student_id)
         else:
             # Nếu không có student_id, lấy tất cả với các filter khác
-            risks = get_dropout_risks(db, skip=skip, limit=limit, min_risk=min_risk, max_risk=max_risk)
+            risks = await get_dropout_risks_async(db, skip=skip, limit=limit, min_risk=min_risk, max_risk=max_risk)
     
     # Đảm bảo risk_factors là dictionary
     for risk in risks:
@@ -72,23 +80,23 @@ async def create_new_dropout_risk(
 @router.get("/{student_id}/historical", response_model=List[DropoutRiskResponse])
 async def get_student_risk_history(
     student_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user),
+    principal: Principal = Depends(get_current_principal)
 ):
     """
     Lấy lịch sử đánh giá nguy cơ bỏ học của một sinh viên
     """
     # Kiểm tra quyền truy cập
     if current_user.role == "student":
-        student = db.query(Student).filter(Student.user_id == current_user.user_id).first()
-        if not student or student.student_id != student_id:
+        if principal.student_id is None or principal.student_id != student_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không đủ quyền truy cập thông tin đánh giá của sinh viên khác"
             )
             
     # Lấy lịch sử đánh giá
-    risks = get_dropout_risks_by_student(db, student_id=student_id)
+    risks = await get_dropout_risks_by_student_async(db, student_id=student_id)
     
     # Đảm bảo risk_factors là dictionary cho mỗi đánh giá
     for risk in risks:
@@ -115,8 +123,8 @@ async def read_dropout_risk(
         raise HTTPException(status_code=404, detail="Không tìm thấy đánh giá")
     
     if current_user.role == "student":
-        student = db.query(Student).filter(Student.user_id == current_user.user_id).first()
-        if not student or student.student_id != db_risk.student_id:
+        current_student_id = get_current_student_id(db, current_user)
+        if current_student_id is None or current_student_id != db_risk.student_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không đủ quyền truy cập thông tin đánh giá của sinh viên khác"
@@ -240,3 +248,33 @@ async def predict_all_students_dropout_risk(
                 result["risk_factors"] = {}
                 
     return results
+
+@router.post("/score", response_model=Dict[str, Any])
+def score_students_dropout_risk(
+    student_ids: Optional[List[int]] = Query(None, description="Danh sách sinh viên, bỏ trống để chấm điểm tất cả"),
+    scorers: List[str] = Query([RULE_BASED], description=f"Các bộ chấm điểm: {', '.join(SCORERS)}"),
+    save_with: Optional[str] = Query(None, description="Lưu kết quả của bộ chấm điểm này vào lịch sử đánh giá"),
+    include_features: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(check_teacher_role)
+):
+    """
+    Chấm điểm nguy cơ bỏ học cho nhiều sinh viên với các bộ chấm điểm được chọn.
+    Đặc trưng được nạp một lần và dùng chung cho mọi bộ chấm điểm.
+    """
+    invalid = [name for name in scorers + ([save_with] if save_with else []) if name not in SCORERS]
+    if invalid:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Bộ chấm điểm không hợp lệ: {', '.join(invalid)}"
+        )
+    
+    try:
+        return RiskScoringEngine(db).score_students(
+            student_ids,
+            scorers,
+            save_with=save_with,
+            include_features=include_features
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
@@ -1,164 +1,75 @@
-from typing import Dict, Any
-from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Dict, Any, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 
 from app.db.database import get_db
-from app.models.models import (
-    User, Student, Class, Teacher, 
-    Attendance, Grade, DisciplinaryRecord,
-    ClassStudent, ClassSubject, Subject
-)
-from app.services.auth import get_current_active_user, check_admin_role, check_teacher_role
+from app.models.models import User
+from app.crud import campus_rollup as campus_rollup_crud
+from app.crud.campus_rollup import ROLLUP_SCOPES
+from app.services.auth import get_current_active_user, get_current_principal, check_admin_role
+from app.services.principal_cache import Principal
+from app.services.dashboard_stats import get_dashboard_stats
+from app.services.campus_rollups import rollup_refresher
 
 router = APIRouter()
 
 @router.get("/stats", response_model=Dict[str, Any])
-async def get_dashboard_stats(
-    role: str,
+def read_dashboard_stats(
+    role: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user),
+    principal: Principal = Depends(get_current_principal)
 ):
     """
-    Get dashboard statistics based on user role
+    Lấy thống kê dashboard theo vai trò của người dùng đang đăng nhập.
+    Kết quả được cache ngắn hạn theo từng người dùng và bị hủy khi dữ liệu liên quan thay đổi.
     """
-    if role == "admin":
-        # Admin stats
-        total_students = db.query(Student).count()
-        total_classes = db.query(Class).count()
-        
-        # Calculate average attendance rate
-        attendance_rate = db.query(func.avg(Attendance.is_present)).scalar() or 0
-        attendance_rate = round(float(attendance_rate) * 100, 1)
-        
-        # Get count of high risk students
-        high_risk_count = db.query(Student).filter(Student.dropout_risk >= 0.7).count()
-        
-        return {
-            "totalStudents": total_students,
-            "totalClasses": total_classes,
-            "attendanceRate": attendance_rate,
-            "dropoutRiskCount": high_risk_count
-        }
-        
-    elif role == "teacher":
-        # Get teacher's records
-        teacher = db.query(Teacher).filter(Teacher.user_id == current_user.id).first()
-        if not teacher:
-            raise HTTPException(status_code=404, detail="Teacher not found")
-        
-        teacher_classes = db.query(Class).filter(Class.teacher_id == teacher.id).count()
-        
-        # Calculate attendance rate for teacher's classes
-        attendance_rate = (
-            db.query(func.avg(Attendance.is_present))
-            .join(ClassStudent)
-            .join(Class)
-            .filter(Class.teacher_id == teacher.id)
-            .scalar()
-        ) or 0
-        attendance_rate = round(float(attendance_rate) * 100, 1)
-        
-        # Count students needing attention (low grades or attendance)
-        need_attention = (
-            db.query(Student)
-            .join(ClassStudent)
-            .join(Class)
-            .filter(Class.teacher_id == teacher.id)
-            .filter(
-                (Student.attendance_rate < 0.8) | 
-                (Student.gpa < 2.0)
-            )
-            .count()
-        )
-        
-        return {
-            "teacherClasses": teacher_classes,
-            "attendanceRate": attendance_rate,
-            "needAttentionCount": need_attention
-        }
-        
-    elif role == "student":
-        # Get student's records
-        student = db.query(Student).filter(Student.user_id == current_user.id).first()
-        if not student:
-            raise HTTPException(status_code=404, detail="Student not found")
-        
-        # Get attendance rate
-        attendance_rate = (
-            db.query(func.avg(Attendance.is_present))
-            .filter(Attendance.student_id == student.id)
-            .scalar()
-        ) or 0
-        attendance_rate = round(float(attendance_rate) * 100, 1)
-        
-        # Get GPA
-        gpa = student.gpa if student.gpa else None
-        
-        # Get disciplinary count
-        disciplinary_count = (
-            db.query(DisciplinaryRecord)
-            .filter(DisciplinaryRecord.student_id == student.id)
-            .count()
-        )
-        
-        # Get current class info
-        current_class = (
-            db.query(Class)
-            .join(ClassStudent)
-            .filter(ClassStudent.student_id == student.id)
-            .first()
-        )
-        
-        class_name = current_class.name if current_class else None
-        teacher_name = (
-            current_class.teacher.user.full_name 
-            if current_class and current_class.teacher and current_class.teacher.user 
-            else None
+    if role is None:
+        role = current_user.role
+
+    if role not in ("admin", "teacher", "student"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Vai trò không hợp lệ")
+
+    # Chỉ được xem thống kê của vai trò của chính mình
+    if role != current_user.role:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Không đủ quyền xem thống kê của vai trò này"
         )
-        
-        # Get current subjects
-        current_subjects = []
-        if current_class:
-            subjects = (
-                db.query(Subject, ClassSubject)
-                .join(ClassSubject)
-                .filter(ClassSubject.class_id == current_class.id)
-                .all()
-            )
-            
-            for subject, class_subject in subjects:
-                # Get the teacher for this subject
-                teacher = (
-                    db.query(Teacher)
-                    .filter(Teacher.id == class_subject.teacher_id)
-                    .first()
-                )
-                
-                # Get student's grade for this subject
-                grade = (
-                    db.query(Grade)
-                    .filter(
-                        Grade.student_id == student.id,
-                        Grade.subject_id == subject.id
-                    )
-                    .first()
-                )
-                
-                current_subjects.append({
-                    "name": subject.name,
-                    "teacher": teacher.user.full_name if teacher and teacher.user else "N/A",
-                    "grade": grade.value if grade else None
-                })
-        
-        return {
-            "gpa": gpa,
-            "attendanceRate": attendance_rate,
-            "disciplinaryCount": disciplinary_count,
-            "className": class_name,
-            "teacherName": teacher_name,
-            "currentSubjects": current_subjects
-        }
-    
+
+    if role == "teacher" and principal.teacher_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Không tìm thấy thông tin giáo viên")
+    if role == "student" and principal.student_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Không tìm thấy thông tin sinh viên")
+
+    return get_dashboard_stats(
+        db,
+        role=role,
+        user_id=current_user.user_id,
+        teacher_id=principal.teacher_id,
+        student_id=principal.student_id
+    )
+
+@router.get("/rollups", response_model=List[Dict[str, Any]])
+def read_campus_rollups(
+    scope: Optional[str] = Query(None, description=f"Phạm vi: {', '.join(ROLLUP_SCOPES)}"),
+    scope_key: Optional[str] = Query(None, description="Tên khoa, class_id hoặc năm học"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(check_admin_role)
+):
+    """
+    Lấy số liệu tổng hợp đã tính sẵn theo toàn trường, khoa, lớp hoặc năm học
+    (tổng số sinh viên/lớp, điểm danh, điểm trung bình, phân nhóm nguy cơ, kỷ luật đang mở)
+    """
+    if scope is not None and scope not in ROLLUP_SCOPES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Phạm vi không hợp lệ")
+
+    if scope is not None and scope_key is not None:
+        rollup = campus_rollup_crud.get_campus_rollup(db, scope=scope, scope_key=scope_key)
+        rollups = [rollup] if rollup else []
     else:
-        raise HTTPException(status_code=400, detail="Invalid role")
+        rollups = campus_rollup_crud.get_campus_rollups(db, scope=scope)
+
+    computed = [rollup.computed_at for rollup in rollups if rollup.computed_at]
+    rollup_refresher.maybe_refresh(min(computed) if computed else None)
+    return [campus_rollup_crud.rollup_to_dict(rollup) for rollup in rollups]
@@ -1,12 +1,17 @@
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.database import get_db
+from app.db.database import get_db, get_async_db
 from app.models.models import User, Grade, Student, Teacher
 from app.schemas.schemas import GradeCreate, GradeUpdate, GradeResponse
 from app.crud import grade as grade_crud
-from app.services.auth import get_current_active_user, check_admin_role, check_teacher_role
+from app.services.auth import (
+    get_current_active_user, check_admin_role, check_teacher_role,
+    get_current_teacher_id, get_current_student_id, get_current_principal
+)
+from app.services.principal_cache import Principal
 
 router = APIRouter()
 
@@ -17,8 +22,9 @@ async def read_grades(
     student_id: Optional[int] = None,
     subject_id: Optional[int] = None,
     class_id: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user),
+    principal: Principal = Depends(get_current_principal)
 ):
     """
     Lấy danh sách điểm với bộ lọc tùy chọn:
@@ -31,8 +37,8 @@ async def read_grades(
     # Kiểm tra quyền
     if current_user.role == "student":
         # Sinh viên chỉ được xem điểm của bản thân
-        student = db.query(Student).filter(Student.user_id == current_user.user_id).first()
-        if not student:
+        current_student_id = principal.student_id
+        if current_student_id is None:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không tìm thấy thông tin sinh viên"
@@ -41,14 +47,14 @@ async def read_grades(
         # Nếu người dùng không chỉ định student_id thì sử dụng ID của họ
         # Nếu chỉ định student_id khác với ID của họ thì từ chối
         if student_id is None:
-            student_id = student.student_id
-        elif student_id != student.student_id:
+            student_id = current_student_id
+        elif student_id != current_student_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không có quyền xem điểm của sinh viên khác"
             )
     
-    grades = grade_crud.get_grades(
+    grades = await grade_crud.get_grades_async(
         db, 
         skip=skip, 
         limit=limit, 
@@ -76,8 +82,8 @@ async def create_new_grade(
     
     # Nếu là giáo viên, kiểm tra xem có phụ trách lớp này không
     if current_user.role == "teacher":
-        teacher = db.query(Teacher).filter(Teacher.user_id == current_user.user_id).first()
-        if not teacher:
+        current_teacher_id = get_current_teacher_id(db, current_user)
+        if current_teacher_id is None:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không tìm thấy thông tin giáo viên"
@@ -86,7 +92,7 @@ async def create_new_grade(
         # Kiểm tra xem giáo viên có phụ trách lớp này không
         from app.models.models import Class
         class_obj = db.query(Class).filter(Class.class_id == grade.class_id).first()
-        if not class_obj or class_obj.teacher_id != teacher.teacher_id:
+        if not class_obj or class_obj.teacher_id != current_teacher_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không có quyền tạo điểm cho lớp này"
@@ -112,8 +118,8 @@ async def read_grade(
     
     # Kiểm tra quyền
     if current_user.role == "student":
-        student = db.query(Student).filter(Student.user_id == current_user.user_id).first()
-        if not student or db_grade.student_id != student.student_id:
+        current_student_id = get_current_student_id(db, current_user)
+        if current_student_id is None or db_grade.student_id != current_student_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không có quyền xem điểm này"
@@ -147,8 +153,8 @@ async def update_grade_info(
     
     # Nếu là giáo viên, kiểm tra xem có phụ trách lớp này không
     if current_user.role == "teacher":
-        teacher = db.query(Teacher).filter(Teacher.user_id == current_user.user_id).first()
-        if not teacher:
+        current_teacher_id = get_current_teacher_id(db, current_user)
+        if current_teacher_id is None:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không tìm thấy thông tin giáo viên"
@@ -157,7 +163,7 @@ async def update_grade_info(
         # Kiểm tra xem giáo viên có phụ trách lớp này không
         from app.models.models import Class
         class_obj = db.query(Class).filter(Class.class_id == db_grade.class_id).first()
-        if not class_obj or class_obj.teacher_id != teacher.teacher_id:
+        if not class_obj or class_obj.teacher_id != current_teacher_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không có quyền cập nhật điểm cho lớp này"
@@ -0,0 +1,29 @@
+from typing import Dict, Any
+from fastapi import APIRouter, Depends
+
+from app.core.config import settings
+from app.db.metrics import pool_metrics, request_metrics
+from app.models.models import User
+from app.services.auth import check_admin_role
+
+router = APIRouter()
+
+@router.get("/db", response_model=Dict[str, Any])
+async def get_db_metrics(
+    current_user: User = Depends(check_admin_role)
+):
+    """
+    Thống kê connection pool (checkout, thời gian chờ, overflow, kết nối bị hủy)
+    và số câu lệnh SQL trung bình mỗi request của worker hiện tại
+    """
+    return {
+        "pool_settings": {
+            "pool_size": settings.DATABASE_POOL_SIZE,
+            "max_overflow": settings.DATABASE_MAX_OVERFLOW,
+            "pool_timeout": settings.DATABASE_POOL_TIMEOUT,
+            "pool_recycle": settings.DATABASE_POOL_RECYCLE,
+            "pool_pre_ping": settings.DATABASE_POOL_PRE_PING
+        },
+        "pools": {name: metrics.snapshot() for name, metrics in pool_metrics.items()},
+        "requests": request_metrics.snapshot()
+    }
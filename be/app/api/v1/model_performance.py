@@ -8,7 +8,7 @@ from datetime import datetime
 from app.db.database import get_db
 from app.models.models import User
 from app.services.auth import get_current_active_user, check_admin_role, check_teacher_role
-from app.services.dropout_risk_prediction import DropoutRiskPredictionService
+from app.services.training_jobs import training_jobs, ModelNotReady, GRADIENT_BOOSTING_JOB
 
 router = APIRouter()
 
@@ -37,15 +37,8 @@ async def get_dropout_risk_model_metrics(
                     print(f"Error loading model: {e}")
         
         if not model_data:
-            # Train a new model if no existing model
-            prediction_service = DropoutRiskPredictionService(db)
-            model_data = prediction_service._train_ml_model()
-            
-        if not model_data:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Không thể tải hoặc tạo mô hình machine learning"
-            )
+            # Chưa có mô hình: huấn luyện trong process nền thay vì trong request
+            raise ModelNotReady(training_jobs.submit(GRADIENT_BOOSTING_JOB))
         
         # Extract metrics
         accuracy = model_data.get("accuracy", 0.0)
@@ -69,40 +62,28 @@ async def get_dropout_risk_model_metrics(
             "recommendations": get_model_recommendations(accuracy, roc_auc)
         }
         
+    except ModelNotReady:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Lỗi khi lấy metrics mô hình: {str(e)}"
         )
 
-@router.post("/dropout-risk/retrain", response_model=Dict[str, Any])
+@router.post("/dropout-risk/retrain", response_model=Dict[str, Any], status_code=status.HTTP_202_ACCEPTED)
 async def retrain_dropout_risk_model(
-    db: Session = Depends(get_db),
     current_user: User = Depends(check_admin_role)
 ):
     """
-    Huấn luyện lại mô hình dự đoán nguy cơ bỏ học (chỉ admin)
+    Huấn luyện lại mô hình dự đoán nguy cơ bỏ học trong process nền (chỉ admin)
+    Theo dõi tiến độ qua /dropout-risks-ml/training-jobs/{job_id}
     """
     try:
-        prediction_service = DropoutRiskPredictionService(db)
-        model_data = prediction_service._train_ml_model()
-        
-        if not model_data:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Không thể huấn luyện mô hình"
-            )
-        
-        accuracy = model_data.get("accuracy", 0.0)
-        roc_auc = model_data.get("roc_auc", 0.0)
+        job = training_jobs.submit(GRADIENT_BOOSTING_JOB)
         
         return {
-            "message": "Mô hình đã được huấn luyện lại thành công",
-            "accuracy": round(accuracy, 4),
-            "roc_auc": round(roc_auc, 4),
-            "accuracy_percentage": round(accuracy * 100, 2),
-            "roc_auc_percentage": round(roc_auc * 100, 2),
-            "trained_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            "message": "Đã tiếp nhận yêu cầu huấn luyện lại mô hình",
+            "job": job.to_dict()
         }
         
     except Exception as e:
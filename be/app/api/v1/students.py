@@ -1,8 +1,9 @@
 from typing import List, Optional, Dict, Any
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.database import get_db
+from app.db.database import get_db, get_async_db
 from app.models.models import User, Student, ClassStudent, Class
 from app.schemas.schemas import (
     StudentCreate, StudentUpdate, StudentResponse, 
@@ -10,11 +11,17 @@ from app.schemas.schemas import (
     ClassResponse
 )
 from app.crud.student import (
-    get_student, get_students, create_student, 
-    update_student, delete_student, get_students_paginated,
-    get_student_by_user_id
+    get_student, create_student, update_student, delete_student,
+    get_student_by_user_id, get_student_async, get_students_async,
+    get_students_page_async
 )
-from app.services.auth import get_current_active_user, check_admin_role, check_teacher_role
+from app.services.auth import (
+    get_current_active_user, check_admin_role, check_teacher_role, get_current_student_id,
+    get_current_principal
+)
+from app.services.principal_cache import Principal
+from app.crud.student_feature import sync_student_features
+from app.services.search_index import student_search_index, STUDENT_SEARCH_FIELD_MAP
 
 router = APIRouter()
 
@@ -23,21 +30,22 @@ async def read_students(
     skip: int = 0, 
     limit: int = 100, 
     academic_status: Optional[str] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user),
+    principal: Principal = Depends(get_current_principal)
 ):
     """
     Lấy danh sách sinh viên (không dùng nữa, hãy sử dụng /paginated thay thế)
     """
     # Nếu là sinh viên, chỉ cho phép xem thông tin của bản thân
     if current_user.role == "student":
-        student = db.query(Student).filter(Student.user_id == current_user.user_id).first()
+        student = await get_student_async(db, principal.student_id) if principal.student_id else None
         if not student:
             return []
         return [student]
         
     # Nếu là giáo viên, cố vấn hoặc admin, cho phép xem danh sách
-    students = get_students(db, skip=skip, limit=limit, academic_status=academic_status)
+    students = await get_students_async(db, skip=skip, limit=limit, academic_status=academic_status)
     return students
 
 @router.get("/paginated", response_model=PaginatedResponse)
@@ -49,15 +57,21 @@ async def read_students_paginated(
     academic_status: Optional[str] = Query(None, description="Filter by academic status"),
     gender: Optional[str] = Query(None, description="Filter by gender"),
     class_id: Optional[int] = Query(None, description="Filter by class ID"),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    cursor: Optional[str] = Query(None, description="Cursor (next_cursor) of the previous page; replaces page"),
+    sort: Optional[str] = Query(None, description="Sort field, prefix with '-' for descending order"),
+    include_total: bool = Query(True, description="Include total and pages (count is cached)"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user),
+    principal: Principal = Depends(get_current_principal)
 ):
     """
-    Lấy danh sách sinh viên với phân trang, tìm kiếm và lọc
+    Lấy danh sách sinh viên với phân trang, tìm kiếm và lọc.
+    Phân trang theo page/size như trước; có thể truyền next_cursor của trang trước làm tham số cursor
+    để trang sau có chi phí như trang đầu (không OFFSET).
     """
     # Xử lý phân quyền
     if current_user.role == "student":
-        student = db.query(Student).filter(Student.user_id == current_user.user_id).first()
+        student = await get_student_async(db, principal.student_id) if principal.student_id else None
         if not student:
             return {"items": [], "total": 0, "page": page, "size": size, "pages": 0}
         return {
@@ -81,25 +95,61 @@ async def read_students_paginated(
     if class_id:
         filters["class_id"] = class_id
     
-    # Lấy dữ liệu sinh viên với phân trang
-    students, total = get_students_paginated(
-        db=db, 
-        pagination=pagination,
+    # Lấy dữ liệu sinh viên: trang theo page (OFFSET) hoặc trang sau cursor
+    students, total, next_cursor = await get_students_page_async(
+        db=db,
+        size=pagination.size,
+        cursor=cursor,
+        sort=sort,
+        offset=(pagination.page - 1) * pagination.size,
         search=search,
-        filters=filters
+        filters=filters,
+        include_total=include_total
     )
     
     # Tính số trang
-    pages = (total + pagination.size - 1) // pagination.size
+    pages = (total + pagination.size - 1) // pagination.size if total is not None else None
     
     return {
         "items": students,
         "total": total,
-        "page": pagination.page,
+        "page": None if cursor else pagination.page,
         "size": pagination.size,
-        "pages": pages
+        "pages": pages,
+        "next_cursor": next_cursor
     }
 
+@router.get("/search", response_model=List[Dict[str, Any]])
+def search_students(
+    q: str = Query(..., min_length=1, description="Mã sinh viên, họ tên hoặc email (không cần dấu)"),
+    field: Optional[str] = Query(None, description="Chỉ tìm trong trường: student_code, full_name, email"),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(check_teacher_role)
+):
+    """
+    Tìm kiếm nhanh sinh viên cho ô tìm kiếm, kết quả xếp hạng theo độ khớp.
+    Dùng chỉ mục trong bộ nhớ nên không quét bảng students/users.
+    """
+    if field is not None and field not in STUDENT_SEARCH_FIELD_MAP:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Không hỗ trợ tìm kiếm theo trường {field}"
+        )
+    
+    student_search_index.refresh(db)
+    return [
+        {
+            "student_id": document["id"],
+            "user_id": document["user_id"],
+            "student_code": document["code"],
+            "full_name": document["full_name"],
+            "email": document["email"],
+            "score": score
+        }
+        for document, score in student_search_index.search(q, field=STUDENT_SEARCH_FIELD_MAP.get(field), limit=limit)
+    ]
+
 @router.post("/", response_model=StudentResponse, status_code=status.HTTP_201_CREATED)
 async def create_new_student(
     student: StudentCreate, 
@@ -200,22 +250,22 @@ async def update_student_profile(
 @router.get("/{student_id}", response_model=StudentResponse)
 async def read_student(
     student_id: int, 
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user),
+    principal: Principal = Depends(get_current_principal)
 ):
     """
     Lấy thông tin sinh viên theo ID
     Sinh viên chỉ được xem thông tin của bản thân
     """
     if current_user.role == "student":
-        student = db.query(Student).filter(Student.user_id == current_user.user_id).first()
-        if not student or student.student_id != student_id:
+        if principal.student_id is None or principal.student_id != student_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không đủ quyền truy cập thông tin sinh viên khác"
             )
     
-    db_student = get_student(db, student_id=student_id)
+    db_student = await get_student_async(db, student_id=student_id)
     if db_student is None:
         raise HTTPException(status_code=404, detail="Không tìm thấy sinh viên")
     return db_student
@@ -238,8 +288,8 @@ async def update_student_info(
         
     # Nếu là sinh viên, chỉ được cập nhật thông tin cá nhân của bản thân
     if current_user.role == "student":
-        student_self = db.query(Student).filter(Student.user_id == current_user.user_id).first()
-        if not student_self or student_self.student_id != student_id:
+        current_student_id = get_current_student_id(db, current_user)
+        if current_student_id is None or current_student_id != student_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không đủ quyền cập nhật thông tin sinh viên khác"
@@ -272,8 +322,11 @@ async def update_student_info(
         for key, value in update_data.items():
             setattr(db_student, key, value)
         
+        # Tình trạng học tập, thu nhập gia đình là đặc trưng rủi ro đã lưu
+        sync_student_features(db, [student_id])
         db.commit()
         db.refresh(db_student)
+        student_search_index.mark_changed(student_id)
         return db_student
     
     # Nếu là admin hoặc cố vấn, được cập nhật tất cả thông tin
@@ -303,8 +356,8 @@ async def read_student_classes(
     # Kiểm tra quyền truy cập
     if current_user.role == "student":
         # Sinh viên chỉ có thể xem lớp học của chính mình
-        student = db.query(Student).filter(Student.user_id == current_user.user_id).first()
-        if not student or student.student_id != student_id:
+        current_student_id = get_current_student_id(db, current_user)
+        if current_student_id is None or current_student_id != student_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Không có quyền xem thông tin lớp học của sinh viên khác"
@@ -1,5 +1,5 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from typing import List, Optional, Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
 
 from app.db.database import get_db
@@ -7,23 +7,75 @@ from app.schemas.schemas import TeacherCreate, TeacherUpdate, TeacherResponse, U
 from app.models.models import Teacher, User
 from app.crud import teacher as teacher_crud
 from app.api.v1.auth import get_current_active_user
+from app.services.search_index import teacher_search_index, TEACHER_SEARCH_FIELD_MAP
 
 router = APIRouter()
 
 @router.get("/", response_model=List[TeacherResponse])
 def read_teachers(
+    response: Response,
     db: Session = Depends(get_db),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     department: Optional[str] = None,
+    search: Optional[str] = Query(None, description="Search teacher code, name or email"),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
+    sort: Optional[str] = Query(None, description="Sort field, prefix with '-' for descending order"),
+    include_total: bool = Query(False, description="Return the total count in the X-Total-Count header"),
     current_user: User = Depends(get_current_active_user)
 ):
     """
     Retrieve teachers with optional filtering by department.
+    
+    Pages are keyset-paginated: pass the X-Next-Cursor header of a response as
+    `cursor` to get the next page (`skip` is only used without a cursor).
     """
-    teachers = teacher_crud.get_teachers(db, skip=skip, limit=limit, department=department)
+    teachers, total, next_cursor = teacher_crud.get_teachers_page(
+        db,
+        size=limit,
+        cursor=cursor,
+        sort=sort,
+        offset=skip,
+        department=department,
+        include_total=include_total,
+        search=search
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if total is not None:
+        response.headers["X-Total-Count"] = str(total)
     return teachers
 
+@router.get("/search", response_model=List[Dict[str, Any]])
+def search_teachers(
+    q: str = Query(..., min_length=1, description="Teacher code, full name or email (diacritics optional)"),
+    field: Optional[str] = Query(None, description="Restrict to one field: teacher_code, full_name, email"),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Ranked quick search over teachers, served from the in-memory search index.
+    """
+    if field is not None and field not in TEACHER_SEARCH_FIELD_MAP:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Cannot search by field '{field}'"
+        )
+    
+    teacher_search_index.refresh(db)
+    return [
+        {
+            "teacher_id": document["id"],
+            "user_id": document["user_id"],
+            "teacher_code": document["code"],
+            "full_name": document["full_name"],
+            "email": document["email"],
+            "score": score
+        }
+        for document, score in teacher_search_index.search(q, field=TEACHER_SEARCH_FIELD_MAP.get(field), limit=limit)
+    ]
+
 @router.post("/", response_model=TeacherResponse, status_code=status.HTTP_201_CREATED)
 def create_teacher(
     teacher: TeacherCreate,
@@ -1,45 +1,59 @@
+import asyncio
 import os
 import shutil
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, status
+from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Query, status
 from typing import List, Optional
 
 from app.core.config import settings
 from app.utils.file_upload import FileUploader
 from app.schemas.upload import FileUploadResponse, ImageUploadResponse, BulkUploadResponse
 from app.api.deps import get_current_user
+from app.services.image_derivatives import image_derivatives, IMAGE_VARIANTS, THUMBNAIL_VARIANT
 
 router = APIRouter()
 
-@router.post("/image", response_model=ImageUploadResponse)
-async def upload_image(
-    file: UploadFile = File(...),
-    subfolder: str = Form(""),
-    current_user = Depends(get_current_user)
-):
+async def _store_image(file: UploadFile, subfolder: str) -> ImageUploadResponse:
     """
-    Upload một hình ảnh
+    Kiểm tra và lưu một hình ảnh theo từng khối trong luồng phụ
     """
     # Validate image
     FileUploader.validate_image(file)
     
-    # Save the image
-    saved_path = FileUploader.save_image(file, subfolder)
+    # Save the image (size limit is enforced while streaming)
+    saved_path, file_size = await FileUploader.save_image_async(file, subfolder)
     
-    # Get file size after saving
-    file_path = os.path.join(settings.UPLOAD_DIR, saved_path)
-    file_size = os.path.getsize(file_path)
+    # Tạo sẵn ảnh thu nhỏ; nếu lỗi thì vẫn giữ ảnh gốc, ảnh thu nhỏ sẽ được tạo khi được yêu cầu
+    cached = {}
+    try:
+        cached = await image_derivatives.ensure(saved_path)
+    except Exception as e:
+        print(f"Error generating image derivatives for {saved_path}: {e}")
     
     # Return the response
     image_url = f"/uploads/{saved_path}"
+    variants = image_derivatives.variant_urls(saved_path, cached)
     
     return ImageUploadResponse(
         filename=file.filename,
         filepath=saved_path,
         content_type=file.content_type,
         size=file_size,
-        url=image_url
+        url=image_url,
+        thumbnail_url=variants.get(THUMBNAIL_VARIANT),
+        variants=variants
     )
 
+@router.post("/image", response_model=ImageUploadResponse)
+async def upload_image(
+    file: UploadFile = File(...),
+    subfolder: str = Form(""),
+    current_user = Depends(get_current_user)
+):
+    """
+    Upload một hình ảnh
+    """
+    return await _store_image(file, subfolder)
+
 @router.get("/image/{filename}", response_model=ImageUploadResponse)
 async def get_image_details(
     filename: str,
@@ -81,13 +95,16 @@ async def get_image_details(
     # Return the response with normalized path separators
     relative_path = relative_path.replace('\\', '/')  # Normalize path separators
     image_url = f"/uploads/{relative_path}"
+    variants = image_derivatives.variant_urls(relative_path)
     
     return ImageUploadResponse(
         filename=filename,
         filepath=relative_path,
         content_type=content_type,
         size=file_size,
-        url=image_url
+        url=image_url,
+        thumbnail_url=variants.get(THUMBNAIL_VARIANT),
+        variants=variants
     )
 
 @router.post("/images", response_model=BulkUploadResponse)
@@ -101,32 +118,24 @@ async def upload_multiple_images(
     """
     response = BulkUploadResponse(uploaded_files=[], failed_files=[])
     
-    for file in files:
-        try:
-            # Validate image
-            FileUploader.validate_image(file)
-            
-            # Save the image
-            saved_path = FileUploader.save_image(file, subfolder)
-            
-            # Get file size after saving
-            file_path = os.path.join(settings.UPLOAD_DIR, saved_path)
-            file_size = os.path.getsize(file_path)
-            
-            # Add to uploaded files
-            image_url = f"/uploads/{saved_path}"
-            response.uploaded_files.append(
-                ImageUploadResponse(
-                    filename=file.filename,
-                    filepath=saved_path,
-                    content_type=file.content_type,
-                    size=file_size,
-                    url=image_url
-                )
-            )
-        except Exception as e:
-            # Add to failed files
-            response.failed_files.append(f"{file.filename}: {str(e)}")
+    # Lưu đồng thời nhưng giới hạn số file đang ghi cùng lúc
+    semaphore = asyncio.Semaphore(max(1, settings.UPLOAD_MAX_CONCURRENCY))
+    
+    async def store(file: UploadFile):
+        async with semaphore:
+            try:
+                return await _store_image(file, subfolder)
+            except Exception as e:
+                return str(e)
+    
+    results = await asyncio.gather(*(store(file) for file in files))
+    
+    # Kết quả giữ nguyên thứ tự các file gửi lên
+    for file, result in zip(files, results):
+        if isinstance(result, ImageUploadResponse):
+            response.uploaded_files.append(result)
+        else:
+            response.failed_files.append(f"{file.filename}: {result}")
     
     return response
 
@@ -152,9 +161,10 @@ async def delete_image(
             detail=f"File not found: {file_path}"
         )
     
-    # Delete the file
+    # Delete the file and its thumbnails
     try:
         os.remove(file_path)
+        image_derivatives.delete(os.path.join(subfolder, filename) if subfolder else filename)
         return {"message": "File deleted successfully"}
     except Exception as e:
         raise HTTPException(
@@ -272,6 +282,7 @@ async def list_images(
                 relative_path = filename
                 
             image_url = f"/uploads/{relative_path}"
+            variants = image_derivatives.variant_urls(relative_path)
             
             # Add to list
             files.append(
@@ -280,7 +291,9 @@ async def list_images(
                     filepath=relative_path,
                     content_type=content_type,
                     size=file_size,
-                    url=image_url
+                    url=image_url,
+                    thumbnail_url=variants.get(THUMBNAIL_VARIANT),
+                    variants=variants
                 )
             )
         
@@ -295,9 +308,11 @@ async def list_images(
 async def view_image(
     filename: str,
     subfolder: Optional[str] = None,
+    variant: Optional[str] = Query(None, description=f"Ảnh thu nhỏ WebP: {', '.join(IMAGE_VARIANTS)}"),
 ):
     """
-    Xem hình ảnh (trả về nội dung nhị phân của hình ảnh)
+    Xem hình ảnh (trả về nội dung nhị phân của hình ảnh).
+    Với variant, trả về ảnh thu nhỏ WebP, tạo và lưu cache ở lần yêu cầu đầu tiên.
     """
     from fastapi.responses import FileResponse
     
@@ -314,6 +329,28 @@ async def view_image(
             detail=f"Không tìm thấy file: {file_path}"
         )
     
+    if variant is not None:
+        if variant not in IMAGE_VARIANTS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Phiên bản ảnh không hợp lệ. Các phiên bản: {', '.join(IMAGE_VARIANTS)}"
+            )
+        relative_path = os.path.join(subfolder, filename) if subfolder else filename
+        try:
+            cached = await image_derivatives.ensure(relative_path)
+            if variant not in cached:
+                raise ValueError("ảnh thu nhỏ chưa được tạo")
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail=f"Không thể tạo ảnh thu nhỏ: {str(e)}"
+            )
+        return FileResponse(
+            path=os.path.join(settings.UPLOAD_DIR, cached[variant]),
+            media_type="image/webp",
+            headers={"Cache-Control": "public, max-age=86400"}
+        )
+    
     # Determine content type based on file extension
     content_type = "image/jpeg"  # Default
     if filename.lower().endswith(".png"):
@@ -21,20 +21,61 @@ class Settings(BaseSettings):
     UPLOAD_DIR: str = os.path.join(BASE_DIR, os.getenv("UPLOAD_DIR", "uploads"))
     MAX_IMAGE_SIZE: int = int(os.getenv("MAX_IMAGE_SIZE", "10485760"))  # 10MB
     ALLOWED_IMAGE_TYPES: List[str] = ["image/jpeg", "image/png", "image/jpg", "image/gif", "image/webp"]
+    UPLOAD_CHUNK_SIZE: int = int(os.getenv("UPLOAD_CHUNK_SIZE", "1048576"))  # 1MB mỗi lần ghi
+    UPLOAD_MAX_CONCURRENCY: int = int(os.getenv("UPLOAD_MAX_CONCURRENCY", "4"))  # số file lưu đồng thời khi upload nhiều
+    IMAGE_DERIVATIVE_DIR: str = os.getenv("IMAGE_DERIVATIVE_DIR", ".derivatives")  # thư mục ảnh thu nhỏ trong UPLOAD_DIR
+    IMAGE_DERIVATIVE_WORKERS: int = int(os.getenv("IMAGE_DERIVATIVE_WORKERS", "2"))  # số process tạo ảnh thu nhỏ
     
     # Cấu hình Database
     DATABASE_URL: str = os.getenv("DATABASE_URL", "mysql+pymysql://root:@localhost:3306/sinhvienbohoc")
+    # URL cho async engine (aiomysql), mặc định suy ra từ DATABASE_URL
+    ASYNC_DATABASE_URL: str = os.getenv(
+        "ASYNC_DATABASE_URL",
+        os.getenv("DATABASE_URL", "mysql+pymysql://root:@localhost:3306/sinhvienbohoc").replace("mysql+pymysql://", "mysql+aiomysql://")
+    )
     DATABASE_USER: str = os.getenv("DATABASE_USER", "root")
     DATABASE_PASSWORD: str = os.getenv("DATABASE_PASSWORD", "")
     DATABASE_NAME: str = os.getenv("DATABASE_NAME", "sinhvienbohoc") 
     DATABASE_HOST: str = os.getenv("DATABASE_HOST", "localhost")
     DATABASE_PORT: str = os.getenv("DATABASE_PORT", "3306")
+    # Connection pool (mỗi worker có pool riêng cho từng engine): tổng số kết nối tối đa
+    # = số worker x 2 engine x (POOL_SIZE + MAX_OVERFLOW), cần nhỏ hơn max_connections của MySQL
+    DATABASE_POOL_SIZE: int = int(os.getenv("DATABASE_POOL_SIZE", "5"))
+    DATABASE_MAX_OVERFLOW: int = int(os.getenv("DATABASE_MAX_OVERFLOW", "10"))
+    DATABASE_POOL_TIMEOUT: int = int(os.getenv("DATABASE_POOL_TIMEOUT", "30"))  # giây
+    DATABASE_POOL_RECYCLE: int = int(os.getenv("DATABASE_POOL_RECYCLE", "1800"))  # giây, nhỏ hơn wait_timeout của MySQL
+    DATABASE_POOL_PRE_PING: bool = os.getenv("DATABASE_POOL_PRE_PING", "True").lower() == "true"
+    PAGINATION_COUNT_CACHE_TTL: int = int(os.getenv("PAGINATION_COUNT_CACHE_TTL", "30"))  # giây
+    SEARCH_INDEX_REFRESH_INTERVAL: int = int(os.getenv("SEARCH_INDEX_REFRESH_INTERVAL", "300"))  # giây
+    SEARCH_INDEX_SYNC_INTERVAL: float = float(os.getenv("SEARCH_INDEX_SYNC_INTERVAL", "5"))  # giây
+    # Số kết quả tìm kiếm tối đa được phân trang
+    SEARCH_MAX_HITS: int = int(os.getenv("SEARCH_MAX_HITS", "1000"))
     
     # Cấu hình bảo mật
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your_secret_key_here")
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+    LAST_LOGIN_FLUSH_INTERVAL: int = int(os.getenv("LAST_LOGIN_FLUSH_INTERVAL", "30"))  # giây
+    AUTH_PRINCIPAL_CACHE_SIZE: int = int(os.getenv("AUTH_PRINCIPAL_CACHE_SIZE", "10000"))
+    AUTH_PRINCIPAL_CACHE_TTL: int = int(os.getenv("AUTH_PRINCIPAL_CACHE_TTL", "60"))  # giây
     
+    # Cấu hình mô hình Machine Learning
+    ML_MODEL_RELOAD_INTERVAL: int = int(os.getenv("ML_MODEL_RELOAD_INTERVAL", "30"))  # giây
+    ML_MODEL_RETENTION: int = int(os.getenv("ML_MODEL_RETENTION", "5"))  # số artifact mô hình được giữ lại
+    ML_TRAINING_WORKERS: int = int(os.getenv("ML_TRAINING_WORKERS", "1"))
+    TRAINING_JOB_HEARTBEAT_INTERVAL: int = int(os.getenv("TRAINING_JOB_HEARTBEAT_INTERVAL", "30"))  # giây
+    TRAINING_JOB_STALE_AFTER: int = int(os.getenv("TRAINING_JOB_STALE_AFTER", "180"))  # giây
+    TRAINING_JOB_RETRY_AFTER: int = int(os.getenv("TRAINING_JOB_RETRY_AFTER", "60"))  # giây
+    ML_SEARCH_STRATEGY: str = os.getenv("ML_SEARCH_STRATEGY", "grid")  # grid | random | halving
+    ML_SEARCH_BUDGET: int = int(os.getenv("ML_SEARCH_BUDGET", "20"))
+    ML_SEARCH_WARM_START: bool = os.getenv("ML_SEARCH_WARM_START", "False").lower() == "true"
+    ML_PREDICTION_CACHE_SIZE: int = int(os.getenv("ML_PREDICTION_CACHE_SIZE", "10000"))
+    ML_PREDICTION_CACHE_TTL: int = int(os.getenv("ML_PREDICTION_CACHE_TTL", "3600"))  # giây
+    CLASS_ANALYTICS_MAX_AGE: int = int(os.getenv("CLASS_ANALYTICS_MAX_AGE", "900"))  # giây
+    DASHBOARD_CACHE_SIZE: int = int(os.getenv("DASHBOARD_CACHE_SIZE", "5000"))
+    DASHBOARD_CACHE_TTL: int = int(os.getenv("DASHBOARD_CACHE_TTL", "60"))  # giây
+    CAMPUS_ROLLUP_RECOMPUTE_INTERVAL: int = int(os.getenv("CAMPUS_ROLLUP_RECOMPUTE_INTERVAL", "3600"))  # giây, 0 để tắt
+
     # Cấu hình CORS
     CORS_ORIGINS: List[AnyHttpUrl] = []
     
@@ -1,56 +1,115 @@
 from typing import List, Optional, Dict, Any
 from datetime import date, datetime, timedelta
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, and_, or_
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, and_, or_, select, case, update, insert
 from fastapi import HTTPException, status
 
-from app.models.models import Student
+from app.models.models import Student, Class, User
 from app.models.attendance import Attendance
 from app.schemas.attendance import AttendanceCreate, AttendanceUpdate
+from app.crud.base import upsert_statement
+from app.crud.student_feature import sync_student_features
+from app.services.campus_rollups import ROLLUPS_APPLIED, apply_attendance_changes
 
 def get_attendance(db: Session, attendance_id: int) -> Optional[Attendance]:
     return db.query(Attendance).filter(Attendance.attendance_id == attendance_id).first()
 
-def get_attendance_records(
-    db: Session, 
-    skip: int = 0, 
-    limit: int = 100,
+# Quan hệ mà student_name/class_name của AttendanceResponse đọc tới, nạp trước cho async session
+ATTENDANCE_RESPONSE_OPTIONS = [
+    selectinload(Attendance.student).selectinload(Student.user),
+    selectinload(Attendance.class_obj)
+]
+
+def _attendance_filters(
     student_id: Optional[int] = None,
     class_id: Optional[int] = None,
     date: Optional[date] = None,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    status: Optional[str] = None,
-    include_details: bool = False
-) -> List[Attendance]:
+    status: Optional[str] = None
+) -> list:
     """
-    Lấy danh sách bản ghi điểm danh với các bộ lọc.
-    Nếu include_details=True, sẽ tự động bao gồm student_name và class_name trong kết quả.
+    Điều kiện lọc dùng chung cho bản đồng bộ và async của get_attendance_records
     """
-    query = db.query(Attendance)
+    conditions = []
     
     # Only apply filters if they have valid values
     if student_id is not None and student_id != "":
-        query = query.filter(Attendance.student_id == student_id)
+        conditions.append(Attendance.student_id == student_id)
     
     if class_id is not None and class_id != "":
-        query = query.filter(Attendance.class_id == class_id)
+        conditions.append(Attendance.class_id == class_id)
     
     # Specific date filter has priority over date range
     if date and date != "":
-        query = query.filter(Attendance.date == date)
+        conditions.append(Attendance.date == date)
     else:
         if start_date and start_date != "":
-            query = query.filter(Attendance.date >= start_date)
+            conditions.append(Attendance.date >= start_date)
             
         if end_date and end_date != "":
-            query = query.filter(Attendance.date <= end_date)
+            conditions.append(Attendance.date <= end_date)
         
     if status and status != "":
-        query = query.filter(Attendance.status == status)
+        conditions.append(Attendance.status == status)
     
+    return conditions
+
+def get_attendance_records(
+    db: Session, 
+    skip: int = 0, 
+    limit: int = 100,
+    student_id: Optional[int] = None,
+    class_id: Optional[int] = None,
+    date: Optional[date] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    status: Optional[str] = None,
+    include_details: bool = False
+) -> List[Attendance]:
+    """
+    Lấy danh sách bản ghi điểm danh với các bộ lọc.
+    Nếu include_details=True, sẽ tự động bao gồm student_name và class_name trong kết quả.
+    """
+    query = db.query(Attendance).filter(
+        *_attendance_filters(student_id, class_id, date, start_date, end_date, status)
+    )
+    if include_details:
+        query = query.options(*ATTENDANCE_RESPONSE_OPTIONS)
     return query.order_by(Attendance.date.desc(), Attendance.student_id).offset(skip).limit(limit).all()
 
+async def get_attendance_async(db: AsyncSession, attendance_id: int) -> Optional[Attendance]:
+    result = await db.execute(
+        select(Attendance).options(*ATTENDANCE_RESPONSE_OPTIONS).filter(Attendance.attendance_id == attendance_id)
+    )
+    return result.scalars().first()
+
+async def get_attendance_records_async(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    student_id: Optional[int] = None,
+    class_id: Optional[int] = None,
+    date: Optional[date] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    status: Optional[str] = None
+) -> List[Attendance]:
+    """
+    Bản async của get_attendance_records, nạp sẵn sinh viên và lớp học cho response
+    """
+    statement = (
+        select(Attendance)
+        .options(*ATTENDANCE_RESPONSE_OPTIONS)
+        .filter(*_attendance_filters(student_id, class_id, date, start_date, end_date, status))
+        .order_by(Attendance.date.desc(), Attendance.student_id)
+        .offset(skip)
+        .limit(limit)
+    )
+    result = await db.execute(statement)
+    return list(result.scalars().all())
+
 def create_attendance(db: Session, attendance: AttendanceCreate) -> Attendance:
     # Check if attendance record already exists for this student-class-date combination
     existing = (db.query(Attendance)
@@ -69,6 +128,7 @@ def create_attendance(db: Session, attendance: AttendanceCreate) -> Attendance:
     db_attendance = Attendance(**attendance.dict())
     
     db.add(db_attendance)
+    sync_student_features(db, [attendance.student_id])
     db.commit()
     db.refresh(db_attendance)
     
@@ -94,6 +154,7 @@ def update_attendance(db: Session, attendance_id: int, attendance: AttendanceUpd
     for key, value in update_data.items():
         setattr(db_attendance, key, value)
     
+    sync_student_features(db, [db_attendance.student_id])
     db.commit()
     db.refresh(db_attendance)
     
@@ -116,6 +177,7 @@ def delete_attendance(db: Session, attendance_id: int) -> Attendance:
     status = db_attendance.status
     
     db.delete(db_attendance)
+    sync_student_features(db, [student_id])
     db.commit()
     
     # If deleted record was present or absent, update attendance rate
@@ -129,124 +191,213 @@ def update_student_attendance_rate(db: Session, student_id: int) -> None:
     Update the attendance rate for a student based on their attendance records.
     Formula: (present / (present + absent)) * 100
     """
-    present_count = db.query(func.count(Attendance.attendance_id)).filter(
-        Attendance.student_id == student_id,
-        Attendance.status == 'present'
-    ).scalar() or 0
-    
-    absent_count = db.query(func.count(Attendance.attendance_id)).filter(
-        Attendance.student_id == student_id,
-        Attendance.status == 'absent'
-    ).scalar() or 0
-    
-    total_count = present_count + absent_count
-    
-    # Calculate attendance rate (default to 100% if no records)
-    attendance_rate = 100.0
-    if total_count > 0:
-        attendance_rate = (present_count / total_count) * 100.0
-    
-    # Update student record
-    student = db.query(Student).filter(Student.student_id == student_id).first()
-    if student:
-        student.attendance_rate = attendance_rate
-        db.commit()
+    update_students_attendance_rate(db, [student_id])
+    db.commit()
+
+def update_students_attendance_rate(db: Session, student_ids: List[int]) -> None:
+    """
+    Recompute the attendance rate of several students with one grouped UPDATE
+    (100% when a student has no present/absent records). Only executes; the caller commits.
+    """
+    ids = sorted({student_id for student_id in student_ids if student_id is not None})
+    if not ids:
+        return
+    
+    present_count = func.sum(case((Attendance.status == 'present', 1), else_=0))
+    counted = func.sum(case((Attendance.status.in_(['present', 'absent']), 1), else_=0))
+    attendance_rate = (
+        select(func.coalesce(present_count * 100.0 / func.nullif(counted, 0), 100.0))
+        .where(Attendance.student_id == Student.student_id)
+        .scalar_subquery()
+    )
+    
+    db.execute(
+        update(Student)
+        .where(Student.student_id.in_(ids))
+        .values(attendance_rate=attendance_rate)
+        .execution_options(synchronize_session=False, **{ROLLUPS_APPLIED: True})
+    )
+    # The bulk UPDATE skips the identity map, reload rates on next access
+    for student in db.identity_map.values():
+        if isinstance(student, Student) and student.student_id in ids:
+            db.expire(student, ['attendance_rate'])
+
+ATTENDANCE_STATUSES = ['present', 'absent', 'late', 'excused']
+
+def _status_count_columns() -> list:
+    """
+    Total and per-status counts computed in one pass with conditional aggregation
+    """
+    return [func.count(Attendance.attendance_id).label("total_classes")] + [
+        func.sum(case((Attendance.status == attendance_status, 1), else_=0)).label(f"{attendance_status}_count")
+        for attendance_status in ATTENDANCE_STATUSES
+    ]
+
+def _status_counts(row: Any) -> Dict[str, Any]:
+    counts = {"total_classes": int(row.total_classes or 0)}
+    for attendance_status in ATTENDANCE_STATUSES:
+        counts[f"{attendance_status}_count"] = int(getattr(row, f"{attendance_status}_count") or 0)
+    return _with_attendance_rate(counts)
+
+def _with_attendance_rate(counts: Dict[str, Any]) -> Dict[str, Any]:
+    # Same formula as update_student_attendance_rate: present / (present + absent)
+    total_for_rate = counts["present_count"] + counts["absent_count"]
+    counts["attendance_rate"] = (counts["present_count"] / total_for_rate) * 100.0 if total_for_rate > 0 else 100.0
+    return counts
 
 def get_student_attendance_summary(db: Session, student_id: int) -> Dict[str, Any]:
     """
     Get a summary of attendance for a specific student
     """
-    # Count total classes
-    total_classes = db.query(func.count(Attendance.attendance_id)).filter(
-        Attendance.student_id == student_id
-    ).scalar() or 0
-    
-    # Count by status
-    present_count = db.query(func.count(Attendance.attendance_id)).filter(
-        Attendance.student_id == student_id,
-        Attendance.status == 'present'
-    ).scalar() or 0
-    
-    absent_count = db.query(func.count(Attendance.attendance_id)).filter(
-        Attendance.student_id == student_id,
-        Attendance.status == 'absent'
-    ).scalar() or 0
-    
-    late_count = db.query(func.count(Attendance.attendance_id)).filter(
-        Attendance.student_id == student_id,
-        Attendance.status == 'late'
-    ).scalar() or 0
-    
-    excused_count = db.query(func.count(Attendance.attendance_id)).filter(
-        Attendance.student_id == student_id,
-        Attendance.status == 'excused'
-    ).scalar() or 0
-    
-    # Calculate attendance rate
-    attendance_rate = 100.0
-    total_for_rate = present_count + absent_count
-    if total_for_rate > 0:
-        attendance_rate = (present_count / total_for_rate) * 100.0
+    row = db.query(*_status_count_columns()).filter(Attendance.student_id == student_id).one()
+    return {"student_id": student_id, **_status_counts(row)}
+
+def get_attendance_report(
+    db: Session,
+    class_id: Optional[int] = None,
+    student_ids: Optional[List[int]] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    teacher_id: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Attendance counts per student and per week for a class and/or date range.
+    Two grouped queries regardless of the number of students; totals are summed from the student rows.
+    teacher_id restricts the report to the classes of that teacher.
+    """
+    conditions = _attendance_filters(class_id=class_id, start_date=start_date, end_date=end_date)
+    if student_ids:
+        conditions.append(Attendance.student_id.in_(student_ids))
+    if teacher_id is not None:
+        conditions.append(Attendance.class_id.in_(select(Class.class_id).where(Class.teacher_id == teacher_id)))
+    
+    student_rows = db.query(
+        Attendance.student_id, Student.student_code, User.full_name, *_status_count_columns()
+    ).join(
+        Student, Student.student_id == Attendance.student_id
+    ).outerjoin(
+        User, User.user_id == Student.user_id
+    ).filter(*conditions).group_by(
+        Attendance.student_id, Student.student_code, User.full_name
+    ).order_by(Student.student_code).all()
+    
+    students = [
+        {
+            "student_id": row.student_id,
+            "student_code": row.student_code,
+            "student_name": row.full_name,
+            **_status_counts(row)
+        }
+        for row in student_rows
+    ]
+    
+    totals = {"total_classes": 0, **{f"{attendance_status}_count": 0 for attendance_status in ATTENDANCE_STATUSES}}
+    for student in students:
+        for key in totals:
+            totals[key] += student[key]
+    
+    # Group by day in SQL (portable across MySQL/SQLite), fold the days into Monday-based weeks
+    weeks: Dict[date, Dict[str, Any]] = {}
+    for row in db.query(Attendance.date, *_status_count_columns()).filter(*conditions).group_by(Attendance.date).all():
+        week_start = row.date - timedelta(days=row.date.weekday())
+        week = weeks.setdefault(week_start, {
+            "week_start": week_start,
+            "week_end": week_start + timedelta(days=6),
+            "total_classes": 0,
+            **{f"{attendance_status}_count": 0 for attendance_status in ATTENDANCE_STATUSES}
+        })
+        for key, value in _status_counts(row).items():
+            if key != "attendance_rate":
+                week[key] += value
     
     return {
-        "student_id": student_id,
-        "total_classes": total_classes,
-        "present_count": present_count,
-        "absent_count": absent_count,
-        "late_count": late_count,
-        "excused_count": excused_count,
-        "attendance_rate": attendance_rate
+        "class_id": class_id,
+        "start_date": start_date,
+        "end_date": end_date,
+        "totals": _with_attendance_rate(totals),
+        "students": students,
+        "weeks": [_with_attendance_rate(weeks[week_start]) for week_start in sorted(weeks)]
     }
 
 def bulk_create_attendance(db: Session, class_id: int, date: date, records: List[Dict[str, Any]]) -> List[Attendance]:
     """
-    Create multiple attendance records for a class on a specific date
+    Create or update the attendance of a class on a specific date.
+    Existing (student, class, date) rows are read in one query and everything is written with a single
+    multi-row upsert; attendance rates of the affected students are recomputed with one grouped UPDATE.
     """
-    attendance_records = []
-    
+    # The last record wins when a student is listed twice
+    records_by_student = {}
     for record in records:
         student_id = record.get("student_id")
-        status = record.get("status", "present")
-        minutes_late = record.get("minutes_late", 0)
-        notes = record.get("notes")
-        
-        # Check if record already exists
-        existing = (db.query(Attendance)
-                    .filter(Attendance.student_id == student_id)
-                    .filter(Attendance.class_id == class_id)
-                    .filter(Attendance.date == date)
-                    .first())
-        
-        if existing:
-            # Update existing record
-            for key, value in record.items():
-                if key != "student_id":
-                    setattr(existing, key, value)
-            
-            attendance_records.append(existing)
-        else:
-            # Create new record
-            db_attendance = Attendance(
-                student_id=student_id,
-                class_id=class_id,
-                date=date,
-                status=status,
-                minutes_late=minutes_late,
-                notes=notes
+        if student_id is not None:
+            records_by_student[student_id] = record
+    if not records_by_student:
+        return []
+    student_ids = list(records_by_student)
+    
+    existing = {
+        row.student_id: row
+        for row in db.query(
+            Attendance.student_id, Attendance.status, Attendance.minutes_late, Attendance.notes
+        ).filter(
+            Attendance.class_id == class_id,
+            Attendance.date == date,
+            Attendance.student_id.in_(student_ids)
+        ).all()
+    }
+    
+    # Existing records keep the fields the request does not send
+    rows = []
+    for student_id, record in records_by_student.items():
+        current = existing.get(student_id)
+        defaults = {
+            "status": current.status if current else "present",
+            "minutes_late": current.minutes_late if current else 0,
+            "notes": current.notes if current else None
+        }
+        rows.append({
+            "student_id": student_id,
+            "class_id": class_id,
+            "date": date,
+            **{key: record.get(key, value) for key, value in defaults.items()}
+        })
+    
+    statement = upsert_statement(
+        db, Attendance, rows,
+        conflict_columns=["student_id", "class_id", "date"],
+        update_columns=["status", "minutes_late", "notes"],
+        extra_updates={"updated_at": func.now()}
+    )
+    if statement is not None:
+        db.execute(statement.execution_options(**{ROLLUPS_APPLIED: True}))
+    else:
+        new_rows = [row for row in rows if row["student_id"] not in existing]
+        changed_rows = [row for row in rows if row["student_id"] in existing]
+        if new_rows:
+            db.execute(insert(Attendance).execution_options(**{ROLLUPS_APPLIED: True}), new_rows)
+        for row in changed_rows:
+            db.query(Attendance).filter(
+                Attendance.student_id == row["student_id"],
+                Attendance.class_id == class_id,
+                Attendance.date == date
+            ).execution_options(**{ROLLUPS_APPLIED: True}).update(
+                {"status": row["status"], "minutes_late": row["minutes_late"], "notes": row["notes"]},
+                synchronize_session=False
             )
-            
-            db.add(db_attendance)
-            attendance_records.append(db_attendance)
     
+    apply_attendance_changes(db, class_id, [
+        (existing[row["student_id"]].status if row["student_id"] in existing else None, row["status"])
+        for row in rows
+    ])
+    update_students_attendance_rate(db, student_ids)
+    sync_student_features(db, student_ids)
     db.commit()
     
-    # Update attendance rates for all affected students
-    student_ids = set(record.get("student_id") for record in records)
-    for student_id in student_ids:
-        update_student_attendance_rate(db, student_id)
-    
-    # Refresh all records to get their IDs
-    for record in attendance_records:
-        db.refresh(record)
-    
-    return attendance_records
+    return db.query(Attendance).options(
+        joinedload(Attendance.student).joinedload(Student.user),
+        joinedload(Attendance.class_obj)
+    ).filter(
+        Attendance.class_id == class_id,
+        Attendance.date == date,
+        Attendance.student_id.in_(student_ids)
+    ).order_by(Attendance.student_id).populate_existing().all()
@@ -1,9 +1,25 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from decimal import Decimal
 from typing import List, Optional, Dict, Any, Tuple, Type, TypeVar, Generic, Union
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, func
+from sqlalchemy.orm import Session, QueryableAttribute
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import or_, and_, func, select, inspect, event, insert, text
 from pydantic import BaseModel
 from fastapi import HTTPException, status
+from app.core.config import settings
 from app.schemas.schemas import PaginationParams, SearchParams
+from app.utils.cache import TTLCache
+
+# Count caches of every CRUDBase instance by table name, cleared when a session commits writes to the table
+_count_caches: Dict[Optional[str], List[TTLCache]] = {}
+
+# Sort marker of cursors over an externally ranked id list
+RANKED_CURSOR_SORT = "~rank"
+# Ranked ids per IN list when counting the rows that match the filters
+RANKED_COUNT_CHUNK_SIZE = 500
 
 # Define a generic type for SQLAlchemy models
 ModelType = TypeVar("ModelType")
@@ -15,6 +31,9 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
     """
     Base class for CRUD operations with pagination and search
     """
+    # Columns (besides the primary key) that keyset pagination may sort by
+    sortable_fields: List[str] = []
+    
     def __init__(self, model: Type[ModelType]):
         """
         Initialization with SQLAlchemy model
@@ -23,6 +42,9 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             model: The SQLAlchemy model class
         """
         self.model = model
+        # Totals per search/filter combination, so paging does not re-count every request
+        self._count_cache = TTLCache(maxsize=256, ttl=settings.PAGINATION_COUNT_CACHE_TTL)
+        _count_caches.setdefault(getattr(model, "__tablename__", None), []).append(self._count_cache)
     
     def get(self, db: Session, id: Any) -> Optional[ModelType]:
         """
@@ -40,17 +62,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         """
         Get multiple records with optional filters
         """
-        query = db.query(self.model)
-        
-        # Apply filters if provided
-        if filters:
-            for field, value in filters.items():
-                if hasattr(self.model, field) and value is not None:
-                    if isinstance(value, list):
-                        query = query.filter(getattr(self.model, field).in_(value))
-                    else:
-                        query = query.filter(getattr(self.model, field) == value)
-                        
+        query = self._apply_filters(db.query(self.model), filters)
         return query.offset(skip).limit(limit).all()
     
     def get_paginated(
@@ -74,25 +86,388 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         Returns:
             Tuple containing list of records and total count
         """
-        query = db.query(self.model)
+        query = self._apply_search(db.query(self.model), search, search_fields)
+        query = self._apply_filters(query, filters)
+        
+        # Get total count
+        total = query.count()
+        
+        # Apply pagination
+        offset = (pagination.page - 1) * pagination.size
+        query = query.offset(offset).limit(pagination.size)
+        
+        # Execute query
+        items = query.all()
+        
+        return items, total
+    
+    async def get_multi_async(
+        self,
+        db: AsyncSession,
+        skip: int = 0,
+        limit: int = 100,
+        filters: Optional[Dict[str, Any]] = None,
+        options: Optional[List[Any]] = None
+    ) -> List[ModelType]:
+        """
+        Async variant of get_multi. Relationships read by the response must be
+        eager loaded through `options`, an AsyncSession cannot lazy load them.
+        """
+        statement = self._apply_filters(select(self.model), filters)
+        if options:
+            statement = statement.options(*options)
+        result = await db.execute(statement.offset(skip).limit(limit))
+        return list(result.scalars().all())
+    
+    async def get_paginated_async(
+        self,
+        db: AsyncSession,
+        pagination: PaginationParams,
+        search: Optional[SearchParams] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        search_fields: Optional[List[str]] = None,
+        options: Optional[List[Any]] = None
+    ) -> Tuple[List[ModelType], int]:
+        """
+        Async variant of get_paginated
+        """
+        statement = self._apply_search(select(self.model), search, search_fields)
+        statement = self._apply_filters(statement, filters)
+        
+        # Get total count
+        count_statement = select(func.count()).select_from(statement.subquery())
+        total = (await db.execute(count_statement)).scalar_one()
+        
+        # Apply pagination
+        offset = (pagination.page - 1) * pagination.size
+        if options:
+            statement = statement.options(*options)
+        result = await db.execute(statement.offset(offset).limit(pagination.size))
+        
+        return list(result.scalars().all()), total
+    
+    def get_page(
+        self,
+        db: Session,
+        size: int,
+        cursor: Optional[str] = None,
+        sort: Optional[str] = None,
+        offset: int = 0,
+        search: Optional[SearchParams] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        search_fields: Optional[List[str]] = None,
+        include_total: bool = False
+    ) -> Tuple[List[ModelType], Optional[int], Optional[str]]:
+        """
+        Keyset (cursor) pagination ordered by `sort` and the primary key
+        
+        Without a cursor the page starts at `offset`; with a cursor it seeks past
+        the last row of the previous page, so every following page costs the same
+        as the first one.
+        
+        Args:
+            db: Database session
+            size: Number of items per page
+            cursor: Opaque cursor returned as next_cursor by the previous page
+            sort: Field to sort by, prefixed with "-" for descending order
+            offset: Rows to skip when no cursor is given
+            search: Search parameters
+            filters: Dictionary of filters to apply
+            search_fields: List of fields to search in
+            include_total: Also return the (cached) total count
+            
+        Returns:
+            Tuple containing the items, the total count (None unless requested)
+            and the cursor of the next page (None on the last page)
+        """
+        query = self._apply_search(db.query(self.model), search, search_fields)
+        query = self._apply_filters(query, filters)
+        
+        total = None
+        if include_total:
+            key = self._count_key(search, filters)
+            total = self._count_cache.get(key)
+            if total is None:
+                total = query.count()
+                self._count_cache.set(key, total)
+        
+        query = self._apply_keyset(query, sort, cursor)
+        if cursor is None and offset:
+            query = query.offset(offset)
+        items = query.limit(size + 1).all()
+        
+        return self._finish_page(items, size, sort, total)
+    
+    async def get_page_async(
+        self,
+        db: AsyncSession,
+        size: int,
+        cursor: Optional[str] = None,
+        sort: Optional[str] = None,
+        offset: int = 0,
+        search: Optional[SearchParams] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        search_fields: Optional[List[str]] = None,
+        include_total: bool = False,
+        options: Optional[List[Any]] = None
+    ) -> Tuple[List[ModelType], Optional[int], Optional[str]]:
+        """
+        Async variant of get_page
+        """
+        statement = self._apply_search(select(self.model), search, search_fields)
+        statement = self._apply_filters(statement, filters)
+        
+        total = None
+        if include_total:
+            key = self._count_key(search, filters)
+            total = self._count_cache.get(key)
+            if total is None:
+                count_statement = select(func.count()).select_from(statement.subquery())
+                total = (await db.execute(count_statement)).scalar_one()
+                self._count_cache.set(key, total)
+        
+        statement = self._apply_keyset(statement, sort, cursor)
+        if cursor is None and offset:
+            statement = statement.offset(offset)
+        if options:
+            statement = statement.options(*options)
+        result = await db.execute(statement.limit(size + 1))
+        
+        return self._finish_page(list(result.scalars().all()), size, sort, total)
+    
+    async def get_ranked_page_async(
+        self,
+        db: AsyncSession,
+        ranked_ids: List[Any],
+        size: int,
+        cursor: Optional[str] = None,
+        offset: int = 0,
+        search: Optional[SearchParams] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        include_total: bool = False,
+        options: Optional[List[Any]] = None
+    ) -> Tuple[List[ModelType], Optional[int], Optional[str]]:
+        """
+        Paginate over primary keys already ranked elsewhere (e.g. by the search index), keeping their order
         
-        # Apply search if provided
+        Only the ids of the requested page are sent to the database, in chunks that
+        grow while filters keep rejecting rows, so the IN list stays bounded.
+        
+        Args:
+            db: Database session
+            ranked_ids: Primary keys in ranking order
+            size: Number of items per page
+            cursor: Opaque cursor returned as next_cursor by the previous page
+            offset: Number of matching rows to skip when no cursor is given
+            search: Search that produced ranked_ids, used as the count cache key
+            filters: Dictionary of filters to apply
+            include_total: Also return the (cached) number of ranked rows matching the filters
+            options: Loader options for the returned rows
+            
+        Returns:
+            Tuple containing the items, the total count (None unless requested)
+            and the cursor of the next page (None on the last page)
+        """
+        primary_key = self._primary_key()
+        position = self._decode_rank_cursor(cursor) if cursor is not None else 0
+        skip = offset if cursor is None else 0
+        
+        total = None
+        if include_total and not filters:
+            total = len(ranked_ids)
+        elif include_total:
+            key = (RANKED_CURSOR_SORT, self._count_key(search, filters))
+            total = self._count_cache.get(key)
+            if total is None:
+                # Counted over bounded chunks of the ranked ids
+                total = 0
+                for start in range(0, len(ranked_ids), RANKED_COUNT_CHUNK_SIZE):
+                    chunk = ranked_ids[start:start + RANKED_COUNT_CHUNK_SIZE]
+                    statement = self._apply_filters(select(self.model).filter(primary_key.in_(chunk)), filters)
+                    count_statement = select(func.count()).select_from(statement.subquery())
+                    total += (await db.execute(count_statement)).scalar_one()
+                self._count_cache.set(key, total)
+        
+        # One extra row is fetched to know whether a next page exists
+        items, positions = [], []
+        chunk_size = skip + size + 1
+        while position < len(ranked_ids) and len(items) <= skip + size:
+            chunk = ranked_ids[position:position + chunk_size]
+            statement = self._apply_filters(select(self.model).filter(primary_key.in_(chunk)), filters)
+            if options:
+                statement = statement.options(*options)
+            rows = {getattr(row, primary_key.key): row for row in (await db.execute(statement)).scalars()}
+            for index, item_id in enumerate(chunk, start=position):
+                if item_id in rows:
+                    items.append(rows[item_id])
+                    positions.append(index)
+            position += len(chunk)
+            chunk_size *= 2
+        
+        items, positions = items[skip:], positions[skip:]
+        next_cursor = None
+        if len(items) > size:
+            next_cursor = self._encode_rank_cursor(positions[size - 1] + 1)
+        return items[:size], total, next_cursor
+    
+    def _primary_key(self):
+        return getattr(self.model, inspect(self.model).primary_key[0].key)
+    
+    def _resolve_sort(self, sort: Optional[str]):
+        """
+        Return the sort column and direction for a sort spec such as "-student_code"
+        """
+        primary_key = self._primary_key()
+        if not sort:
+            return primary_key, False
+        descending = sort.startswith("-")
+        field = sort.lstrip("-")
+        if field != primary_key.key and field not in self.sortable_fields:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Cannot sort by '{field}'"
+            )
+        return getattr(self.model, field), descending
+    
+    def _apply_keyset(self, query, sort: Optional[str], cursor: Optional[str]):
+        """
+        Order a Query or select() statement by (sort column, primary key) and seek past the cursor
+        """
+        column, descending = self._resolve_sort(sort)
+        primary_key = self._primary_key()
+        
+        if cursor is not None:
+            value, last_id = self._decode_cursor(cursor, sort, column)
+            after_id = primary_key < last_id if descending else primary_key > last_id
+            if column is primary_key:
+                condition = after_id
+            elif value is None:
+                # NULLs sort first in ascending order (MySQL), last in descending order
+                condition = and_(column.is_(None), after_id)
+                if not descending:
+                    condition = or_(condition, column.isnot(None))
+            else:
+                after_value = column < value if descending else column > value
+                condition = or_(after_value, and_(column == value, after_id))
+                if descending:
+                    condition = or_(condition, column.is_(None))
+            query = query.filter(condition)
+        
+        order = [column.desc() if descending else column.asc()]
+        if column is not primary_key:
+            order.append(primary_key.desc() if descending else primary_key.asc())
+        return query.order_by(*order)
+    
+    def _finish_page(self, items: List[ModelType], size: int, sort: Optional[str], total: Optional[int]):
+        # One extra row was fetched to know whether a next page exists
+        next_cursor = None
+        if len(items) > size:
+            items = items[:size]
+            next_cursor = self._encode_cursor(items[-1], sort)
+        return items, total, next_cursor
+    
+    def _encode_cursor(self, item: ModelType, sort: Optional[str]) -> str:
+        column, _ = self._resolve_sort(sort)
+        value = getattr(item, column.key)
+        if isinstance(value, (date, datetime)):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = str(value)
+        payload = {"s": sort or "", "v": value, "id": getattr(item, self._primary_key().key)}
+        raw = json.dumps(payload, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+    
+    def _decode_cursor(self, cursor: str, sort: Optional[str], column) -> Tuple[Any, Any]:
+        invalid_cursor = HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            payload = json.loads(raw)
+            value, last_id = payload["v"], payload["id"]
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise invalid_cursor
+        # A cursor is only valid for the sort order that produced it
+        if payload.get("s") != (sort or ""):
+            raise invalid_cursor
+        
+        if value is not None:
+            try:
+                python_type = column.type.python_type
+            except NotImplementedError:
+                python_type = None
+            try:
+                if python_type is datetime:
+                    value = datetime.fromisoformat(value)
+                elif python_type is date:
+                    value = date.fromisoformat(value)
+                elif python_type is Decimal:
+                    value = Decimal(value)
+            except (ValueError, TypeError, ArithmeticError):
+                raise invalid_cursor
+        return value, last_id
+    
+    def _encode_rank_cursor(self, position: int) -> str:
+        raw = json.dumps({"s": RANKED_CURSOR_SORT, "pos": position}, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+    
+    def _decode_rank_cursor(self, cursor: str) -> int:
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            payload = json.loads(raw)
+            position = payload["pos"]
+            sort = payload.get("s")
+        except (binascii.Error, ValueError, TypeError, KeyError, AttributeError):
+            position, sort = None, None
+        if sort != RANKED_CURSOR_SORT or not isinstance(position, int) or position < 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid pagination cursor"
+            )
+        return position
+    
+    def _count_key(self, search: Optional[SearchParams], filters: Optional[Dict[str, Any]]):
+        filter_items = tuple(sorted(
+            (field, tuple(value) if isinstance(value, list) else value)
+            for field, value in (filters or {}).items()
+            if value is not None
+        ))
+        if search and search.query:
+            return (search.query, search.field, filter_items)
+        return (None, None, filter_items)
+    
+    def _apply_search(self, query, search: Optional[SearchParams], search_fields: Optional[List[str]]):
+        """
+        Apply a search to a Query or a select() statement
+        """
         if search and search.query:
             search_term = f"%{search.query}%"
             if search.field:
                 # Search in specific field
-                if hasattr(self.model, search.field):
-                    query = query.filter(getattr(self.model, search.field).ilike(search_term))
+                if self._column(search.field) is not None:
+                    query = query.filter(self._column(search.field).ilike(search_term))
             elif search_fields:
                 # Search in provided fields
                 search_conditions = []
                 for field in search_fields:
-                    if hasattr(self.model, field):
-                        search_conditions.append(getattr(self.model, field).ilike(search_term))
+                    if self._column(field) is not None:
+                        search_conditions.append(self._column(field).ilike(search_term))
                 if search_conditions:
                     query = query.filter(or_(*search_conditions))
-        
-        # Apply filters if provided
+        return query
+    
+    def _column(self, field: str):
+        """
+        Mapped attribute for a field name, None for plain class attributes
+        """
+        attribute = getattr(self.model, field, None)
+        return attribute if isinstance(attribute, QueryableAttribute) else None
+    
+    def _apply_filters(self, query, filters: Optional[Dict[str, Any]]):
+        """
+        Apply equality / IN filters to a Query or a select() statement
+        """
         if filters:
             for field, value in filters.items():
                 if hasattr(self.model, field) and value is not None:
@@ -100,18 +475,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
                         query = query.filter(getattr(self.model, field).in_(value))
                     else:
                         query = query.filter(getattr(self.model, field) == value)
-        
-        # Get total count
-        total = query.count()
-        
-        # Apply pagination
-        offset = (pagination.page - 1) * pagination.size
-        query = query.offset(offset).limit(pagination.size)
-        
-        # Execute query
-        items = query.all()
-        
-        return items, total
+        return query
     
     def create(self, db: Session, obj_in: CreateSchemaType) -> ModelType:
         """
@@ -122,6 +486,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         db.add(db_obj)
         db.commit()
         db.refresh(db_obj)
+        self._count_cache.clear()
         return db_obj
     
     def update(
@@ -156,4 +521,113 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         obj = db.query(self.model).get(id)
         db.delete(obj)
         db.commit()
+        self._count_cache.clear()
         return obj
+
+
+def _track_count_tables(session: Session, tables) -> None:
+    changed = {name for name in tables if name in _count_caches}
+    if changed:
+        session.info.setdefault("pagination_changed_tables", set()).update(changed)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_flushed_count_tables(session, flush_context):
+    # Updates are tracked too: they can move rows in or out of a filtered total
+    _track_count_tables(session, {
+        getattr(obj, "__tablename__", None)
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+    })
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_count_tables(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            _track_count_tables(orm_execute_state.session, {mapper.local_table.name})
+
+
+@event.listens_for(Session, "after_commit")
+def _clear_counts_after_commit(session):
+    for table in session.info.pop("pagination_changed_tables", ()):
+        for cache in _count_caches.get(table, ()):
+            cache.clear()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_counts_after_rollback(session, previous_transaction):
+    session.info.pop("pagination_changed_tables", None)
+
+
+def upsert_statement(
+    db: Session,
+    model: Type[ModelType],
+    rows: List[Dict[str, Any]],
+    conflict_columns: List[str],
+    update_columns: List[str],
+    extra_updates: Optional[Dict[str, Any]] = None
+):
+    """
+    Multi-row INSERT that updates update_columns with the incoming values when a row with the same
+    conflict_columns (a primary or unique key) exists: ON DUPLICATE KEY UPDATE on MySQL,
+    ON CONFLICT DO UPDATE on PostgreSQL/SQLite. Returns None on other dialects.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        statement = mysql_insert(model).values(rows)
+        return statement.on_duplicate_key_update(
+            **{column: statement.inserted[column] for column in update_columns},
+            **(extra_updates or {})
+        )
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        statement = dialect_insert(model).values(rows)
+        return statement.on_conflict_do_update(
+            index_elements=conflict_columns,
+            set_={
+                **{column: statement.excluded[column] for column in update_columns},
+                **(extra_updates or {})
+            }
+        )
+    return None
+
+
+def insert_returning_ids(
+    db: Session,
+    model: Type[ModelType],
+    rows: List[Dict[str, Any]],
+    execution_options: Optional[Dict[str, Any]] = None,
+    chunk_size: int = 1000
+) -> List[int]:
+    """
+    Insert rows with one statement per chunk and return their autoincrement primary keys in input order.
+    
+    MySQL/SQLite: each chunk is one multi-row INSERT. InnoDB allocates the ids of a single simple INSERT
+    as one consecutive block (step auto_increment_increment) starting at LAST_INSERT_ID(); SQLite holds
+    the write lock for the statement and numbers the rows up to lastrowid. No other writer's row can
+    fall inside the range. Other dialects use INSERT ... RETURNING sorted by parameter order.
+    """
+    if not rows:
+        return []
+    primary_key = inspect(model).primary_key[0]
+    statement = insert(model).execution_options(**(execution_options or {}))
+    dialect = db.get_bind().dialect.name
+    if dialect not in ("mysql", "sqlite"):
+        return list(db.scalars(statement.returning(primary_key, sort_by_parameter_order=True), rows))
+
+    step = 1
+    if dialect == "mysql":
+        step = db.execute(text("SELECT @@auto_increment_increment")).scalar() or 1
+    ids = []
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        last_id = db.execute(statement.values(chunk)).lastrowid
+        # LAST_INSERT_ID() is the first id of the statement on MySQL, lastrowid the last one on SQLite
+        first_id = last_id if dialect == "mysql" else last_id - step * (len(chunk) - 1)
+        ids.extend(range(first_id, first_id + step * len(chunk), step))
+    return ids
@@ -0,0 +1,282 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Iterable, Tuple, Set
+
+from sqlalchemy import func, select, and_
+from sqlalchemy.orm import Session
+
+from app.models.models import (
+    Student, Class, ClassStudent, Grade, DisciplinaryRecord, DropoutRisk, CampusRollup
+)
+from app.models.attendance import Attendance
+from app.services.student_feature_extractor import ID_CHUNK_SIZE
+
+SCOPE_CAMPUS = "campus"
+SCOPE_DEPARTMENT = "department"
+SCOPE_CLASS = "class"
+SCOPE_ACADEMIC_YEAR = "academic_year"
+ROLLUP_SCOPES = [SCOPE_CAMPUS, SCOPE_DEPARTMENT, SCOPE_CLASS, SCOPE_ACADEMIC_YEAR]
+CAMPUS_KEY = ""
+
+# Risk buckets use each student's latest dropout risk assessment (%)
+HIGH_RISK_THRESHOLD = 70.0
+MEDIUM_RISK_THRESHOLD = 40.0
+
+ATTENDANCE_COUNTERS = {
+    "present": "present_count",
+    "absent": "absent_count",
+    "late": "late_count",
+    "excused": "excused_count"
+}
+OPEN_DISCIPLINARY_STATUSES = ("open", "pending")
+
+ROLLUP_COUNTERS = [
+    "total_students", "total_classes",
+    "present_count", "absent_count", "late_count", "excused_count",
+    "graded_count", "gpa_sum",
+    "risk_low", "risk_medium", "risk_high",
+    "open_disciplinary"
+]
+
+ScopeKey = Tuple[str, str]
+
+
+def risk_bucket(risk_percentage: Optional[float]) -> Optional[str]:
+    if risk_percentage is None:
+        return None
+    if risk_percentage >= HIGH_RISK_THRESHOLD:
+        return "risk_high"
+    if risk_percentage >= MEDIUM_RISK_THRESHOLD:
+        return "risk_medium"
+    return "risk_low"
+
+
+def class_scopes(class_id: int, department: Optional[str], academic_year: Optional[str]) -> List[ScopeKey]:
+    """
+    Rollup rows a class contributes to (the campus row is not included).
+    """
+    scopes = [(SCOPE_CLASS, str(class_id))]
+    if department:
+        scopes.append((SCOPE_DEPARTMENT, department))
+    if academic_year:
+        scopes.append((SCOPE_ACADEMIC_YEAR, academic_year))
+    return scopes
+
+
+def get_class_scopes(db: Session, class_ids: Iterable[int]) -> Dict[int, List[ScopeKey]]:
+    ids = [class_id for class_id in set(class_ids) if class_id is not None]
+    scopes = {}
+    for start in range(0, len(ids), ID_CHUNK_SIZE):
+        for class_id, department, academic_year in db.query(
+            Class.class_id, Class.department, Class.academic_year
+        ).filter(Class.class_id.in_(ids[start:start + ID_CHUNK_SIZE])).all():
+            scopes[class_id] = class_scopes(class_id, department, academic_year)
+    return scopes
+
+
+def get_enrolled_class_ids(db: Session, student_ids: Iterable[int]) -> Dict[int, Set[int]]:
+    ids = list(set(student_ids))
+    enrolled = defaultdict(set)
+    for start in range(0, len(ids), ID_CHUNK_SIZE):
+        for student_id, class_id in db.query(ClassStudent.student_id, ClassStudent.class_id).filter(
+            ClassStudent.student_id.in_(ids[start:start + ID_CHUNK_SIZE]),
+            ClassStudent.status == 'enrolled'
+        ).all():
+            enrolled[student_id].add(class_id)
+    return enrolled
+
+
+def get_latest_risks(db: Session, student_ids: Optional[Iterable[int]] = None) -> Dict[int, Tuple[int, float]]:
+    """
+    Latest dropout risk assessment (risk_id, risk_percentage) per student.
+    """
+    def read(ids: Optional[List[int]]) -> Dict[int, Tuple[int, float]]:
+        latest = select(func.max(DropoutRisk.risk_id).label("risk_id")).group_by(DropoutRisk.student_id)
+        if ids is not None:
+            latest = latest.where(DropoutRisk.student_id.in_(ids))
+        latest = latest.subquery()
+        rows = db.query(DropoutRisk.student_id, DropoutRisk.risk_id, DropoutRisk.risk_percentage).join(
+            latest, DropoutRisk.risk_id == latest.c.risk_id
+        ).all()
+        return {student_id: (risk_id, risk_percentage) for student_id, risk_id, risk_percentage in rows}
+
+    if student_ids is None:
+        return read(None)
+    ids = list(set(student_ids))
+    risks = {}
+    for start in range(0, len(ids), ID_CHUNK_SIZE):
+        risks.update(read(ids[start:start + ID_CHUNK_SIZE]))
+    return risks
+
+
+def get_open_disciplinary_counts(db: Session, student_ids: Optional[Iterable[int]] = None) -> Dict[int, int]:
+    query = db.query(DisciplinaryRecord.student_id, func.count(DisciplinaryRecord.record_id)).filter(
+        DisciplinaryRecord.resolution_status.in_(OPEN_DISCIPLINARY_STATUSES)
+    ).group_by(DisciplinaryRecord.student_id)
+    if student_ids is None:
+        return dict(query.all())
+    ids = list(set(student_ids))
+    counts = {}
+    for start in range(0, len(ids), ID_CHUNK_SIZE):
+        counts.update(dict(query.filter(DisciplinaryRecord.student_id.in_(ids[start:start + ID_CHUNK_SIZE])).all()))
+    return counts
+
+
+def student_contribution(bucket: Optional[str], open_disciplinary: int) -> Dict[str, float]:
+    """
+    What one student adds to every rollup row they belong to.
+    """
+    contribution = {"total_students": 1, "open_disciplinary": open_disciplinary}
+    if bucket:
+        contribution[bucket] = 1
+    return contribution
+
+
+def compute_campus_rollups(db: Session) -> Dict[ScopeKey, Dict[str, float]]:
+    """
+    Compute every rollup row from raw data with grouped queries.
+    """
+    rows: Dict[ScopeKey, Dict[str, float]] = defaultdict(lambda: dict.fromkeys(ROLLUP_COUNTERS, 0))
+    campus = rows[(SCOPE_CAMPUS, CAMPUS_KEY)]
+
+    scopes_by_class = {}
+    for class_id, department, academic_year in db.query(Class.class_id, Class.department, Class.academic_year).all():
+        scopes_by_class[class_id] = class_scopes(class_id, department, academic_year)
+        campus["total_classes"] += 1
+        for scope in scopes_by_class[class_id]:
+            rows[scope]["total_classes"] += 1
+
+    def add_to_class(class_id: int, counter: str, value: float) -> None:
+        campus[counter] += value
+        for scope in scopes_by_class.get(class_id, []):
+            rows[scope][counter] += value
+
+    for class_id, attendance_status, count in db.query(
+        Attendance.class_id, Attendance.status, func.count(Attendance.attendance_id)
+    ).group_by(Attendance.class_id, Attendance.status).all():
+        counter = ATTENDANCE_COUNTERS.get(attendance_status)
+        if counter:
+            add_to_class(class_id, counter, count)
+
+    for class_id, graded, gpa_sum in db.query(
+        Grade.class_id, func.count(Grade.gpa), func.sum(Grade.gpa)
+    ).group_by(Grade.class_id).all():
+        add_to_class(class_id, "graded_count", graded or 0)
+        add_to_class(class_id, "gpa_sum", float(gpa_sum or 0))
+
+    # Student-level metrics count each student once per row they belong to
+    buckets = {student_id: risk_bucket(risk) for student_id, (_, risk) in get_latest_risks(db).items()}
+    open_counts = get_open_disciplinary_counts(db)
+    enrolled = defaultdict(set)
+    for student_id, class_id in db.query(ClassStudent.student_id, ClassStudent.class_id).filter(
+        ClassStudent.status == 'enrolled'
+    ).all():
+        enrolled[student_id].update(scopes_by_class.get(class_id, []))
+
+    for (student_id,) in db.query(Student.student_id).all():
+        contribution = student_contribution(buckets.get(student_id), open_counts.get(student_id, 0))
+        for scope in [(SCOPE_CAMPUS, CAMPUS_KEY), *enrolled.get(student_id, ())]:
+            for counter, value in contribution.items():
+                rows[scope][counter] += value
+
+    return rows
+
+
+def get_rollup_generation(db, lock: bool = False) -> Optional[int]:
+    """
+    Generation of the rollup rows (increased by every rebuild), None before the first rebuild.
+    lock=True takes a shared lock, so a rebuild that has not committed yet is waited for.
+    """
+    query = select(CampusRollup.generation).where(
+        CampusRollup.scope == SCOPE_CAMPUS, CampusRollup.scope_key == CAMPUS_KEY
+    )
+    if lock:
+        query = query.with_for_update(read=True)
+    return db.execute(query).scalar()
+
+
+def rebuild_campus_rollups(db: Session) -> int:
+    """
+    Recompute and replace all rollup rows in one transaction. Commits.
+    
+    The rollup rows (and, with InnoDB next-key locks, the gaps between them) are locked before the
+    snapshot is read, so the snapshot includes every writer committed before the rebuild got the lock.
+    Writers read the generation with a shared lock just before committing and apply their deltas
+    afterwards only to rows of that generation: a delta already included in a later rebuild is skipped.
+    """
+    db.execute(select(CampusRollup.scope, CampusRollup.scope_key).with_for_update()).all()
+    generation = (db.execute(select(func.max(CampusRollup.generation))).scalar() or 0) + 1
+    rows = compute_campus_rollups(db)
+    computed_at = datetime.now()
+    table = CampusRollup.__table__
+    db.execute(table.delete())
+    if rows:
+        db.execute(table.insert(), [
+            {"scope": scope, "scope_key": key, "computed_at": computed_at, "generation": generation, **values}
+            for (scope, key), values in rows.items()
+        ])
+    db.commit()
+    return len(rows)
+
+
+def apply_rollup_deltas(db, deltas: Dict[ScopeKey, Dict[str, float]], generation: Optional[int] = None) -> bool:
+    """
+    Add counter deltas to existing rollup rows with relative UPDATEs (safe under concurrent writers),
+    only to rows of the given generation when one is given.
+    Returns False when a row is missing (or was rebuilt since that generation).
+    """
+    table = CampusRollup.__table__
+    complete = True
+    for (scope, key), changes in deltas.items():
+        changes = {counter: value for counter, value in changes.items() if value}
+        if not changes:
+            continue
+        condition = and_(table.c.scope == scope, table.c.scope_key == key)
+        if generation is not None:
+            condition = and_(condition, table.c.generation == generation)
+        result = db.execute(
+            table.update().where(condition).values({counter: table.c[counter] + value for counter, value in changes.items()})
+        )
+        if result.rowcount == 0:
+            complete = False
+    return complete
+
+
+def get_campus_rollup(db: Session, scope: str = SCOPE_CAMPUS, scope_key: str = CAMPUS_KEY) -> Optional[CampusRollup]:
+    return db.query(CampusRollup).filter(
+        CampusRollup.scope == scope,
+        CampusRollup.scope_key == scope_key
+    ).first()
+
+
+def get_campus_rollups(db: Session, scope: Optional[str] = None) -> List[CampusRollup]:
+    query = db.query(CampusRollup)
+    if scope:
+        query = query.filter(CampusRollup.scope == scope)
+    return query.order_by(CampusRollup.scope, CampusRollup.scope_key).all()
+
+
+def rollup_to_dict(rollup: CampusRollup) -> Dict[str, object]:
+    return {
+        "scope": rollup.scope,
+        "scope_key": rollup.scope_key,
+        "total_students": rollup.total_students,
+        "total_classes": rollup.total_classes,
+        "attendance": {
+            "present": rollup.present_count,
+            "absent": rollup.absent_count,
+            "late": rollup.late_count,
+            "excused": rollup.excused_count,
+            "rate": rollup.attendance_rate
+        },
+        "average_gpa": rollup.average_gpa,
+        "graded_count": rollup.graded_count,
+        "risk_buckets": {
+            "low": rollup.risk_low,
+            "medium": rollup.risk_medium,
+            "high": rollup.risk_high
+        },
+        "open_disciplinary": rollup.open_disciplinary,
+        "computed_at": rollup.computed_at.isoformat() if rollup.computed_at else None,
+        "updated_at": rollup.updated_at.isoformat() if rollup.updated_at else None
+    }
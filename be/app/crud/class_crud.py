@@ -1,11 +1,31 @@
-from typing import List, Optional, Dict, Any, Union
-from sqlalchemy.orm import Session
+from typing import List, Optional, Dict, Any, Union, Tuple
+from sqlalchemy.orm import Session, selectinload, joinedload
+from sqlalchemy.orm.util import identity_key
+from sqlalchemy import func, select, update, insert
 from fastapi import HTTPException, status
-from app.models.models import Class, ClassStudent
+from app.models.models import Class, ClassStudent, Student, Teacher
 from app.schemas.schemas import ClassCreate, ClassUpdate
+from app.crud.base import upsert_statement
+from app.crud.student_feature import sync_student_features
+from app.services.campus_rollups import ROLLUPS_APPLIED, apply_enrollment_changes
+from app.services.student_feature_extractor import ID_CHUNK_SIZE
+from app.services.search_index import student_search_index
 
-def get_class(db: Session, class_id: int) -> Optional[Class]:
-    return db.query(Class).filter(Class.class_id == class_id).first()
+# Relationships serialized by each response model, eager loaded so that serializing a list
+# costs a fixed number of queries instead of one lazy load per row
+# ClassResponse: teacher.user
+CLASS_RESPONSE_OPTIONS = [selectinload(Class.teacher).selectinload(Teacher.user)]
+# ClassStudentResponse: student.user and class_obj.teacher.user
+CLASS_STUDENT_RESPONSE_OPTIONS = [
+    selectinload(ClassStudent.student).selectinload(Student.user),
+    selectinload(ClassStudent.class_obj).selectinload(Class.teacher).selectinload(Teacher.user)
+]
+
+def get_class(db: Session, class_id: int, options: Optional[List[Any]] = None) -> Optional[Class]:
+    query = db.query(Class)
+    if options:
+        query = query.options(*options)
+    return query.filter(Class.class_id == class_id).first()
 
 def get_classes(
     db: Session, 
@@ -17,7 +37,7 @@ def get_classes(
     semester: Optional[str] = None,
     class_filter: Optional[List[int]] = None
 ) -> List[Class]:
-    query = db.query(Class)
+    query = db.query(Class).options(*CLASS_RESPONSE_OPTIONS)
     
     if teacher_id is not None:
         query = query.filter(Class.teacher_id == teacher_id)
@@ -35,7 +55,7 @@ def get_classes(
     if class_filter:
         query = query.filter(Class.class_id.in_(class_filter))
         
-    return query.offset(skip).limit(limit).all()
+    return query.order_by(Class.class_id).offset(skip).limit(limit).all()
 
 def create_class(db: Session, class_data: ClassCreate) -> Class:
     # Extract subject IDs if provided
@@ -110,65 +130,26 @@ def delete_class(db: Session, class_id: int) -> Class:
     return db_class
 
 def get_students_in_class(db: Session, class_id: int, skip: int = 0, limit: int = 100) -> List[ClassStudent]:
-    return db.query(ClassStudent).filter(
+    return db.query(ClassStudent).options(*CLASS_STUDENT_RESPONSE_OPTIONS).filter(
         ClassStudent.class_id == class_id
-    ).offset(skip).limit(limit).all()
+    ).order_by(ClassStudent.student_id).offset(skip).limit(limit).all()
 
 def add_student_to_class(db: Session, class_id: int, student_id: int) -> ClassStudent:
-    # Check if class exists
-    db_class = get_class(db, class_id=class_id)
-    if not db_class:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Class not found"
-        )
-    
-    # Check if student is already in class
-    existing_enrollment = db.query(ClassStudent).filter(
+    existing_status = db.query(ClassStudent.status).filter(
         ClassStudent.class_id == class_id,
         ClassStudent.student_id == student_id
-    ).first()
-    
-    if existing_enrollment:
-        if existing_enrollment.status == "dropped":
-            # Update status if previously dropped
-            existing_enrollment.status = "enrolled"
-            db.commit()
-            db.refresh(existing_enrollment)
-            
-            # Update class student count
-            db_class.current_students += 1
-            db.commit()
-            
-            return existing_enrollment
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Student already enrolled in this class"
-            )
-    
-    # Check if class is full
-    if db_class.max_students and db_class.current_students >= db_class.max_students:
+    ).scalar()
+    if existing_status is not None and existing_status != "dropped":
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Class is full"
+            detail="Student already enrolled in this class"
         )
     
-    # Add student to class
-    db_class_student = ClassStudent(
-        class_id=class_id,
-        student_id=student_id,
-        status="enrolled"
-    )
-    
-    db.add(db_class_student)
-    
-    # Update class student count
-    db_class.current_students += 1
-    
-    db.commit()
-    db.refresh(db_class_student)
-    return db_class_student
+    enroll_students(db, class_id, [student_id])
+    return db.query(ClassStudent).options(*CLASS_STUDENT_RESPONSE_OPTIONS).filter(
+        ClassStudent.class_id == class_id,
+        ClassStudent.student_id == student_id
+    ).first()
 
 def remove_student_from_class(db: Session, class_id: int, student_id: int) -> ClassStudent:
     # Check if enrollment exists
@@ -191,100 +172,246 @@ def remove_student_from_class(db: Session, class_id: int, student_id: int) -> Cl
     
     # Update enrollment status
     enrollment.status = "dropped"
+    db.flush()
     
     # Update class student count
-    db_class = get_class(db, class_id=class_id)
-    if db_class and db_class.current_students > 0:
-        db_class.current_students -= 1
+    recount_class_students(db, class_id)
     
+    sync_student_features(db, [student_id])
     db.commit()
     db.refresh(enrollment)
     return enrollment
 
-def get_available_students(db: Session, class_id: int, skip: int = 0, limit: int = 100) -> List[Dict]:
-    """
-    Get list of students not currently enrolled in the class
+def get_available_students(
+    db: Session,
+    class_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: Optional[int] = None,
+    search: Optional[str] = None,
+    max_course_load: Optional[int] = None
+) -> Tuple[List[Student], Optional[int]]:
     """
-    from app.models.models import Student
+    Get students not currently in the class (dropped students are available again)
     
-    # Get the class
-    db_class = get_class(db, class_id)
-    if not db_class:
+    Uses a NOT EXISTS anti-join on the class_students primary key instead of an IN-list of
+    enrolled ids, and keyset paging on student_id, so the cost of a page does not grow with
+    the class size or the page number.
+    
+    Args:
+        after_id: Return students after this student_id (next_after_id of the previous page);
+            skip is only used without it
+        search: Match student code or name (served by the student search index)
+        max_course_load: Exclude students already enrolled in this many classes or more
+    
+    Returns:
+        The page of students and the after_id of the next page (None on the last page)
+    """
+    if not db.query(Class.class_id).filter(Class.class_id == class_id).first():
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Class not found"
         )
     
-    # Get all student IDs currently in the class (including dropped)
-    enrolled_student_ids = db.query(ClassStudent.student_id).filter(
+    in_class = select(ClassStudent.student_id).where(
         ClassStudent.class_id == class_id,
+        ClassStudent.student_id == Student.student_id,
         ClassStudent.status != 'dropped'
-    ).all()
-    enrolled_student_ids = [id[0] for id in enrolled_student_ids]
+    ).exists()
+    query = db.query(Student).options(joinedload(Student.user)).filter(~in_class)
+    
+    if max_course_load is not None:
+        course_load = select(func.count()).select_from(ClassStudent).where(
+            ClassStudent.student_id == Student.student_id,
+            ClassStudent.status == 'enrolled'
+        ).scalar_subquery()
+        query = query.filter(course_load < max_course_load)
+    
+    if after_id is not None:
+        query = query.filter(Student.student_id > after_id)
+    query = query.order_by(Student.student_id)
+    offset = skip if after_id is None else 0
+    
+    # One extra row tells whether a next page exists
+    if search:
+        students = _available_search_matches(query, search, after_id, offset + limit + 1)[offset:]
+    else:
+        if offset:
+            query = query.offset(offset)
+        students = query.limit(limit + 1).all()
+    next_after_id = None
+    if len(students) > limit:
+        students = students[:limit]
+        next_after_id = students[-1].student_id
+    return students, next_after_id
+
+def _available_search_matches(query, search: str, after_id: Optional[int], wanted: int) -> List[Student]:
+    """
+    The first `wanted` students of query (ordered by student_id) whose code or name matches search.
     
-    # Query students not in the class
-    query = db.query(Student).filter(
-        ~Student.student_id.in_(enrolled_student_ids)
+    All index hits are walked in student_id order in chunks of at most ID_CHUNK_SIZE ids, so hits
+    already in the class never hide available students and the IN list stays bounded.
+    """
+    db = query.session
+    matched_ids = set(student_search_index.search_ids(db, search, "code"))
+    matched_ids.update(student_search_index.search_ids(db, search, "full_name"))
+    matched_ids = sorted(
+        student_id for student_id in matched_ids if after_id is None or student_id > after_id
     )
     
-    return query.offset(skip).limit(limit).all()
+    students = []
+    chunk_size = min(wanted, ID_CHUNK_SIZE)
+    position = 0
+    while position < len(matched_ids) and len(students) < wanted:
+        chunk = matched_ids[position:position + chunk_size]
+        students.extend(
+            query.filter(Student.student_id.in_(chunk)).limit(wanted - len(students)).all()
+        )
+        position += len(chunk)
+        chunk_size = min(chunk_size * 2, ID_CHUNK_SIZE)
+    return students
 
-def add_students_bulk(db: Session, class_id: int, student_ids: List[int]) -> List[ClassStudent]:
+def recount_class_students(db: Session, class_id: int) -> None:
     """
-    Add multiple students to a class at once
+    Set current_students from the enrolled rows in a single UPDATE, so concurrent enrollments cannot drift it.
+    Only executes; the caller commits.
+    """
+    enrolled_count = (
+        select(func.count())
+        .select_from(ClassStudent)
+        .where(ClassStudent.class_id == Class.class_id, ClassStudent.status == "enrolled")
+        .scalar_subquery()
+    )
+    db.execute(
+        update(Class)
+        .where(Class.class_id == class_id)
+        .values(current_students=enrolled_count)
+        .execution_options(synchronize_session=False, **{ROLLUPS_APPLIED: True})
+    )
+    db_class = db.identity_map.get(identity_key(Class, (class_id,)))
+    if db_class is not None:
+        db.expire(db_class, ["current_students"])
+
+def enroll_students(db: Session, class_id: int, student_ids: List[int]) -> Dict[str, List[int]]:
+    """
+    Set-based enrollment of many students into a class. Commits.
+    
+    The class row is locked (SELECT ... FOR UPDATE) while students, existing enrollments and capacity
+    are validated in a few queries; new rows are inserted and dropped enrollments reactivated with one
+    multi-row upsert, then current_students is recounted atomically.
+    
+    Returns the ids that were enrolled, reactivated and skipped (already completed the class).
     """
-    # Check if class exists
-    db_class = get_class(db, class_id)
+    db_class = db.query(Class).filter(Class.class_id == class_id).with_for_update().first()
     if not db_class:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Class not found"
         )
     
-    # Check if adding these students would exceed max_students
-    if db_class.max_students:
-        if db_class.current_students + len(student_ids) > db_class.max_students:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Adding these students would exceed the class maximum of {db_class.max_students} students"
-            )
-    
-    # Get existing enrollments
-    existing_enrollments = db.query(ClassStudent).filter(
-        ClassStudent.class_id == class_id,
-        ClassStudent.student_id.in_(student_ids)
-    ).all()
+    ids = list(dict.fromkeys(student_id for student_id in student_ids if student_id is not None))
+    result = {"enrolled": [], "reactivated": [], "skipped": []}
+    if not ids:
+        db.commit()
+        return result
+    
+    found_ids = set()
+    existing = {}
+    for start in range(0, len(ids), ID_CHUNK_SIZE):
+        chunk = ids[start:start + ID_CHUNK_SIZE]
+        found_ids.update(row[0] for row in db.query(Student.student_id).filter(Student.student_id.in_(chunk)).all())
+        existing.update(db.query(ClassStudent.student_id, ClassStudent.status).filter(
+            ClassStudent.class_id == class_id,
+            ClassStudent.student_id.in_(chunk)
+        ).all())
+    
+    missing = [student_id for student_id in ids if student_id not in found_ids]
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Students with IDs {missing} not found"
+        )
     
-    # Check for active enrollments
-    active_students = [e.student_id for e in existing_enrollments if e.status == "enrolled"]
+    active_students = [student_id for student_id in ids if existing.get(student_id) == "enrolled"]
     if active_students:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Students with IDs {active_students} are already enrolled in this class"
         )
     
-    # Create new enrollments
-    enrollments = []
-    for student_id in student_ids:
-        # Skip if student is already enrolled
-        if student_id in [e.student_id for e in existing_enrollments]:
-            continue
-            
-        enrollment = ClassStudent(
-            class_id=class_id,
-            student_id=student_id,
-            status="enrolled"
-        )
-        db.add(enrollment)
-        enrollments.append(enrollment)
+    for student_id in ids:
+        enrollment_status = existing.get(student_id)
+        if enrollment_status is None:
+            result["enrolled"].append(student_id)
+        elif enrollment_status == "dropped":
+            result["reactivated"].append(student_id)
+        else:
+            result["skipped"].append(student_id)
+    joining = result["enrolled"] + result["reactivated"]
+    
+    # Capacity is checked against the live enrolled count, not the stored current_students
+    if db_class.max_students and joining:
+        enrolled_count = db.query(func.count()).select_from(ClassStudent).filter(
+            ClassStudent.class_id == class_id,
+            ClassStudent.status == "enrolled"
+        ).scalar()
+        if enrolled_count + len(joining) > db_class.max_students:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Class is full" if len(ids) == 1 else
+                f"Adding these students would exceed the class maximum of {db_class.max_students} students"
+            )
     
-    # Update class student count
-    db_class.current_students += len(enrollments)
+    if joining:
+        apply_enrollment_changes(db, class_id, joining)
+        rows = [{"class_id": class_id, "student_id": student_id, "status": "enrolled"} for student_id in joining]
+        statement = upsert_statement(
+            db, ClassStudent, rows,
+            conflict_columns=["class_id", "student_id"],
+            update_columns=["status"]
+        )
+        if statement is not None:
+            db.execute(statement.execution_options(**{ROLLUPS_APPLIED: True}))
+        else:
+            if result["enrolled"]:
+                db.execute(insert(ClassStudent).execution_options(**{ROLLUPS_APPLIED: True}), [
+                    row for row in rows if row["student_id"] in set(result["enrolled"])
+                ])
+            if result["reactivated"]:
+                db.query(ClassStudent).filter(
+                    ClassStudent.class_id == class_id,
+                    ClassStudent.student_id.in_(result["reactivated"])
+                ).execution_options(**{ROLLUPS_APPLIED: True}).update(
+                    {"status": "enrolled"}, synchronize_session=False
+                )
+        
+        # Reactivated enrollments may be loaded in this session
+        for student_id in result["reactivated"]:
+            enrollment = db.identity_map.get(identity_key(ClassStudent, (class_id, student_id)))
+            if enrollment is not None:
+                db.expire(enrollment, ["status"])
+        
+        recount_class_students(db, class_id)
+        sync_student_features(db, joining)
     
     db.commit()
+    return result
+
+def add_students_bulk(db: Session, class_id: int, student_ids: List[int]) -> List[ClassStudent]:
+    """
+    Add multiple students to a class at once (dropped students are re-enrolled)
+    """
+    result = enroll_students(db, class_id, student_ids)
+    joined = result["enrolled"] + result["reactivated"]
+    if not joined:
+        return []
     
-    # Refresh all new enrollments
-    for enrollment in enrollments:
-        db.refresh(enrollment)
-    
+    enrollments = []
+    for start in range(0, len(joined), ID_CHUNK_SIZE):
+        enrollments.extend(db.query(ClassStudent).options(*CLASS_STUDENT_RESPONSE_OPTIONS).filter(
+            ClassStudent.class_id == class_id,
+            ClassStudent.student_id.in_(joined[start:start + ID_CHUNK_SIZE])
+        ).all())
+    order = {student_id: index for index, student_id in enumerate(joined)}
+    enrollments.sort(key=lambda enrollment: order[enrollment.student_id])
     return enrollments
@@ -5,6 +5,7 @@ from datetime import date
 
 from app.models.models import DisciplinaryRecord, Student
 from app.schemas.schemas import DisciplinaryRecordCreate, DisciplinaryRecordUpdate
+from app.crud.student_feature import sync_student_features
 
 def get_disciplinary_record(db: Session, record_id: int) -> Optional[DisciplinaryRecord]:
     return db.query(DisciplinaryRecord).filter(DisciplinaryRecord.record_id == record_id).first()
@@ -48,6 +49,7 @@ def create_disciplinary_record(db: Session, record: DisciplinaryRecordCreate) ->
     db_record = DisciplinaryRecord(**record_data)
     
     db.add(db_record)
+    sync_student_features(db, [db_record.student_id])
     db.commit()
     db.refresh(db_record)
     
@@ -83,6 +85,7 @@ def update_disciplinary_record(db: Session, record_id: int, record: Disciplinary
     for key, value in update_data.items():
         setattr(db_record, key, value)
     
+    sync_student_features(db, [db_record.student_id])
     db.commit()
     db.refresh(db_record)
     
@@ -149,6 +152,7 @@ def delete_disciplinary_record(db: Session, record_id: int) -> DisciplinaryRecor
     
     # Delete the record
     db.delete(db_record)
+    sync_student_features(db, [db_record.student_id])
     db.commit()
     
     return record_to_return
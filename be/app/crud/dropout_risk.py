@@ -1,8 +1,12 @@
 from typing import List, Optional, Dict, Any, Union
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from fastapi import HTTPException, status
+from app.crud.base import insert_returning_ids
 from app.models.models import DropoutRisk, Student
 from app.schemas.schemas import DropoutRiskCreate, DropoutRiskUpdate
+from app.services.campus_rollups import ROLLUPS_APPLIED, apply_new_risk_changes
 from datetime import datetime
 import json
 
@@ -64,6 +68,55 @@ def get_dropout_risks(
                 
     return risks
 
+# Relationships serialized by DropoutRiskResponse, eager loaded for async reads
+DROPOUT_RISK_RESPONSE_OPTIONS = [selectinload(DropoutRisk.student).selectinload(Student.user)]
+
+def _parse_risk_factors(risks: List[DropoutRisk]) -> List[DropoutRisk]:
+    # Ensure risk_factors is properly parsed from JSON string to dict
+    for risk in risks:
+        if isinstance(risk.risk_factors, str):
+            try:
+                risk.risk_factors = json.loads(risk.risk_factors)
+            except (json.JSONDecodeError, TypeError):
+                pass
+    return risks
+
+async def get_dropout_risk_async(db: AsyncSession, risk_id: int) -> Optional[DropoutRisk]:
+    result = await db.execute(
+        select(DropoutRisk).options(*DROPOUT_RISK_RESPONSE_OPTIONS).filter(DropoutRisk.risk_id == risk_id)
+    )
+    risk = result.scalars().first()
+    if risk:
+        _parse_risk_factors([risk])
+    return risk
+
+async def get_dropout_risks_by_student_async(db: AsyncSession, student_id: int) -> List[DropoutRisk]:
+    result = await db.execute(
+        select(DropoutRisk).options(*DROPOUT_RISK_RESPONSE_OPTIONS).filter(DropoutRisk.student_id == student_id)
+    )
+    return _parse_risk_factors(list(result.scalars().all()))
+
+async def get_dropout_risks_async(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    min_risk: Optional[float] = None,
+    max_risk: Optional[float] = None
+) -> List[DropoutRisk]:
+    """
+    Async variant of get_dropout_risks
+    """
+    statement = select(DropoutRisk).options(*DROPOUT_RISK_RESPONSE_OPTIONS)
+    
+    if min_risk is not None:
+        statement = statement.filter(DropoutRisk.risk_percentage >= min_risk)
+    
+    if max_risk is not None:
+        statement = statement.filter(DropoutRisk.risk_percentage <= max_risk)
+    
+    result = await db.execute(statement.offset(skip).limit(limit))
+    return _parse_risk_factors(list(result.scalars().all()))
+
 def create_dropout_risk(db: Session, dropout_risk: DropoutRiskCreate) -> DropoutRisk:
     # Check if student exists
     student = db.query(Student).filter(Student.student_id == dropout_risk.student_id).first()
@@ -92,6 +145,40 @@ def create_dropout_risk(db: Session, dropout_risk: DropoutRiskCreate) -> Dropout
             
     return db_dropout_risk
 
+def create_dropout_risks_bulk(db: Session, dropout_risks: List[DropoutRiskCreate]) -> List[DropoutRisk]:
+    """
+    Create many dropout risk assessments in a single transaction
+    """
+    if not dropout_risks:
+        return []
+
+    # Check that all students exist with one query
+    student_ids = {risk.student_id for risk in dropout_risks}
+    existing_ids = {
+        row[0] for row in db.query(Student.student_id).filter(Student.student_id.in_(student_ids)).all()
+    }
+    missing_ids = student_ids - existing_ids
+    if missing_ids:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Students not found: {sorted(missing_ids)}"
+        )
+
+    # Adding ORM objects makes the flush insert row by row on MySQL to read back each autoincrement id:
+    # insert with one statement per chunk and get the ids from RETURNING / the consecutive id block
+    analysis_date = datetime.utcnow()
+    rows = [dict(risk.dict(), analysis_date=analysis_date) for risk in dropout_risks]
+    apply_new_risk_changes(db, [(row["student_id"], row["risk_percentage"]) for row in rows])
+    risk_ids = insert_returning_ids(db, DropoutRisk, rows, execution_options={ROLLUPS_APPLIED: True})
+    db.commit()
+
+    # Reload the committed rows in chunks and return them in input order
+    risks_by_id = {}
+    for start in range(0, len(risk_ids), 1000):
+        for risk in db.query(DropoutRisk).filter(DropoutRisk.risk_id.in_(risk_ids[start:start + 1000])).all():
+            risks_by_id[risk.risk_id] = risk
+    return [risks_by_id[risk_id] for risk_id in risk_ids]
+
 def update_dropout_risk(db: Session, risk_id: int, dropout_risk: DropoutRiskUpdate) -> DropoutRisk:
     db_dropout_risk = get_dropout_risk(db, risk_id=risk_id)
     if not db_dropout_risk:
@@ -1,8 +1,11 @@
 from typing import List, Optional, Dict, Any, Union
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from fastapi import HTTPException, status
-from app.models.models import Grade, Student, Class, Subject
+from app.models.models import Grade, Student, Class, Subject, Teacher
 from app.schemas.schemas import GradeCreate, GradeUpdate
+from app.crud.student_feature import sync_student_features
 
 def get_grade(db: Session, grade_id: int) -> Optional[Grade]:
     return db.query(Grade).filter(Grade.grade_id == grade_id).first()
@@ -28,6 +31,38 @@ def get_grades(
         
     return query.offset(skip).limit(limit).all()
 
+# Relationships serialized by GradeResponse, eager loaded for async reads
+GRADE_RESPONSE_OPTIONS = [
+    selectinload(Grade.student).selectinload(Student.user),
+    selectinload(Grade.subject),
+    selectinload(Grade.class_obj).selectinload(Class.teacher).selectinload(Teacher.user)
+]
+
+async def get_grades_async(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    student_id: Optional[int] = None,
+    subject_id: Optional[int] = None,
+    class_id: Optional[int] = None
+) -> List[Grade]:
+    """
+    Async variant of get_grades
+    """
+    statement = select(Grade).options(*GRADE_RESPONSE_OPTIONS)
+    
+    if student_id is not None:
+        statement = statement.filter(Grade.student_id == student_id)
+    
+    if subject_id is not None:
+        statement = statement.filter(Grade.subject_id == subject_id)
+        
+    if class_id is not None:
+        statement = statement.filter(Grade.class_id == class_id)
+    
+    result = await db.execute(statement.offset(skip).limit(limit))
+    return list(result.scalars().all())
+
 def create_grade(db: Session, grade: GradeCreate) -> Grade:
     # Validate that student exists
     student = db.query(Student).filter(Student.student_id == grade.student_id).first()
@@ -78,6 +113,7 @@ def create_grade(db: Session, grade: GradeCreate) -> Grade:
                         grade.final_score * 0.5)
     
     db.add(db_grade)
+    sync_student_features(db, [db_grade.student_id])
     db.commit()
     db.refresh(db_grade)
     return db_grade
@@ -111,6 +147,7 @@ def update_grade(db: Session, grade_id: int, grade: GradeUpdate) -> Grade:
                            db_grade.midterm_score * 0.3 + 
                            db_grade.final_score * 0.5)
     
+    sync_student_features(db, [db_grade.student_id])
     db.commit()
     db.refresh(db_grade)
     return db_grade
@@ -124,5 +161,6 @@ def delete_grade(db: Session, grade_id: int) -> Grade:
         )
     
     db.delete(db_grade)
+    sync_student_features(db, [db_grade.student_id])
     db.commit()
     return db_grade
@@ -1,18 +1,35 @@
 from typing import List, Optional, Dict, Any, Union, Tuple
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, func
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import or_, func, select
 from fastapi import HTTPException, status
 from app.models.models import Student
 from app.schemas.schemas import StudentCreate, StudentUpdate, PaginationParams, SearchParams
+from app.core.config import settings
 from app.crud.base import CRUDBase
+from app.crud.student_feature import sync_student_features
+from app.services.principal_cache import invalidate_principal
+from app.services.search_index import student_search_index, STUDENT_SEARCH_FIELD_MAP
+
+STUDENT_SEARCH_FIELDS = ["student_code", "first_name", "last_name", "email", "phone_number"]
 
 class CRUDStudent(CRUDBase[Student, StudentCreate, StudentUpdate]):
     """
     CRUD operations for Student model
     """
+    # Relationships serialized by StudentResponse, eager loaded for async reads
+    response_options = [selectinload(Student.user)]
+    sortable_fields = ["student_code", "date_of_birth", "attendance_rate", "academic_status"]
+    
     def get_by_id(self, db: Session, student_id: int) -> Optional[Student]:
         return db.query(Student).filter(Student.student_id == student_id).first()
     
+    async def get_by_id_async(self, db: AsyncSession, student_id: int) -> Optional[Student]:
+        result = await db.execute(
+            select(Student).options(*self.response_options).filter(Student.student_id == student_id)
+        )
+        return result.scalars().first()
+    
     def get_by_code(self, db: Session, student_code: str) -> Optional[Student]:
         return db.query(Student).filter(Student.student_code == student_code).first()
     
@@ -93,27 +110,123 @@ def get_students_paginated(
     """
     Get paginated list of students with search and filter capabilities
     """
-    search_fields = ["student_code", "first_name", "last_name", "email", "phone_number"]
+    if _uses_search_index(search):
+        filters = dict(filters or {}, student_id=student_search_index.search_ids(
+            db, search.query, STUDENT_SEARCH_FIELD_MAP.get(search.field), limit=settings.SEARCH_MAX_HITS
+        ))
+        search = None
     return student.get_paginated(
         db=db,
         pagination=pagination,
         search=search,
         filters=filters,
-        search_fields=search_fields
+        search_fields=STUDENT_SEARCH_FIELDS
+    )
+
+def _uses_search_index(search: Optional[SearchParams]) -> bool:
+    # Code, name and email are served by the in-memory index instead of ILIKE '%term%'
+    return bool(search and search.query) and (search.field is None or search.field in STUDENT_SEARCH_FIELD_MAP)
+
+async def _index_search_ids_async(db: AsyncSession, search: SearchParams) -> List[int]:
+    # Ranked ids of the best SEARCH_MAX_HITS matches
+    return await db.run_sync(
+        student_search_index.search_ids, search.query, STUDENT_SEARCH_FIELD_MAP.get(search.field),
+        settings.SEARCH_MAX_HITS
+    )
+
+async def _index_search_filters_async(
+    db: AsyncSession,
+    search: SearchParams,
+    filters: Optional[Dict[str, Any]]
+) -> Dict[str, Any]:
+    return dict(filters or {}, student_id=await _index_search_ids_async(db, search))
+
+async def get_student_async(db: AsyncSession, student_id: int) -> Optional[Student]:
+    return await student.get_by_id_async(db, student_id)
+
+async def get_students_async(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    academic_status: Optional[str] = None
+) -> List[Student]:
+    filters = {}
+    if academic_status:
+        filters["academic_status"] = academic_status
+    return await student.get_multi_async(
+        db, skip=skip, limit=limit, filters=filters, options=student.response_options
+    )
+
+async def get_students_page_async(
+    db: AsyncSession,
+    size: int,
+    cursor: Optional[str] = None,
+    sort: Optional[str] = None,
+    offset: int = 0,
+    search: Optional[SearchParams] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    include_total: bool = True
+) -> Tuple[List[Student], Optional[int], Optional[str]]:
+    """
+    Keyset-paginated list of students, returns (items, total, next_cursor);
+    offset is used for the page when no cursor is given.
+    
+    Index searches without an explicit sort are paginated in ranking order,
+    over the best SEARCH_MAX_HITS matches.
+    """
+    if _uses_search_index(search):
+        student_ids = await _index_search_ids_async(db, search)
+        if not sort:
+            return await student.get_ranked_page_async(
+                db=db,
+                ranked_ids=student_ids,
+                size=size,
+                cursor=cursor,
+                offset=offset,
+                search=search,
+                filters=filters,
+                include_total=include_total,
+                options=student.response_options
+            )
+        filters = dict(filters or {}, student_id=student_ids)
+        search = None
+    return await student.get_page_async(
+        db=db,
+        size=size,
+        cursor=cursor,
+        sort=sort,
+        offset=offset,
+        search=search,
+        filters=filters,
+        search_fields=STUDENT_SEARCH_FIELDS,
+        include_total=include_total,
+        options=student.response_options
+    )
+
+async def get_students_paginated_async(
+    db: AsyncSession,
+    pagination: PaginationParams,
+    search: Optional[SearchParams] = None,
+    filters: Optional[Dict[str, Any]] = None
+) -> Tuple[List[Student], int]:
+    """
+    Async variant of get_students_paginated
+    """
+    if _uses_search_index(search):
+        filters = await _index_search_filters_async(db, search, filters)
+        search = None
+    return await student.get_paginated_async(
+        db=db,
+        pagination=pagination,
+        search=search,
+        filters=filters,
+        search_fields=STUDENT_SEARCH_FIELDS,
+        options=student.response_options
     )
 
 def create_student(db: Session, student_in: StudentCreate) -> Student:
     return student.create_with_validation(db, student_in)
 
-def update_student(db: Session, student_id: int, student_in: StudentUpdate) -> Student:
-    db_student = get_student(db, student_id=student_id)
-    if not db_student:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Student not found"
-        )
-    return student.update(db, db_obj=db_student, obj_in=student_in)
-
 def delete_student(db: Session, student_id: int) -> Student:
     db_student = get_student(db, student_id=student_id)
     if not db_student:
@@ -145,7 +258,9 @@ def create_student(db: Session, student: StudentCreate) -> Student:
     
     db.add(db_student)
     db.commit()
+    invalidate_principal(db_student.user_id)
     db.refresh(db_student)
+    student_search_index.mark_changed(db_student.student_id)
     return db_student
 
 def update_student(db: Session, student_id: int, student: StudentUpdate) -> Student:
@@ -162,8 +277,11 @@ def update_student(db: Session, student_id: int, student: StudentUpdate) -> Stud
     for key, value in update_data.items():
         setattr(db_student, key, value)
     
+    # Academic status, income and scholarship are stored risk features
+    sync_student_features(db, [student_id])
     db.commit()
     db.refresh(db_student)
+    student_search_index.mark_changed(student_id)
     return db_student
 
 def delete_student(db: Session, student_id: int) -> Student:
@@ -174,6 +292,9 @@ def delete_student(db: Session, student_id: int) -> Student:
             detail="Student not found"
         )
     
+    user_id = db_student.user_id
     db.delete(db_student)
     db.commit()
+    invalidate_principal(user_id)
+    student_search_index.mark_changed(student_id)
     return db_student
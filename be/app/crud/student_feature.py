@@ -0,0 +1,126 @@
+from typing import List, Optional, Iterable, Tuple
+from sqlalchemy.orm import Session
+import numpy as np
+
+from app.models.models import Student, StudentRiskFeature
+from app.services.student_feature_extractor import StudentFeatureExtractor, DEFAULT_FEATURE_NAMES, ID_CHUNK_SIZE
+
+
+def get_student_feature(db: Session, student_id: int) -> Optional[StudentRiskFeature]:
+    return db.query(StudentRiskFeature).filter(StudentRiskFeature.student_id == student_id).first()
+
+
+def refresh_student_features(db: Session, student_ids: Iterable[int]) -> int:
+    """
+    Recompute the stored features of the given students from raw data.
+    Only flushes; the caller owns the transaction.
+    """
+    ids = [student_id for student_id in dict.fromkeys(student_ids) if student_id is not None]
+    extractor = StudentFeatureExtractor(db, DEFAULT_FEATURE_NAMES)
+    refreshed = 0
+
+    for start in range(0, len(ids), ID_CHUNK_SIZE):
+        chunk = ids[start:start + ID_CHUNK_SIZE]
+        found_ids, matrix = extractor.extract_batch(chunk)
+        existing = {
+            row.student_id: row
+            for row in db.query(StudentRiskFeature).filter(StudentRiskFeature.student_id.in_(found_ids)).all()
+        } if found_ids else {}
+
+        for student_id, row in zip(found_ids, matrix):
+            features = extractor.row_to_dict(row)
+            db_feature = existing.get(student_id)
+            if db_feature is None:
+                db.add(StudentRiskFeature(student_id=student_id, **features))
+            else:
+                for key, value in features.items():
+                    setattr(db_feature, key, value)
+        refreshed += len(found_ids)
+
+    db.flush()
+    return refreshed
+
+
+def sync_student_features(db: Session, student_ids: Iterable[int]) -> None:
+    """
+    Keep the feature store in step with a write to attendance, grades, discipline or enrollments.
+    Runs in a savepoint so a feature store failure never breaks the original write;
+    the caller's pending changes are flushed first so their errors still reach the caller.
+    """
+    ids = list(student_ids)
+    if not ids:
+        return
+    db.flush()
+    try:
+        with db.begin_nested():
+            refresh_student_features(db, ids)
+    except Exception as e:
+        print(f"Error refreshing student features for {ids}: {e}")
+
+
+def get_student_feature_matrix(
+    db: Session,
+    student_ids: Optional[Iterable[int]] = None,
+    feature_names: Optional[List[str]] = None
+) -> Tuple[List[int], np.ndarray]:
+    """
+    Read feature vectors from the feature store with indexed lookups.
+    Students that have no stored row yet are computed from raw data and stored in a savepoint
+    (never committed or rolled back here; the caller owns the transaction).
+    Unknown student ids are skipped.
+    """
+    names = list(feature_names or DEFAULT_FEATURE_NAMES)
+    columns = [getattr(StudentRiskFeature, name) for name in names]
+
+    def read_rows(ids: Optional[List[int]]) -> dict:
+        if ids is None:
+            query = db.query(StudentRiskFeature.student_id, *columns).order_by(StudentRiskFeature.student_id)
+            return {row[0]: row for row in query.all()}
+        rows = {}
+        for start in range(0, len(ids), ID_CHUNK_SIZE):
+            for row in db.query(StudentRiskFeature.student_id, *columns).filter(
+                StudentRiskFeature.student_id.in_(ids[start:start + ID_CHUNK_SIZE])
+            ).all():
+                rows[row[0]] = row
+        return rows
+
+    if student_ids is None:
+        rows = read_rows(None)
+        missing = [
+            row[0] for row in db.query(Student.student_id)
+            .outerjoin(StudentRiskFeature, StudentRiskFeature.student_id == Student.student_id)
+            .filter(StudentRiskFeature.student_id.is_(None))
+            .all()
+        ]
+    else:
+        requested = list(dict.fromkeys(student_ids))
+        rows = read_rows(requested)
+        missing = [student_id for student_id in requested if student_id not in rows]
+
+    if missing:
+        db.flush()
+        try:
+            with db.begin_nested():
+                refresh_student_features(db, missing)
+            rows.update(read_rows(missing))
+        except Exception as e:
+            # Store not writable: use the features computed from raw data without storing them
+            print(f"Error storing student features for {len(missing)} students: {e}")
+            found_ids, matrix = StudentFeatureExtractor(db, names).extract_batch(missing)
+            rows.update({student_id: (student_id, *row) for student_id, row in zip(found_ids, matrix)})
+
+    ordered_ids = sorted(rows) if student_ids is None else [i for i in requested if i in rows]
+    matrix = np.array([rows[i][1:] for i in ordered_ids], dtype=float).reshape(len(ordered_ids), len(names))
+    return ordered_ids, matrix
+
+
+def rebuild_student_features(db: Session, chunk_size: int = ID_CHUNK_SIZE) -> int:
+    """
+    Recompute the feature store for every student, committing one chunk at a time
+    """
+    student_ids = [row[0] for row in db.query(Student.student_id).order_by(Student.student_id).all()]
+    rebuilt = 0
+    for start in range(0, len(student_ids), chunk_size):
+        rebuilt += refresh_student_features(db, student_ids[start:start + chunk_size])
+        db.commit()
+    return rebuilt
@@ -4,12 +4,17 @@ from sqlalchemy import or_, func
 from fastapi import HTTPException, status
 from app.models.models import Teacher
 from app.schemas.schemas import TeacherCreate, TeacherUpdate, PaginationParams, SearchParams
+from app.core.config import settings
 from app.crud.base import CRUDBase
+from app.services.principal_cache import invalidate_principal
+from app.services.search_index import teacher_search_index, TEACHER_SEARCH_FIELD_MAP
 
 class CRUDTeacher(CRUDBase[Teacher, TeacherCreate, TeacherUpdate]):
     """
     CRUD operations for Teacher model
     """
+    sortable_fields = ["teacher_code", "department", "date_hired", "years_of_experience"]
+    
     def get_by_id(self, db: Session, teacher_id: int) -> Optional[Teacher]:
         return db.query(Teacher).filter(Teacher.teacher_id == teacher_id).first()
     
@@ -84,6 +89,34 @@ def get_teachers(
         filters["department"] = department
     return teacher.get_multi(db, skip=skip, limit=limit, filters=filters)
 
+def get_teachers_page(
+    db: Session,
+    size: int = 100,
+    cursor: Optional[str] = None,
+    sort: Optional[str] = None,
+    offset: int = 0,
+    department: Optional[str] = None,
+    include_total: bool = False,
+    search: Optional[str] = None
+) -> Tuple[List[Teacher], Optional[int], Optional[str]]:
+    """
+    Keyset-paginated list of teachers, returns (items, total, next_cursor)
+    """
+    filters = {}
+    if department:
+        filters["department"] = department
+    if search:
+        filters["teacher_id"] = teacher_search_index.search_ids(db, search, limit=settings.SEARCH_MAX_HITS)
+    return teacher.get_page(
+        db,
+        size=size,
+        cursor=cursor,
+        sort=sort,
+        offset=offset,
+        filters=filters,
+        include_total=include_total
+    )
+
 def get_teachers_paginated(
     db: Session,
     pagination: PaginationParams,
@@ -93,6 +126,12 @@ def get_teachers_paginated(
     """
     Get paginated list of teachers with search and filter capabilities
     """
+    if search and search.query and (search.field is None or search.field in TEACHER_SEARCH_FIELD_MAP):
+        # Code, name and email are served by the in-memory index instead of ILIKE '%term%'
+        filters = dict(filters or {}, teacher_id=teacher_search_index.search_ids(
+            db, search.query, TEACHER_SEARCH_FIELD_MAP.get(search.field), limit=settings.SEARCH_MAX_HITS
+        ))
+        search = None
     search_fields = ["teacher_code", "first_name", "last_name", "email", "phone_number", "department", "academic_rank"] 
     return teacher.get_paginated(
         db=db,
@@ -103,7 +142,10 @@ def get_teachers_paginated(
     )
 
 def create_teacher(db: Session, teacher_in: TeacherCreate) -> Teacher:
-    return teacher.create_with_validation(db, teacher_in)
+    db_teacher = teacher.create_with_validation(db, teacher_in)
+    invalidate_principal(db_teacher.user_id)
+    teacher_search_index.mark_changed(db_teacher.teacher_id)
+    return db_teacher
 
 def update_teacher(db: Session, teacher_id: int, teacher_in: TeacherUpdate) -> Teacher:
     db_teacher = get_teacher(db, teacher_id=teacher_id)
@@ -112,7 +154,9 @@ def update_teacher(db: Session, teacher_id: int, teacher_in: TeacherUpdate) -> T
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Teacher not found"
         )
-    return teacher.update(db, db_obj=db_teacher, obj_in=teacher_in)
+    db_teacher = teacher.update(db, db_obj=db_teacher, obj_in=teacher_in)
+    teacher_search_index.mark_changed(teacher_id)
+    return db_teacher
 
 def delete_teacher(db: Session, teacher_id: int) -> Teacher:
     db_teacher = get_teacher(db, teacher_id=teacher_id)
@@ -121,4 +165,8 @@ def delete_teacher(db: Session, teacher_id: int) -> Teacher:
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Teacher not found"
         )
-    return teacher.remove(db, id=teacher_id)
+    user_id = db_teacher.user_id
+    db_teacher = teacher.remove(db, id=teacher_id)
+    invalidate_principal(user_id)
+    teacher_search_index.mark_changed(teacher_id)
+    return db_teacher
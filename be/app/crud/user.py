@@ -4,6 +4,8 @@ from fastapi import HTTPException, status
 from app.models.models import User
 from app.schemas.schemas import UserCreate, UserUpdate
 from app.core.security import get_password_hash, verify_password
+from app.services.principal_cache import invalidate_principal
+from app.services.search_index import mark_user_changed
 
 def get_user(db: Session, user_id: int) -> Optional[User]:
     return db.query(User).filter(User.user_id == user_id).first()
@@ -83,6 +85,8 @@ def update_user(db: Session, user_id: int, user: UserUpdate) -> User:
         setattr(db_user, key, value)
     
     db.commit()
+    invalidate_principal(user_id)
+    mark_user_changed(user_id)
     db.refresh(db_user)
     return db_user
 
@@ -96,4 +100,6 @@ def delete_user(db: Session, user_id: int) -> User:
     
     db.delete(db_user)
     db.commit()
+    invalidate_principal(user_id)
+    mark_user_changed(user_id)
     return db_user
@@ -1,15 +1,47 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
+from app.db.metrics import (
+    InstrumentedQueuePool, InstrumentedAsyncAdaptedQueuePool, instrument_pool, instrument_queries
+)
+
+# Tham số pool dùng chung cho cả hai engine
+pool_options = dict(
+    pool_size=settings.DATABASE_POOL_SIZE,
+    max_overflow=settings.DATABASE_MAX_OVERFLOW,
+    pool_timeout=settings.DATABASE_POOL_TIMEOUT,
+    pool_recycle=settings.DATABASE_POOL_RECYCLE,
+    pool_pre_ping=settings.DATABASE_POOL_PRE_PING
+)
 
 # Tạo SQLAlchemy engine
-engine = create_engine(settings.DATABASE_URL)
+engine = create_engine(settings.DATABASE_URL, poolclass=InstrumentedQueuePool, **pool_options)
 
 # Tạo SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine cho các endpoint đọc, không chiếm thread của threadpool khi chờ database
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL, poolclass=InstrumentedAsyncAdaptedQueuePool, **pool_options
+)
+
+# Theo dõi pool và số câu lệnh SQL của mỗi request
+instrument_pool(engine, "sync")
+instrument_pool(async_engine, "async")
+instrument_queries(engine)
+instrument_queries(async_engine)
+
+# expire_on_commit=False để response có thể đọc thuộc tính mà không phải lazy load
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 # Base class cho các models
 Base = declarative_base()
 
@@ -20,3 +52,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Dependency để lấy async DB session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,230 @@
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+
+class PoolMetrics:
+    """
+    Bộ đếm của một connection pool: checkout, thời gian chờ lấy kết nối, overflow,
+    kết nối bị hủy (invalidate, ví dụ MySQL "gone away" phát hiện bởi pre-ping)
+    """
+
+    def __init__(self, name: str, sample_size: int = 1024):
+        self.name = name
+        self.pool = None
+        self._lock = threading.Lock()
+        self._wait_samples = deque(maxlen=sample_size)
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.soft_invalidations = 0
+        self.timeouts = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.peak_overflow = 0
+
+    def record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.waits += 1
+            self.wait_total += seconds
+            if seconds > self.wait_max:
+                self.wait_max = seconds
+            self._wait_samples.append(seconds)
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            overflow = self.pool.overflow() if self.pool is not None else 0
+            if overflow > self.peak_overflow:
+                self.peak_overflow = overflow
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checkins += 1
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def _on_soft_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.soft_invalidations += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = sorted(self._wait_samples)
+            waits = len(samples)
+            result = {
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "soft_invalidations": self.soft_invalidations,
+                "timeouts": self.timeouts,
+                "peak_overflow": self.peak_overflow,
+                "wait_ms": {
+                    "avg": round(self.wait_total / self.waits * 1000, 3) if self.waits else 0.0,
+                    "max": round(self.wait_max * 1000, 3),
+                    "p50": round(samples[waits // 2] * 1000, 3) if waits else 0.0,
+                    "p95": round(samples[min(waits - 1, int(waits * 0.95))] * 1000, 3) if waits else 0.0
+                }
+            }
+
+        pool = self.pool
+        if isinstance(pool, QueuePool):
+            result["pool"] = {
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+                "max_overflow": pool._max_overflow,
+                "timeout": pool.timeout()
+            }
+        return result
+
+
+class _InstrumentedPoolMixin:
+    """
+    Đo thời gian chờ lấy kết nối từ pool (gồm cả thời gian mở kết nối overflow mới)
+    """
+    metrics: Optional[PoolMetrics] = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            if self.metrics is not None:
+                self.metrics.record_timeout()
+            raise
+        finally:
+            if self.metrics is not None:
+                self.metrics.record_wait(time.perf_counter() - start)
+
+    def recreate(self):
+        # engine.dispose() tạo pool mới, giữ nguyên bộ đếm
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        if self.metrics is not None:
+            self.metrics.pool = pool
+        return pool
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncAdaptedQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def instrument_pool(engine, name: str) -> PoolMetrics:
+    """
+    Gắn bộ đếm vào pool của engine (sync hoặc async) và đăng ký vào registry
+    """
+    sync_engine = getattr(engine, "sync_engine", engine)
+    metrics = PoolMetrics(name)
+    metrics.pool = sync_engine.pool
+    sync_engine.pool.metrics = metrics
+
+    # Sự kiện đăng ký trên engine được giữ lại khi pool được tạo lại
+    event.listen(sync_engine, "checkout", metrics._on_checkout)
+    event.listen(sync_engine, "checkin", metrics._on_checkin)
+    event.listen(sync_engine, "connect", metrics._on_connect)
+    event.listen(sync_engine, "invalidate", metrics._on_invalidate)
+    event.listen(sync_engine, "soft_invalidate", metrics._on_soft_invalidate)
+
+    pool_metrics[name] = metrics
+    return metrics
+
+
+# Pool metrics theo tên engine
+pool_metrics: Dict[str, PoolMetrics] = {}
+
+
+class RequestDBStats:
+    """
+    Số câu lệnh SQL và tổng thời gian database của một request
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+
+
+class RequestMetrics:
+    """
+    Tổng hợp số câu lệnh SQL theo request trên toàn worker
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.queries = 0
+        self.duration = 0.0
+        self.max_queries = 0
+
+    def record(self, stats: RequestDBStats) -> None:
+        with self._lock:
+            self.requests += 1
+            self.queries += stats.queries
+            self.duration += stats.duration
+            if stats.queries > self.max_queries:
+                self.max_queries = stats.queries
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "queries": self.queries,
+                "avg_queries_per_request": round(self.queries / self.requests, 3) if self.requests else 0.0,
+                "max_queries_per_request": self.max_queries,
+                "avg_db_time_ms": round(self.duration / self.requests * 1000, 3) if self.requests else 0.0
+            }
+
+
+request_metrics = RequestMetrics()
+
+# Thống kê của request hiện tại; threadpool của Starlette sao chép context nên
+# các endpoint đồng bộ cũng ghi vào cùng đối tượng
+current_request_stats: ContextVar[Optional[RequestDBStats]] = ContextVar("current_request_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get("query_start_time")
+    if not start_times:
+        return
+    elapsed = time.perf_counter() - start_times.pop()
+    stats = current_request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.duration += elapsed
+
+
+def instrument_queries(engine) -> None:
+    """
+    Đếm câu lệnh SQL và thời gian thực thi cho request hiện tại
+    """
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
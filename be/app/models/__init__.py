@@ -1,9 +1,9 @@
 # Import all models here
-from .models import Base, User, Student, Teacher,  Class, Subject, Grade, DisciplinaryRecord, DropoutRisk
+from .models import Base, User, Student, Teacher,  Class, Subject, Grade, DisciplinaryRecord, DropoutRisk, StudentRiskFeature, ClassRiskAnalytics, CampusRollup, TrainingJobRecord
 from .attendance import Attendance
 from .class_subject import ClassSubject
 
 __all__ = [
     "Base", "User", "Student", "Teacher", "Class", "Subject",
-    "Grade", "Attendance", "DisciplinaryRecord", "DropoutRisk", "ClassSubject"
+    "Grade", "Attendance", "DisciplinaryRecord", "DropoutRisk", "StudentRiskFeature", "ClassRiskAnalytics", "CampusRollup", "TrainingJobRecord", "ClassSubject"
 ]
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Enum, ForeignKey, Float, Text, Date, TIMESTAMP, Boolean
+from sqlalchemy import Column, Integer, String, Enum, ForeignKey, Float, Text, Date, TIMESTAMP, Boolean, UniqueConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship, column_property
 from sqlalchemy.ext.hybrid import hybrid_property
@@ -8,6 +8,10 @@ from app.models.models import Student, Class, User
 
 class Attendance(Base):
     __tablename__ = "attendance"
+    __table_args__ = (
+        # Một bản ghi điểm danh cho mỗi sinh viên, lớp và ngày (khóa của upsert hàng loạt)
+        UniqueConstraint('student_id', 'class_id', 'date', name='uq_attendance_student_class_date'),
+    )
     
     attendance_id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     student_id = Column(Integer, ForeignKey("students.student_id", ondelete="CASCADE"), nullable=False)
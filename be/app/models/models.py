@@ -19,7 +19,7 @@ class User(Base):
     account_status = Column(Enum('active', 'inactive', 'suspended'), default='active')
     last_login = Column(TIMESTAMP, nullable=True)
     created_at = Column(TIMESTAMP, server_default=func.now())
-    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now(), index=True)
     
     # Relationships
     student = relationship("Student", back_populates="user", uselist=False)
@@ -202,3 +202,96 @@ class DropoutRisk(Base):
     
     def __repr__(self):
         return f"<DropoutRisk {self.risk_id}>"
+
+class StudentRiskFeature(Base):
+    __tablename__ = "student_risk_features"
+    
+    student_id = Column(Integer, ForeignKey("students.student_id", ondelete="CASCADE"), primary_key=True)
+    attendance_rate = Column(Float, nullable=False, default=100.0)
+    avg_gpa = Column(Float, nullable=False, default=0.0)
+    failed_subjects = Column(Integer, nullable=False, default=0)
+    total_subjects = Column(Integer, nullable=False, default=0)
+    minor_violations = Column(Integer, nullable=False, default=0)
+    moderate_violations = Column(Integer, nullable=False, default=0)
+    severe_violations = Column(Integer, nullable=False, default=0)
+    academic_status = Column(Integer, nullable=False, default=0)
+    family_income_level = Column(Integer, nullable=False, default=2)
+    scholarship_status = Column(Integer, nullable=False, default=0)
+    previous_academic_warning = Column(Integer, nullable=False, default=0)
+    dropped_classes = Column(Integer, nullable=False, default=0)
+    semester_count = Column(Integer, nullable=False, default=0)
+    grade_trend = Column(Float, nullable=False, default=0.0)
+    attendance_trend = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<StudentRiskFeature {self.student_id}>"
+
+class ClassRiskAnalytics(Base):
+    __tablename__ = "class_risk_analytics"
+    
+    class_id = Column(Integer, ForeignKey("classes.class_id", ondelete="CASCADE"), primary_key=True)
+    analytics = Column(JSON, nullable=False)
+    ml_analytics = Column(JSON, nullable=False)
+    computed_at = Column(TIMESTAMP, nullable=False)
+    
+    def __repr__(self):
+        return f"<ClassRiskAnalytics {self.class_id}>"
+
+class CampusRollup(Base):
+    __tablename__ = "campus_rollups"
+    
+    # scope_key: '' cho toàn trường, tên khoa, class_id hoặc năm học
+    scope = Column(Enum('campus', 'department', 'class', 'academic_year'), primary_key=True)
+    scope_key = Column(String(100), primary_key=True)
+    total_students = Column(Integer, nullable=False, default=0)
+    total_classes = Column(Integer, nullable=False, default=0)
+    present_count = Column(Integer, nullable=False, default=0)
+    absent_count = Column(Integer, nullable=False, default=0)
+    late_count = Column(Integer, nullable=False, default=0)
+    excused_count = Column(Integer, nullable=False, default=0)
+    graded_count = Column(Integer, nullable=False, default=0)
+    gpa_sum = Column(Float, nullable=False, default=0.0)
+    risk_low = Column(Integer, nullable=False, default=0)
+    risk_medium = Column(Integer, nullable=False, default=0)
+    risk_high = Column(Integer, nullable=False, default=0)
+    open_disciplinary = Column(Integer, nullable=False, default=0)
+    computed_at = Column(TIMESTAMP, nullable=True)
+    # Tăng sau mỗi lần dựng lại: phần chênh lệch áp dụng sau commit chỉ cộng vào dòng cùng thế hệ
+    generation = Column(Integer, nullable=False, default=0)
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+    
+    @property
+    def attendance_rate(self):
+        total = self.present_count + self.absent_count
+        return round(self.present_count / total * 100.0, 1) if total else 100.0
+    
+    @property
+    def average_gpa(self):
+        return round(self.gpa_sum / self.graded_count, 2) if self.graded_count else None
+    
+    def __repr__(self):
+        return f"<CampusRollup {self.scope}:{self.scope_key}>"
+
+class TrainingJobRecord(Base):
+    __tablename__ = "training_jobs"
+    
+    job_id = Column(String(32), primary_key=True)
+    kind = Column(String(50), nullable=False, index=True)
+    # Bằng kind khi job đang chờ/chạy, NULL khi đã kết thúc: khóa duy nhất để mọi worker
+    # chỉ có tối đa một job đang chạy cho mỗi loại
+    active_kind = Column(String(50), unique=True, nullable=True)
+    options = Column(JSON, nullable=True)
+    status = Column(Enum('pending', 'running', 'completed', 'failed'), nullable=False, default='pending')
+    progress = Column(Integer, nullable=False, default=0)
+    stage = Column(String(50), nullable=False, default='queued')
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(TIMESTAMP, nullable=False, index=True)
+    started_at = Column(TIMESTAMP, nullable=True)
+    finished_at = Column(TIMESTAMP, nullable=True)
+    # Nhịp sống do worker sở hữu job cập nhật; job đang chạy quá lâu không cập nhật coi như bị bỏ dở
+    heartbeat_at = Column(TIMESTAMP, nullable=False)
+    
+    def __repr__(self):
+        return f"<TrainingJobRecord {self.kind}:{self.job_id} {self.status}>"
@@ -53,9 +53,8 @@ class AttendanceResponse(BaseModel):
     class Config:
         from_attributes = True
 
-# Schema for attendance summary
-class AttendanceSummary(BaseModel):
-    student_id: int
+# Attendance counts by status
+class AttendanceStatusCounts(BaseModel):
     total_classes: int
     present_count: int
     absent_count: int
@@ -63,6 +62,30 @@ class AttendanceSummary(BaseModel):
     excused_count: int
     attendance_rate: float  # percentage
 
+# Schema for attendance summary
+class AttendanceSummary(AttendanceStatusCounts):
+    student_id: int
+
+# Per-student row of an attendance report
+class StudentAttendanceSummary(AttendanceSummary):
+    student_code: Optional[str] = None
+    student_name: Optional[str] = None
+
+# Per-week row of an attendance report (week starts on Monday)
+class WeeklyAttendanceSummary(AttendanceStatusCounts):
+    week_start: date
+    week_end: date
+
+# Schema for class / date range attendance reports
+class AttendanceReport(BaseModel):
+    class_id: Optional[int] = None
+    class_name: Optional[str] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    totals: AttendanceStatusCounts
+    students: List[StudentAttendanceSummary]
+    weeks: List[WeeklyAttendanceSummary]
+
 # Schema for bulk attendance creation
 class BulkAttendanceCreate(BaseModel):
     class_id: int
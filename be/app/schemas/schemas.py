@@ -466,10 +466,11 @@ class SearchParams(BaseModel):
     
 class PaginatedResponse(BaseModel):
     items: List[Any] = []
-    total: int
-    page: int
+    total: Optional[int] = None
+    page: Optional[int] = None
     size: int
-    pages: int
+    pages: Optional[int] = None
+    next_cursor: Optional[str] = None
 
 # ----- Response Models -----
 class MessageResponse(BaseModel):
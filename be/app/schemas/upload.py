@@ -1,5 +1,5 @@
 from pydantic import BaseModel, HttpUrl
-from typing import Optional, List
+from typing import Optional, List, Dict
 
 class FileUploadResponse(BaseModel):
     filename: str
@@ -9,7 +9,9 @@ class FileUploadResponse(BaseModel):
 
 class ImageUploadResponse(FileUploadResponse):
     url: str
+    thumbnail_url: Optional[str] = None
+    variants: Dict[str, str] = {}  # tên phiên bản (thumb, medium) -> URL ảnh WebP thu nhỏ
 
 class BulkUploadResponse(BaseModel):
-    uploaded_files: List[FileUploadResponse]
+    uploaded_files: List[ImageUploadResponse]
     failed_files: List[str] = []
@@ -12,6 +12,8 @@ from app.core.security import verify_password
 from app.crud.user import get_user_by_username
 from app.db.database import get_db
 from app.models.models import User
+from app.services.last_login import last_login_recorder
+from app.services.principal_cache import Principal, resolve_principal, attach_user
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
 
@@ -61,17 +63,37 @@ async def get_current_user(
     except (JWTError, ValidationError):
         raise credentials_exception
     
-    user = get_user_by_username(db, username=token_data.username)
-    print(user)
-    if user is None:
+    # Principal được cache theo username, phần lớn request không truy vấn bảng users
+    principal = resolve_principal(db, token_data.username)
+    if principal is None:
         raise credentials_exception
+    user = attach_user(db, principal)
     
-    # Update last login
-    user.last_login = datetime.utcnow()
-    db.commit()
+    # Ghi nhận last_login qua bộ đệm, xác thực không ghi vào database
+    last_login_recorder.record(user)
     
     return user
 
+def get_user_principal(db: Session, user: User) -> Optional[Principal]:
+    """
+    Principal (kèm teacher_id/student_id) của user, lấy từ cache nếu có
+    """
+    return resolve_principal(db, user.username)
+
+def get_current_teacher_id(db: Session, user: User) -> Optional[int]:
+    """
+    teacher_id của user hiện tại (None nếu không có hồ sơ giáo viên)
+    """
+    principal = get_user_principal(db, user)
+    return principal.teacher_id if principal else None
+
+def get_current_student_id(db: Session, user: User) -> Optional[int]:
+    """
+    student_id của user hiện tại (None nếu không có hồ sơ sinh viên)
+    """
+    principal = get_user_principal(db, user)
+    return principal.student_id if principal else None
+
 async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
     """
     Kiểm tra user có active không
@@ -83,6 +105,23 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
         )
     return current_user
 
+async def get_current_principal(
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+) -> Principal:
+    """
+    Principal của user hiện tại cho các endpoint dùng async session
+    (đã được get_current_user đưa vào cache nên thường không truy vấn database)
+    """
+    principal = get_user_principal(db, current_user)
+    if principal is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return principal
+
 async def check_admin_role(current_user: User = Depends(get_current_active_user)) -> User:
     """
     Kiểm tra user có phải admin không
@@ -0,0 +1,488 @@
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Any, Callable, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.models.models import Student, Class, ClassStudent, Grade, DisciplinaryRecord, DropoutRisk
+from app.models.attendance import Attendance
+from app.crud.campus_rollup import (
+    SCOPE_CAMPUS, CAMPUS_KEY, ATTENDANCE_COUNTERS, OPEN_DISCIPLINARY_STATUSES,
+    risk_bucket, student_contribution, get_class_scopes, get_enrolled_class_ids,
+    get_latest_risks, get_open_disciplinary_counts, get_rollup_generation, apply_rollup_deltas,
+    rebuild_campus_rollups
+)
+
+CAMPUS_SCOPE = (SCOPE_CAMPUS, CAMPUS_KEY)
+
+# Execution option cho các câu lệnh hàng loạt đã tự áp dụng phần chênh lệch vào rollup
+ROLLUPS_APPLIED = "campus_rollups_applied"
+
+# Khóa trong session.info: phần chênh lệch chờ áp dụng sau commit và thế hệ rollup đọc trước commit
+PENDING_DELTAS = "campus_rollup_deltas"
+PENDING_GENERATION = "campus_rollup_generation"
+
+_TRACKED_MODELS = (Student, Class, ClassStudent, Grade, DisciplinaryRecord, DropoutRisk, Attendance)
+_TRACKED_TABLES = {model.__tablename__ for model in _TRACKED_MODELS}
+
+
+def _old_new(obj, attribute: str) -> Tuple[Any, Any]:
+    """
+    Giá trị trước và sau thay đổi của một thuộc tính trong lần flush hiện tại
+    """
+    history = inspect(obj).attrs[attribute].history
+    new = getattr(obj, attribute)
+    old = history.deleted[0] if history.deleted else new
+    return old, new
+
+
+class RollupDeltaBuilder:
+    """
+    Tính phần thay đổi của các dòng rollup từ những đối tượng sắp được flush.
+
+    - Điểm danh/điểm số: cộng trừ vào lớp, khoa, năm học của lớp và toàn trường.
+    - Nguy cơ bỏ học, kỷ luật đang mở, ghi danh: tính đóng góp của sinh viên trước và sau
+      thay đổi, trừ khỏi các dòng cũ và cộng vào các dòng mới (mỗi sinh viên tính một lần mỗi dòng).
+    Thay đổi cấu trúc (lớp mới/xóa/đổi khoa, xóa sinh viên) không tính được phần chênh lệch,
+    khi đó đánh dấu cần dựng lại toàn bộ.
+    """
+
+    def __init__(self, session: Session):
+        self.session = session
+        self.deltas: Dict[Tuple[str, str], Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self.structural = False
+        self._class_records = []
+        self._membership_changes = defaultdict(list)
+        self._open_changes = defaultdict(int)
+        self._new_risks: Dict[int, float] = {}
+        self._changed_risks: Dict[int, Tuple[int, float]] = {}
+
+    def build(self) -> bool:
+        """
+        Trả về True nếu có phần thay đổi cần áp dụng
+        """
+        session = self.session
+        for obj in session.new:
+            self._collect(obj, "new")
+        for obj in session.dirty:
+            if session.is_modified(obj, include_collections=False):
+                self._collect(obj, "dirty")
+        for obj in session.deleted:
+            self._collect(obj, "deleted")
+
+        if self.structural:
+            return False
+        self._apply_class_records()
+        self.apply_student_changes()
+        return any(any(changes.values()) for changes in self.deltas.values())
+
+    def _collect(self, obj, state: str) -> None:
+        if isinstance(obj, Attendance):
+            # status mặc định là 'present' khi tạo mới
+            self._collect_record(obj, state, "class_id", lambda status: (
+                {ATTENDANCE_COUNTERS[status or "present"]: 1} if (status or "present") in ATTENDANCE_COUNTERS else {}
+            ), "status")
+        elif isinstance(obj, Grade):
+            self._collect_record(obj, state, "class_id", lambda gpa: (
+                {"graded_count": 1, "gpa_sum": float(gpa)} if gpa is not None else {}
+            ), "gpa")
+        elif isinstance(obj, DisciplinaryRecord):
+            self._collect_disciplinary(obj, state)
+        elif isinstance(obj, DropoutRisk):
+            self._collect_risk(obj, state)
+        elif isinstance(obj, ClassStudent):
+            self._collect_enrollment(obj, state)
+        elif isinstance(obj, Student):
+            if state == "new":
+                self.deltas[CAMPUS_SCOPE]["total_students"] += 1
+            elif state == "deleted":
+                # Điểm danh, điểm số... bị xóa theo ON DELETE CASCADE mà ORM không thấy
+                self.structural = True
+        elif isinstance(obj, Class):
+            if state != "dirty":
+                self.structural = True
+            else:
+                for attribute in ("department", "academic_year"):
+                    old, new = _old_new(obj, attribute)
+                    if old != new:
+                        self.structural = True
+
+    def _collect_record(self, obj, state: str, class_attribute: str, contribution: Callable, value_attribute: str) -> None:
+        if state == "new":
+            self._class_records.append((getattr(obj, class_attribute), contribution(getattr(obj, value_attribute)), 1))
+        elif state == "deleted":
+            self._class_records.append((getattr(obj, class_attribute), contribution(getattr(obj, value_attribute)), -1))
+        else:
+            old_class, new_class = _old_new(obj, class_attribute)
+            old_value, new_value = _old_new(obj, value_attribute)
+            if old_class != new_class or old_value != new_value:
+                self._class_records.append((old_class, contribution(old_value), -1))
+                self._class_records.append((new_class, contribution(new_value), 1))
+
+    def _collect_disciplinary(self, obj: DisciplinaryRecord, state: str) -> None:
+        def is_open(status) -> int:
+            # resolution_status mặc định là 'open' khi tạo mới
+            return 1 if status is None or status in OPEN_DISCIPLINARY_STATUSES else 0
+
+        if state == "new":
+            self._open_changes[obj.student_id] += is_open(obj.resolution_status)
+        elif state == "deleted":
+            self._open_changes[obj.student_id] -= is_open(obj.resolution_status)
+        else:
+            old_student, new_student = _old_new(obj, "student_id")
+            old_status, new_status = _old_new(obj, "resolution_status")
+            self._open_changes[old_student] -= is_open(old_status)
+            self._open_changes[new_student] += is_open(new_status)
+
+    def _collect_risk(self, obj: DropoutRisk, state: str) -> None:
+        if state == "new":
+            # Đánh giá mới có risk_id lớn nhất nên trở thành đánh giá mới nhất của sinh viên
+            self._new_risks[obj.student_id] = obj.risk_percentage
+        elif state == "deleted":
+            self.structural = True
+        else:
+            old_student, new_student = _old_new(obj, "student_id")
+            if old_student != new_student:
+                self.structural = True
+            else:
+                self._changed_risks[obj.student_id] = (obj.risk_id, obj.risk_percentage)
+
+    def _collect_enrollment(self, obj: ClassStudent, state: str) -> None:
+        if state == "new":
+            if obj.status in (None, "enrolled"):
+                self._membership_changes[obj.student_id].append((obj.class_id, 1))
+        elif state == "deleted":
+            if obj.status == "enrolled":
+                self._membership_changes[obj.student_id].append((obj.class_id, -1))
+        else:
+            old_status, new_status = _old_new(obj, "status")
+            if old_status != new_status:
+                if old_status == "enrolled":
+                    self._membership_changes[obj.student_id].append((obj.class_id, -1))
+                elif new_status == "enrolled":
+                    self._membership_changes[obj.student_id].append((obj.class_id, 1))
+
+    def _apply_class_records(self) -> None:
+        if not self._class_records:
+            return
+        if any(class_id is None for class_id, _, _ in self._class_records):
+            self.structural = True
+            return
+        scopes_by_class = get_class_scopes(self.session, [class_id for class_id, _, _ in self._class_records])
+        for class_id, contribution, sign in self._class_records:
+            for scope in [CAMPUS_SCOPE, *scopes_by_class.get(class_id, [])]:
+                for counter, value in contribution.items():
+                    self.deltas[scope][counter] += sign * value
+
+    def add_membership_change(self, student_id: int, class_id: int, sign: int) -> None:
+        """
+        Sinh viên vào lớp (sign=1) hoặc rời lớp (sign=-1) qua câu lệnh ghi hàng loạt
+        """
+        self._membership_changes[student_id].append((class_id, sign))
+
+    def add_new_risk(self, student_id: int, risk_percentage: float) -> None:
+        """
+        Đánh giá nguy cơ mới ghi qua câu lệnh hàng loạt; đánh giá thêm sau cùng trở thành mới nhất
+        """
+        self._new_risks[student_id] = risk_percentage
+
+    def apply_student_changes(self) -> None:
+        """
+        Tính phần chênh lệch của các chỉ số theo sinh viên (nhóm nguy cơ, kỷ luật đang mở, ghi danh)
+        """
+        student_ids = (
+            {student_id for student_id, change in self._open_changes.items() if change}
+            | set(self._new_risks) | set(self._changed_risks) | set(self._membership_changes)
+        )
+        if not student_ids:
+            return
+        if None in student_ids:
+            self.structural = True
+            return
+
+        session = self.session
+        enrolled = get_enrolled_class_ids(session, student_ids)
+        latest_risks = get_latest_risks(session, student_ids)
+        open_counts = get_open_disciplinary_counts(session, student_ids)
+
+        class_ids = set()
+        for student_id in student_ids:
+            class_ids.update(enrolled.get(student_id, ()))
+            class_ids.update(class_id for class_id, _ in self._membership_changes.get(student_id, ()))
+        scopes_by_class = get_class_scopes(session, class_ids)
+
+        def scopes_of(classes: Set[int]) -> Set[Tuple[str, str]]:
+            scopes = {CAMPUS_SCOPE}
+            for class_id in classes:
+                scopes.update(scopes_by_class.get(class_id, []))
+            return scopes
+
+        for student_id in student_ids:
+            latest_id, latest_risk = latest_risks.get(student_id, (None, None))
+            old_bucket = risk_bucket(latest_risk)
+            new_bucket = old_bucket
+            if student_id in self._new_risks:
+                new_bucket = risk_bucket(self._new_risks[student_id])
+            elif student_id in self._changed_risks:
+                risk_id, risk_percentage = self._changed_risks[student_id]
+                if risk_id == latest_id:
+                    new_bucket = risk_bucket(risk_percentage)
+
+            old_open = open_counts.get(student_id, 0)
+            new_open = old_open + self._open_changes.get(student_id, 0)
+
+            old_classes = set(enrolled.get(student_id, ()))
+            new_classes = set(old_classes)
+            for class_id, sign in self._membership_changes.get(student_id, ()):
+                if sign > 0:
+                    new_classes.add(class_id)
+                else:
+                    new_classes.discard(class_id)
+
+            for scope in scopes_of(old_classes):
+                for counter, value in student_contribution(old_bucket, old_open).items():
+                    self.deltas[scope][counter] -= value
+            for scope in scopes_of(new_classes):
+                for counter, value in student_contribution(new_bucket, new_open).items():
+                    self.deltas[scope][counter] += value
+
+
+def queue_rollup_deltas(session: Session, deltas: Dict[Tuple[str, str], Dict[str, float]]) -> None:
+    """
+    Cộng phần chênh lệch vào hàng đợi của session. Phần chênh lệch được áp dụng trong một giao dịch
+    ngắn riêng sau commit, để các giao dịch ghi không giữ khóa dòng rollup (nhất là dòng toàn trường)
+    cho đến khi commit.
+    """
+    pending = session.info.setdefault(PENDING_DELTAS, defaultdict(lambda: defaultdict(float)))
+    for scope, changes in deltas.items():
+        for counter, value in changes.items():
+            if value:
+                pending[scope][counter] += value
+
+
+def apply_attendance_changes(session: Session, class_id: int, changes: Iterable[Tuple[Optional[str], Optional[str]]]) -> None:
+    """
+    Áp dụng thay đổi trạng thái điểm danh (trạng thái cũ, trạng thái mới) của một lớp vào rollup,
+    dùng cho các câu lệnh ghi hàng loạt không đi qua flush. Trạng thái cũ None là bản ghi mới.
+    """
+    if session.info.get("campus_rollups_stale"):
+        return
+    counters = defaultdict(int)
+    for old_status, new_status in changes:
+        if old_status == new_status:
+            continue
+        if old_status in ATTENDANCE_COUNTERS:
+            counters[ATTENDANCE_COUNTERS[old_status]] -= 1
+        if new_status in ATTENDANCE_COUNTERS:
+            counters[ATTENDANCE_COUNTERS[new_status]] += 1
+    if not any(counters.values()):
+        return
+    try:
+        scopes = [CAMPUS_SCOPE, *get_class_scopes(session, [class_id]).get(class_id, [])]
+        queue_rollup_deltas(session, {scope: counters for scope in scopes})
+    except Exception as e:
+        print(f"Error updating campus rollups: {e}")
+        session.info["campus_rollups_stale"] = True
+
+
+def _apply_student_builder(session: Session, builder: RollupDeltaBuilder) -> None:
+    try:
+        builder.apply_student_changes()
+        if builder.structural:
+            session.info["campus_rollups_stale"] = True
+        else:
+            queue_rollup_deltas(session, builder.deltas)
+    except Exception as e:
+        print(f"Error updating campus rollups: {e}")
+        session.info["campus_rollups_stale"] = True
+
+
+def apply_enrollment_changes(session: Session, class_id: int, enrolled_ids: Iterable[int], sign: int = 1) -> None:
+    """
+    Áp dụng việc ghi danh (sign=1) hoặc rời lớp (sign=-1) của nhiều sinh viên vào rollup,
+    dùng cho các câu lệnh ghi hàng loạt. Phải gọi trước khi ghi để đọc được lớp hiện tại của sinh viên.
+    """
+    if session.info.get("campus_rollups_stale"):
+        return
+    builder = RollupDeltaBuilder(session)
+    for student_id in enrolled_ids:
+        builder.add_membership_change(student_id, class_id, sign)
+    _apply_student_builder(session, builder)
+
+
+def apply_new_risk_changes(session: Session, risks: Iterable[Tuple[int, float]]) -> None:
+    """
+    Áp dụng các đánh giá nguy cơ mới (student_id, risk_percentage) vào rollup,
+    dùng cho câu lệnh INSERT hàng loạt. Phải gọi trước khi ghi để đọc được đánh giá mới nhất hiện tại.
+    """
+    if session.info.get("campus_rollups_stale"):
+        return
+    builder = RollupDeltaBuilder(session)
+    for student_id, risk_percentage in risks:
+        builder.add_new_risk(student_id, risk_percentage)
+    _apply_student_builder(session, builder)
+
+
+@event.listens_for(Session, "before_flush")
+def _queue_flush_deltas(session, flush_context, instances):
+    if session.info.get("campus_rollups_stale"):
+        # Đã cần dựng lại trong giao dịch này, không cần tính phần chênh lệch
+        return
+    if not any(
+        isinstance(obj, _TRACKED_MODELS)
+        for obj in (*session.new, *session.dirty, *session.deleted)
+    ):
+        return
+    try:
+        with session.no_autoflush:
+            builder = RollupDeltaBuilder(session)
+            has_changes = builder.build()
+            if builder.structural:
+                session.info["campus_rollups_stale"] = True
+            elif has_changes:
+                queue_rollup_deltas(session, builder.deltas)
+    except Exception as e:
+        print(f"Error updating campus rollups: {e}")
+        session.info["campus_rollups_stale"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_bulk_writes(orm_execute_state):
+    # query.update()/delete() theo ORM không đi qua flush nên không tính được phần chênh lệch,
+    # trừ khi câu lệnh đã tự cập nhật rollup (execution option ROLLUPS_APPLIED)
+    if orm_execute_state.execution_options.get(ROLLUPS_APPLIED):
+        return
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.local_table.name in _TRACKED_TABLES:
+            orm_execute_state.session.info["campus_rollups_stale"] = True
+
+
+@event.listens_for(Session, "before_commit")
+def _read_generation_before_commit(session):
+    # commit() chỉ flush sau sự kiện này: flush trước để phần chênh lệch của lần flush cuối đã vào hàng đợi
+    session.flush()
+    if session.info.get("campus_rollups_stale") or not session.info.get(PENDING_DELTAS):
+        return
+    try:
+        # Khóa chia sẻ: lần dựng lại chưa commit được chờ; lần dựng lại sau commit này
+        # sẽ tăng thế hệ và đã gồm các thay đổi của giao dịch
+        generation = get_rollup_generation(session, lock=True)
+    except Exception as e:
+        print(f"Error reading campus rollup generation: {e}")
+        generation = None
+    if generation is None:
+        session.info["campus_rollups_stale"] = True
+    else:
+        session.info[PENDING_GENERATION] = generation
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_deltas_after_commit(session):
+    deltas = session.info.pop(PENDING_DELTAS, None)
+    generation = session.info.pop(PENDING_GENERATION, None)
+    if session.info.pop("campus_rollups_stale", False):
+        rollup_refresher.schedule()
+        return
+    if not deltas or generation is None:
+        return
+    try:
+        # Giao dịch ngắn riêng: khóa dòng rollup chỉ trong thời gian cập nhật
+        with session.get_bind().begin() as connection:
+            complete = apply_rollup_deltas(connection, deltas, generation)
+            if not complete and get_rollup_generation(connection) != generation:
+                # Đã dựng lại sau commit, bản dựng lại đã gồm các thay đổi này
+                complete = True
+    except Exception as e:
+        print(f"Error updating campus rollups: {e}")
+        complete = False
+    if not complete:
+        # Chưa có dòng rollup tương ứng (khoa/năm học mới) hoặc cập nhật lỗi
+        rollup_refresher.schedule()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_after_rollback(session, previous_transaction):
+    if previous_transaction.nested:
+        # Không biết phần chênh lệch nào thuộc savepoint vừa bị hủy: dựng lại sau commit
+        if session.info.get(PENDING_DELTAS):
+            session.info["campus_rollups_stale"] = True
+        return
+    session.info.pop("campus_rollups_stale", None)
+    session.info.pop(PENDING_DELTAS, None)
+    session.info.pop(PENDING_GENERATION, None)
+
+
+class RollupRefresher:
+    """
+    Dựng lại bảng rollup trong thread nền: sau thay đổi không tính được phần chênh lệch
+    và định kỳ (CAMPUS_ROLLUP_RECOMPUTE_INTERVAL) để đối soát sai lệch
+    """
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal, interval: Optional[float] = None):
+        self.session_factory = session_factory
+        self.interval = settings.CAMPUS_ROLLUP_RECOMPUTE_INTERVAL if interval is None else interval
+        self._lock = threading.Lock()
+        self._running = False
+        self._pending = False
+        self.last_rebuilt_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def schedule(self) -> None:
+        with self._lock:
+            if self._running:
+                # Dựng lại thêm một lần sau lần đang chạy để nhận thay đổi mới
+                self._pending = True
+                return
+            self._running = True
+        threading.Thread(target=self._run, name="campus-rollups", daemon=True).start()
+
+    def maybe_refresh(self, computed_at: Optional[datetime]) -> None:
+        """
+        Lên lịch dựng lại nếu dữ liệu rollup cũ hơn chu kỳ tính lại
+        """
+        if not self.interval:
+            return
+        if computed_at is None or (datetime.now() - computed_at).total_seconds() > self.interval:
+            self.schedule()
+
+    def rebuild(self) -> int:
+        db = self.session_factory()
+        try:
+            return rebuild_campus_rollups(db)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.rebuild()
+                self.last_rebuilt_at = time.time()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Error rebuilding campus rollups: {e}")
+            with self._lock:
+                if not self._pending:
+                    self._running = False
+                    return
+                self._pending = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._running,
+            "interval_seconds": self.interval,
+            "last_rebuilt_at": datetime.fromtimestamp(self.last_rebuilt_at).isoformat() if self.last_rebuilt_at else None,
+            "last_error": self.last_error
+        }
+
+
+rollup_refresher = RollupRefresher()
@@ -0,0 +1,315 @@
+from typing import Dict, List, Any, Optional, Tuple
+from sqlalchemy.orm import Session, joinedload
+from datetime import datetime, timedelta
+import numpy as np
+
+from app.core.config import settings
+from app.models.models import User, Class, Student, ClassStudent, Teacher, ClassRiskAnalytics
+from app.services.dropout_risk_ml_service_fixed import MLDropoutRiskPredictionService
+
+# Ánh xạ các yếu tố kỹ thuật thành các yếu tố dễ hiểu
+FACTOR_MAPPING = {
+    "low_gpa": "Điểm số thấp",
+    "poor_attendance": "Điểm danh kém",
+    "disciplinary_issues": "Vấn đề kỷ luật",
+    "financial_issues": "Khó khăn kinh tế",
+    "failed_subjects": "Môn học F",
+    "academic_warning": "Cảnh báo học tập",
+    "dropped_classes": "Lịch sử bỏ lớp",
+    "declining_performance": "Hiệu suất giảm sút",
+    "attendance_trend": "Xu hướng điểm danh giảm"
+}
+
+RISK_LABELS = ["Rủi ro thấp", "Rủi ro trung bình", "Rủi ro cao"]
+RISK_COLORS = ["#10b981", "#f59e0b", "#ef4444"]
+
+# Ngưỡng phân loại nguy cơ (%)
+HIGH_RISK_THRESHOLD = 75
+MEDIUM_RISK_THRESHOLD = 50
+
+
+class ClassRiskAnalyticsService:
+    """
+    Phân tích nguy cơ bỏ học theo lớp: dự đoán theo lô cho toàn bộ danh sách lớp,
+    tổng hợp bằng mảng NumPy và lưu sẵn kết quả để endpoint chỉ cần một lần đọc
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.ml_service = MLDropoutRiskPredictionService(db)
+
+    def get_class_analytics(self, class_obj: Class, ml_details: bool = True, refresh: bool = False) -> Dict[str, Any]:
+        """
+        Lấy phân tích của một lớp từ bảng lưu sẵn, tính lại nếu chưa có, đã cũ hoặc refresh=True
+        """
+        if not refresh:
+            try:
+                stored = self.db.query(ClassRiskAnalytics).filter(
+                    ClassRiskAnalytics.class_id == class_obj.class_id
+                ).first()
+            except Exception as e:
+                print(f"Error reading stored class analytics: {e}")
+                self.db.rollback()
+                stored = None
+            max_age = timedelta(seconds=settings.CLASS_ANALYTICS_MAX_AGE)
+            if stored and stored.computed_at and datetime.now() - stored.computed_at <= max_age:
+                return stored.ml_analytics if ml_details else stored.analytics
+
+        analytics, ml_analytics = self.compute_analytics([class_obj])[class_obj.class_id]
+        try:
+            self._store({class_obj.class_id: (analytics, ml_analytics)})
+        except Exception as e:
+            print(f"Error storing class analytics: {e}")
+            self.db.rollback()
+        return ml_analytics if ml_details else analytics
+
+    def precompute_all(self) -> int:
+        """
+        Tính trước và lưu phân tích cho tất cả các lớp với một lần dự đoán theo lô
+        """
+        classes = self.db.query(Class).options(
+            joinedload(Class.teacher).joinedload(Teacher.user)
+        ).order_by(Class.class_id).all()
+        if not classes:
+            return 0
+
+        payloads = self.compute_analytics(classes)
+        self._store(payloads)
+        return len(payloads)
+
+    def compute_analytics(self, classes: List[Class]) -> Dict[int, Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """
+        Tính phân tích cơ bản và phân tích ML chi tiết cho các lớp
+
+        Returns:
+            Dict class_id -> (analytics, ml_analytics)
+        """
+        class_ids = [class_obj.class_id for class_obj in classes]
+
+        # Danh sách sinh viên đang học của các lớp trong một truy vấn
+        roster_rows = self.db.query(
+            ClassStudent.class_id,
+            Student.student_id,
+            Student.student_code,
+            User.full_name
+        ).join(
+            Student, Student.student_id == ClassStudent.student_id
+        ).outerjoin(
+            User, User.user_id == Student.user_id
+        ).filter(
+            ClassStudent.class_id.in_(class_ids),
+            ClassStudent.status == "enrolled"
+        ).order_by(ClassStudent.class_id, Student.student_id).all()
+
+        rosters: Dict[int, List[Tuple[int, str, Optional[str]]]] = {class_id: [] for class_id in class_ids}
+        for class_id, student_id, student_code, full_name in roster_rows:
+            rosters[class_id].append((student_id, student_code, full_name))
+
+        # Một lần trích xuất đặc trưng và suy luận vector hóa cho tất cả sinh viên
+        student_ids = list(dict.fromkeys(row[1] for row in roster_rows))
+        predictions = {}
+        if student_ids:
+            for result in self.ml_service.predict_students_bulk(student_ids):
+                predictions[result["student_id"]] = result
+
+        feature_importance = self._get_feature_importance() if predictions else []
+
+        payloads = {}
+        for class_obj in classes:
+            roster = rosters[class_obj.class_id]
+            if roster:
+                ml_analytics = self._build_ml_analytics(class_obj, roster, predictions, feature_importance)
+            else:
+                ml_analytics = self._empty_ml_analytics(class_obj)
+            payloads[class_obj.class_id] = (self._to_basic_analytics(ml_analytics), ml_analytics)
+        return payloads
+
+    def _get_feature_importance(self) -> List[Dict[str, Any]]:
+        """
+        Độ quan trọng đặc trưng (giống nhau cho mọi sinh viên) lấy trực tiếp từ Random Forest, top 10
+        """
+        if self.ml_service.rf_model is None:
+            return []
+        importances = np.asarray(self.ml_service.rf_model.feature_importances_, dtype=float)
+        order = np.argsort(-importances, kind="stable")[:10]
+        return [
+            {
+                "feature": self.ml_service.feature_names[i],
+                "importance": float(importances[i]),
+                "displayName": self.ml_service.feature_names[i].replace('_', ' ').title()
+            }
+            for i in order
+        ]
+
+    def _build_ml_analytics(
+        self,
+        class_obj: Class,
+        roster: List[Tuple[int, str, Optional[str]]],
+        predictions: Dict[int, Dict[str, Any]],
+        feature_importance: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        predicted = [(student, predictions[student[0]]) for student in roster if student[0] in predictions]
+        risks = np.array([result["risk_percentage"] for _, result in predicted], dtype=float)
+
+        high_mask = risks >= HIGH_RISK_THRESHOLD
+        medium_mask = (risks >= MEDIUM_RISK_THRESHOLD) & ~high_mask
+        high_risk_count = int(high_mask.sum())
+        medium_risk_count = int(medium_mask.sum())
+        low_risk_count = len(risks) - high_risk_count - medium_risk_count
+        avg_risk = float(risks.sum()) / len(roster)
+
+        high_risk_students = []
+        for index in np.flatnonzero(high_mask):
+            (student_id, student_code, full_name), result = predicted[index]
+            risk_percentage = result["risk_percentage"]
+            main_factors = [
+                FACTOR_MAPPING[factor]
+                for factor, is_active in result["risk_factors"].items()
+                if isinstance(is_active, bool) and is_active and factor in FACTOR_MAPPING
+            ] or ["Nguy cơ chung"]
+
+            high_risk_students.append({
+                "id": student_id,
+                "name": full_name or "N/A",
+                "studentId": student_code,
+                "riskScore": int(risk_percentage),
+                "mainFactors": ", ".join(main_factors[:3]),
+                "modelConfidence": float(result["prediction_details"]["ensemble"]["probability"]),
+                "detailedAnalysis": {
+                    "rf_probability": float(result["prediction_details"]["random_forest"]["probability"]),
+                    "lr_probability": float(result["prediction_details"]["logistic_regression"]["probability"]),
+                    "key_features": [
+                        {
+                            "name": name,
+                            "value": analysis["value"],
+                            "importance": float(analysis["importance"]),
+                            "interpretation": analysis["interpretation"]
+                        }
+                        for name, analysis in result.get("feature_analysis", {}).items()
+                    ][:5]  # Top 5 đặc trưng quan trọng nhất
+                }
+            })
+        high_risk_students.sort(key=lambda x: x["riskScore"], reverse=True)
+
+        def has_factor(*names: str) -> bool:
+            return any(any(name in s["mainFactors"] for name in names) for s in high_risk_students)
+
+        return {
+            "className": class_obj.class_name,
+            "classId": class_obj.class_id,
+            "teacherName": self._teacher_name(class_obj),
+            "summary": {
+                "totalStudents": len(roster),
+                "lowRisk": low_risk_count,
+                "mediumRisk": medium_risk_count,
+                "highRisk": high_risk_count,
+                "avgRiskPercentage": round(avg_risk, 1)
+            },
+            "mlModelInfo": {
+                "modelType": "Hybrid ML (Random Forest 60%, Logistic Regression 40%)",
+                "algorithms": ["Random Forest", "Logistic Regression"],
+                "lastTraining": datetime.now().strftime("%Y-%m-%d"),
+                "modelVersion": self.ml_service.model_version,
+                "metrics": {}
+            },
+            "riskDistribution": self._risk_distribution(low_risk_count, medium_risk_count, high_risk_count),
+            "featureImportance": feature_importance if predicted else [],
+            "highRiskStudents": high_risk_students,
+            "recommendations": [
+                {
+                    "title": "Theo dõi điểm danh chặt chẽ",
+                    "description": "Điểm danh là một trong những chỉ báo sớm nhất về nguy cơ bỏ học. Cần theo dõi chặt chẽ và liên hệ ngay với sinh viên có tỷ lệ vắng mặt cao.",
+                    "category": "attendance",
+                    "priority": "high" if has_factor("Điểm danh kém") else "medium"
+                },
+                {
+                    "title": "Hỗ trợ học tập",
+                    "description": "Tổ chức các buổi học bổ sung hoặc kèm cặp cho các sinh viên có điểm thấp, đặc biệt là các sinh viên đã được xác định có nguy cơ bỏ học cao.",
+                    "category": "academic",
+                    "priority": "high" if has_factor("Điểm số thấp", "Môn học F") else "medium"
+                },
+                {
+                    "title": "Tư vấn tài chính",
+                    "description": "Một số sinh viên có nguy cơ bỏ học do khó khăn tài chính. Cần tư vấn về các chương trình học bổng, hỗ trợ tài chính có thể giúp họ tiếp tục việc học.",
+                    "category": "financial",
+                    "priority": "medium" if has_factor("Khó khăn kinh tế") else "low"
+                }
+            ]
+        }
+
+    def _empty_ml_analytics(self, class_obj: Class) -> Dict[str, Any]:
+        return {
+            "className": class_obj.class_name,
+            "classId": class_obj.class_id,
+            "teacherName": self._teacher_name(class_obj),
+            "summary": {
+                "totalStudents": 0,
+                "lowRisk": 0,
+                "mediumRisk": 0,
+                "highRisk": 0,
+                "avgRiskPercentage": 0
+            },
+            "mlModelInfo": {
+                "modelType": "Hybrid ML",
+                "algorithms": ["Random Forest", "Logistic Regression"],
+                "lastTraining": None
+            },
+            "riskDistribution": self._risk_distribution(0, 0, 0),
+            "featureImportance": [],
+            "highRiskStudents": []
+        }
+
+    def _to_basic_analytics(self, ml_analytics: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Phân tích cơ bản là tập con của phân tích ML (không có chi tiết mô hình)
+        """
+        return {
+            "className": ml_analytics["className"],
+            "classId": ml_analytics["classId"],
+            "teacherName": ml_analytics["teacherName"],
+            "summary": ml_analytics["summary"],
+            "riskDistribution": ml_analytics["riskDistribution"],
+            "highRiskStudents": [
+                {key: s[key] for key in ("id", "name", "studentId", "riskScore", "mainFactors")}
+                for s in ml_analytics["highRiskStudents"]
+            ]
+        }
+
+    def _risk_distribution(self, low: int, medium: int, high: int) -> Dict[str, Any]:
+        return {
+            "labels": RISK_LABELS,
+            "datasets": [{
+                "data": [low, medium, high],
+                "backgroundColor": RISK_COLORS,
+                "borderColor": RISK_COLORS
+            }]
+        }
+
+    def _teacher_name(self, class_obj: Class) -> str:
+        return f"{class_obj.teacher.user.full_name}" if class_obj.teacher and class_obj.teacher.user else "N/A"
+
+    def _store(self, payloads: Dict[int, Tuple[Dict[str, Any], Dict[str, Any]]]) -> None:
+        """
+        Lưu (upsert) kết quả phân tích cho các lớp trong một transaction
+        """
+        computed_at = datetime.now()
+        existing = {
+            row.class_id: row
+            for row in self.db.query(ClassRiskAnalytics).filter(
+                ClassRiskAnalytics.class_id.in_(list(payloads.keys()))
+            ).all()
+        }
+        for class_id, (analytics, ml_analytics) in payloads.items():
+            row = existing.get(class_id)
+            if row is None:
+                self.db.add(ClassRiskAnalytics(
+                    class_id=class_id,
+                    analytics=analytics,
+                    ml_analytics=ml_analytics,
+                    computed_at=computed_at
+                ))
+            else:
+                row.analytics = analytics
+                row.ml_analytics = ml_analytics
+                row.computed_at = computed_at
+        self.db.commit()
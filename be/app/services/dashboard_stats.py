@@ -0,0 +1,331 @@
+import copy
+import threading
+from typing import Dict, Any, Optional, Set
+
+from sqlalchemy import event, func, case, select, and_, or_
+from sqlalchemy.orm import Session, joinedload
+
+from app.core.config import settings
+from app.models.models import (
+    Student, Class, Teacher, Grade, DisciplinaryRecord,
+    DropoutRisk, ClassStudent, ClassSubject, Subject
+)
+from app.models.attendance import Attendance
+from app.crud.campus_rollup import HIGH_RISK_THRESHOLD, get_campus_rollup
+from app.services.campus_rollups import rollup_refresher
+from app.utils.cache import TTLCache
+
+# Ngưỡng thống kê trên dashboard
+LOW_ATTENDANCE_THRESHOLD = 80.0  # % điểm danh
+LOW_GPA_THRESHOLD = 5.0  # thang điểm 10
+
+# Các bảng mà thống kê của từng vai trò phụ thuộc vào
+DASHBOARD_DEPENDENCIES: Dict[str, Set[str]] = {
+    "admin": {"students", "classes", "attendance", "dropout_risks"},
+    "teacher": {"classes", "class_students", "attendance", "students", "grades"},
+    "student": {
+        "students", "attendance", "grades", "disciplinary_records", "class_students",
+        "classes", "class_subjects", "subjects", "teachers", "users"
+    }
+}
+
+
+class DashboardCache:
+    """
+    Cache thống kê dashboard theo (vai trò, user). Mỗi vai trò có một số thế hệ nằm trong khóa
+    cache; khi bảng mà vai trò phụ thuộc thay đổi, tăng thế hệ để bỏ toàn bộ mục cũ của vai trò đó
+    (mục cũ tự hết hạn theo TTL hoặc bị đẩy ra theo LRU)
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._generations: Dict[str, int] = {role: 0 for role in DASHBOARD_DEPENDENCIES}
+        self._lock = threading.Lock()
+
+    def _key(self, role: str, user_id: int) -> tuple:
+        return (role, user_id, self._generations.get(role, 0))
+
+    def get(self, role: str, user_id: int) -> Optional[Dict[str, Any]]:
+        stats = self._cache.get(self._key(role, user_id))
+        return copy.deepcopy(stats) if stats is not None else None
+
+    def set(self, role: str, user_id: int, stats: Dict[str, Any], generation: int) -> None:
+        # Bỏ qua kết quả được tính trước khi có thay đổi dữ liệu xen vào
+        if generation != self._generations.get(role, 0):
+            return
+        self._cache.set((role, user_id, generation), copy.deepcopy(stats))
+
+    def generation(self, role: str) -> int:
+        return self._generations.get(role, 0)
+
+    def invalidate_tables(self, tables: Set[str]) -> None:
+        with self._lock:
+            for role, dependencies in DASHBOARD_DEPENDENCIES.items():
+                if dependencies & tables:
+                    self._generations[role] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            for role in self._generations:
+                self._generations[role] += 1
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        result = self._cache.stats()
+        result["generations"] = dict(self._generations)
+        return result
+
+
+dashboard_cache = DashboardCache(
+    maxsize=settings.DASHBOARD_CACHE_SIZE,
+    ttl=settings.DASHBOARD_CACHE_TTL
+)
+
+_TRACKED_TABLES = set().union(*DASHBOARD_DEPENDENCIES.values())
+
+
+def _track_tables(session: Session, tables) -> None:
+    changed = {name for name in tables if name in _TRACKED_TABLES}
+    if changed:
+        session.info.setdefault("dashboard_changed_tables", set()).update(changed)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_flushed_tables(session, flush_context):
+    tables = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, "__tablename__", None)
+        if table:
+            tables.add(table)
+    _track_tables(session, tables)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_tables(orm_execute_state):
+    # query.update()/delete() và update()/delete() theo ORM không đi qua flush
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            _track_tables(orm_execute_state.session, {mapper.local_table.name})
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    tables = session.info.pop("dashboard_changed_tables", None)
+    if tables:
+        dashboard_cache.invalidate_tables(tables)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_after_rollback(session, previous_transaction):
+    session.info.pop("dashboard_changed_tables", None)
+
+
+def _attendance_rate(present: Optional[int], absent: Optional[int]) -> float:
+    """
+    Tỷ lệ điểm danh = present / (present + absent), giống update_student_attendance_rate
+    """
+    present = int(present or 0)
+    total = present + int(absent or 0)
+    if total == 0:
+        return 100.0
+    return round(present / total * 100.0, 1)
+
+
+def _attendance_counts(*criteria):
+    """
+    Số buổi present/absent trong một lần quét bảng attendance (đếm có điều kiện)
+    """
+    return select(
+        func.sum(case((Attendance.status == 'present', 1), else_=0)).label("present"),
+        func.sum(case((Attendance.status == 'absent', 1), else_=0)).label("absent")
+    ).where(*criteria).subquery()
+
+
+class DashboardStatsService:
+    """
+    Thống kê dashboard theo vai trò, mỗi vai trò chỉ dùng vài truy vấn tổng hợp
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get_admin_stats(self) -> Dict[str, Any]:
+        """
+        Đọc dòng rollup toàn trường; nếu chưa có thì tính trực tiếp và lên lịch dựng bảng rollup
+        """
+        try:
+            rollup = get_campus_rollup(self.db)
+        except Exception as e:
+            print(f"Error reading campus rollups: {e}")
+            self.db.rollback()
+            return self._compute_admin_stats()
+
+        rollup_refresher.maybe_refresh(rollup.computed_at if rollup else None)
+        if rollup is not None:
+            return {
+                "totalStudents": rollup.total_students,
+                "totalClasses": rollup.total_classes,
+                "attendanceRate": rollup.attendance_rate,
+                "dropoutRiskCount": rollup.risk_high
+            }
+        return self._compute_admin_stats()
+
+    def _compute_admin_stats(self) -> Dict[str, Any]:
+        attendance = _attendance_counts()
+
+        # Đánh giá nguy cơ mới nhất của mỗi sinh viên
+        latest_risk = select(
+            func.max(DropoutRisk.risk_id).label("risk_id")
+        ).group_by(DropoutRisk.student_id).subquery()
+
+        row = self.db.execute(
+            select(
+                select(func.count(Student.student_id)).scalar_subquery(),
+                select(func.count(Class.class_id)).scalar_subquery(),
+                attendance.c.present,
+                attendance.c.absent,
+                select(func.count(DropoutRisk.risk_id)).join(
+                    latest_risk, DropoutRisk.risk_id == latest_risk.c.risk_id
+                ).where(DropoutRisk.risk_percentage >= HIGH_RISK_THRESHOLD).scalar_subquery()
+            ).select_from(attendance)
+        ).one()
+        total_students, total_classes, present_count, absent_count, high_risk_count = row
+
+        return {
+            "totalStudents": int(total_students or 0),
+            "totalClasses": int(total_classes or 0),
+            "attendanceRate": _attendance_rate(present_count, absent_count),
+            "dropoutRiskCount": int(high_risk_count or 0)
+        }
+
+    def get_teacher_stats(self, teacher_id: int) -> Dict[str, Any]:
+        teacher_class_ids = select(Class.class_id).where(Class.teacher_id == teacher_id)
+        attendance = _attendance_counts(Attendance.class_id.in_(teacher_class_ids))
+
+        row = self.db.execute(
+            select(
+                select(func.count(Class.class_id)).where(Class.teacher_id == teacher_id).scalar_subquery(),
+                attendance.c.present,
+                attendance.c.absent
+            ).select_from(attendance)
+        ).one()
+        teacher_classes, present_count, absent_count = row
+
+        # Sinh viên đang học các lớp của giáo viên có điểm danh hoặc điểm trung bình thấp
+        avg_gpa = select(
+            Grade.student_id,
+            func.avg(Grade.gpa).label("avg_gpa")
+        ).group_by(Grade.student_id).subquery()
+
+        need_attention = self.db.execute(
+            select(func.count(func.distinct(ClassStudent.student_id))).join(
+                Student, Student.student_id == ClassStudent.student_id
+            ).outerjoin(
+                avg_gpa, avg_gpa.c.student_id == ClassStudent.student_id
+            ).where(
+                ClassStudent.class_id.in_(teacher_class_ids),
+                ClassStudent.status == 'enrolled',
+                or_(
+                    Student.attendance_rate < LOW_ATTENDANCE_THRESHOLD,
+                    avg_gpa.c.avg_gpa < LOW_GPA_THRESHOLD
+                )
+            )
+        ).scalar()
+
+        return {
+            "teacherClasses": int(teacher_classes or 0),
+            "attendanceRate": _attendance_rate(present_count, absent_count),
+            "needAttentionCount": int(need_attention or 0)
+        }
+
+    def get_student_stats(self, student_id: int) -> Dict[str, Any]:
+        attendance = _attendance_counts(Attendance.student_id == student_id)
+
+        row = self.db.execute(
+            select(
+                select(func.avg(Grade.gpa)).where(Grade.student_id == student_id).scalar_subquery(),
+                select(func.count(DisciplinaryRecord.record_id)).where(
+                    DisciplinaryRecord.student_id == student_id
+                ).scalar_subquery(),
+                attendance.c.present,
+                attendance.c.absent
+            ).select_from(attendance)
+        ).one()
+        gpa, disciplinary_count, present_count, absent_count = row
+
+        # Lớp đang học gần nhất cùng giáo viên phụ trách
+        current_class = self.db.query(Class).join(
+            ClassStudent, ClassStudent.class_id == Class.class_id
+        ).options(
+            joinedload(Class.teacher).joinedload(Teacher.user)
+        ).filter(
+            ClassStudent.student_id == student_id,
+            ClassStudent.status == 'enrolled'
+        ).order_by(
+            ClassStudent.enrollment_date.desc(), Class.class_id.desc()
+        ).first()
+
+        teacher_name = None
+        if current_class and current_class.teacher and current_class.teacher.user:
+            teacher_name = current_class.teacher.user.full_name
+
+        # Môn học của lớp kèm điểm của sinh viên trong một truy vấn
+        current_subjects = []
+        if current_class:
+            rows = self.db.query(Subject.subject_name, Grade.gpa).join(
+                ClassSubject, ClassSubject.subject_id == Subject.subject_id
+            ).outerjoin(
+                Grade, and_(
+                    Grade.subject_id == Subject.subject_id,
+                    Grade.class_id == ClassSubject.class_id,
+                    Grade.student_id == student_id
+                )
+            ).filter(
+                ClassSubject.class_id == current_class.class_id
+            ).order_by(Subject.subject_name).all()
+
+            current_subjects = [
+                {
+                    "name": subject_name,
+                    "teacher": teacher_name or "N/A",
+                    "grade": round(float(grade), 2) if grade is not None else None
+                }
+                for subject_name, grade in rows
+            ]
+
+        return {
+            "gpa": round(float(gpa), 2) if gpa is not None else None,
+            "attendanceRate": _attendance_rate(present_count, absent_count),
+            "disciplinaryCount": int(disciplinary_count or 0),
+            "className": current_class.class_name if current_class else None,
+            "teacherName": teacher_name,
+            "currentSubjects": current_subjects
+        }
+
+
+def get_dashboard_stats(
+    db: Session,
+    role: str,
+    user_id: int,
+    teacher_id: Optional[int] = None,
+    student_id: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Lấy thống kê dashboard từ cache, chỉ tính lại khi hết hạn hoặc dữ liệu liên quan đã thay đổi
+    """
+    stats = dashboard_cache.get(role, user_id)
+    if stats is not None:
+        return stats
+
+    generation = dashboard_cache.generation(role)
+    service = DashboardStatsService(db)
+    if role == "admin":
+        stats = service.get_admin_stats()
+    elif role == "teacher":
+        stats = service.get_teacher_stats(teacher_id)
+    else:
+        stats = service.get_student_stats(student_id)
+
+    dashboard_cache.set(role, user_id, stats, generation)
+    return stats
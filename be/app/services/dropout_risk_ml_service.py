@@ -1,23 +1,34 @@
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional, Tuple, Callable
 from sqlalchemy.orm import Session
 import pandas as pd
 import numpy as np
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.linear_model import LogisticRegression
 from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.model_selection import train_test_split, cross_val_score, GridSearchCV
+from sklearn.model_selection import train_test_split, cross_val_score
 from sklearn.metrics import classification_report, roc_auc_score, accuracy_score
 from app.models.models import Student, Grade, DisciplinaryRecord, ClassStudent
 from app.models.attendance import Attendance
-from app.crud.dropout_risk import create_dropout_risk
+from app.crud.dropout_risk import create_dropout_risk, create_dropout_risks_bulk
+from app.crud.student_feature import get_student_feature_matrix
 from app.schemas.schemas import DropoutRiskCreate
+from app.services.student_feature_extractor import StudentFeatureExtractor, DEFAULT_FEATURE_NAMES
+from app.services.model_registry import get_model_registry
+from app.services.model_artifacts import save_model_artifact, compute_data_hash
+from app.services.model_search import search_hyperparameters, RANDOM_SEARCH
+from app.services.prediction_cache import make_prediction_key, get_cached_prediction, cache_prediction
+from app.services.training_jobs import training_jobs, ModelNotReady, ML_MODELS_JOB
+from app.core.config import settings
 import json
-import pickle
 import os
 from datetime import datetime, timedelta
 import warnings
 warnings.filterwarnings('ignore')
 
+# Thư mục và tiền tố tên file bộ mô hình ML
+MODELS_DIR = "models"
+MODEL_FILE_PREFIX = 'ml_dropout_models_'
+
 def convert_numpy_types(obj):
     """
     Converts NumPy types to native Python types for JSON serialization
@@ -45,157 +56,40 @@ class MLDropoutRiskPredictionService:
     
     def __init__(self, db: Session):
         self.db = db
-        self.models_dir = "models"
+        self.models_dir = MODELS_DIR
         self.rf_model = None
         self.lr_model = None
         self.scaler = None
-        self.feature_names = [
-            'attendance_rate', 'avg_gpa', 'failed_subjects', 'total_subjects',
-            'minor_violations', 'moderate_violations', 'severe_violations',
-            'academic_status', 'family_income_level', 'scholarship_status',
-            'previous_academic_warning', 'dropped_classes', 'semester_count',
-            'grade_trend', 'attendance_trend'
-        ]
+        self.model_version = None
+        self.best_params = {}
+        self.feature_names = list(DEFAULT_FEATURE_NAMES)
         
+    def _extract_features_batch(self, student_ids: Optional[List[int]] = None) -> Tuple[List[int], np.ndarray]:
+        """
+        Lấy ma trận đặc trưng cho nhiều sinh viên (hoặc tất cả) theo thứ tự feature_names,
+        đọc từ bảng student_risk_features và tính lại từ dữ liệu gốc nếu bảng chưa sẵn sàng
+        """
+        try:
+            return get_student_feature_matrix(self.db, student_ids, self.feature_names)
+        except Exception as e:
+            print(f"Feature store unavailable, extracting features from raw data: {e}")
+            extractor = StudentFeatureExtractor(self.db, self.feature_names)
+            return extractor.extract_batch(student_ids)
+    
     def _extract_student_features(self, student_id: int) -> Optional[Dict[str, Any]]:
         """
-        Trích xuất đặc trưng từ dữ liệu sinh viên với error handling đầy đủ
+        Trích xuất đặc trưng từ dữ liệu sinh viên (bao bọc bộ trích xuất theo lô)
         """
         try:
-            # Lấy thông tin sinh viên
-            student = self.db.query(Student).filter(Student.student_id == student_id).first()
-            if not student:
+            ids, X = self._extract_features_batch([student_id])
+            if not ids:
                 print(f"Student {student_id} not found")
-                return None            
-            # Tính toán điểm danh với error handling
-            try:
-                attendance_records = self.db.query(Attendance).filter(
-                    Attendance.student_id == student_id
-                ).all()
-                
-                total_attendance = len(attendance_records)
-                if total_attendance > 0:
-                    present_count = sum(1 for a in attendance_records if getattr(a, 'status', None) == "present")
-                    attendance_rate = (present_count / total_attendance * 100)
-                else:
-                    attendance_rate = 100.0
-            except Exception as e:
-                print(f"Error calculating attendance for student {student_id}: {e}")
-                attendance_rate = 100.0
-            
-            # Tính toán điểm số với error handling
-            try:
-                grades = self.db.query(Grade).filter(Grade.student_id == student_id).all()
-                if grades:
-                    # Sử dụng gpa thay vì score
-                    valid_gpas = [g.gpa for g in grades if g.gpa is not None]
-                    if valid_gpas:
-                        avg_gpa = sum(valid_gpas) / len(valid_gpas)
-                        failed_subjects = sum(1 for gpa in valid_gpas if gpa < 5.0)
-                    else:
-                        avg_gpa = 0.0
-                        failed_subjects = 0
-                    total_subjects = len(grades)
-                    
-                    # Tính xu hướng điểm (so sánh 3 lần gần nhất)
-                    recent_grades = sorted(grades, key=lambda x: x.grade_id, reverse=True)[:3]
-                    recent_valid_gpas = [g.gpa for g in recent_grades if g.gpa is not None]
-                    if len(recent_valid_gpas) >= 2:
-                        grade_trend = (recent_valid_gpas[0] - recent_valid_gpas[-1]) / len(recent_valid_gpas)
-                    else:
-                        grade_trend = 0.0
-                else:
-                    avg_gpa = 0.0
-                    failed_subjects = 0
-                    total_subjects = 0
-                    grade_trend = 0.0
-            except Exception as e:
-                print(f"Error calculating grades for student {student_id}: {e}")
-                avg_gpa = 0.0
-                failed_subjects = 0
-                total_subjects = 0
-                grade_trend = 0.0
-                
-            # Tính toán vi phạm kỷ luật với error handling
-            try:
-                disciplinary_records = self.db.query(DisciplinaryRecord).filter(
-                    DisciplinaryRecord.student_id == student_id
-                ).all()
-                
-                minor_violations = sum(1 for d in disciplinary_records if getattr(d, 'severity_level', None) == "minor")
-                moderate_violations = sum(1 for d in disciplinary_records if getattr(d, 'severity_level', None) == "moderate")
-                severe_violations = sum(1 for d in disciplinary_records if getattr(d, 'severity_level', None) == "severe")
-            except Exception as e:
-                print(f"Error calculating disciplinary records for student {student_id}: {e}")
-                minor_violations = 0
-                moderate_violations = 0
-                severe_violations = 0
-            
-            # Tính toán thông tin lớp học với error handling
-            try:
-                enrollments = self.db.query(ClassStudent).filter(
-                    ClassStudent.student_id == student_id
-                ).all()
-                
-                dropped_classes = sum(1 for e in enrollments if getattr(e, 'status', None) == "dropped")
-                semester_count = len(set(e.class_id for e in enrollments))
-            except Exception as e:
-                print(f"Error calculating enrollment data for student {student_id}: {e}")
-                dropped_classes = 0
-                semester_count = 0              # Tính xu hướng điểm danh (so sánh 30 ngày gần nhất với 30 ngày trước) với error handling
-            try:
-                if total_attendance >= 10:
-                    recent_attendance = sorted(attendance_records, key=lambda x: getattr(x, 'date', datetime.now()), reverse=True)
-                    recent_30 = recent_attendance[:min(30, len(recent_attendance)//2)]
-                    previous_30 = recent_attendance[len(recent_30):len(recent_30)*2]
-                    
-                    if recent_30 and previous_30:
-                        recent_rate = sum(1 for a in recent_30 if getattr(a, 'status', None) == "present") / len(recent_30)
-                        previous_rate = sum(1 for a in previous_30 if getattr(a, 'status', None) == "present") / len(previous_30)
-                        attendance_trend = recent_rate - previous_rate
-                    else:
-                        attendance_trend = 0.0
-                else:
-                    attendance_trend = 0.0
-            except Exception as e:
-                print(f"Error calculating attendance trend for student {student_id}: {e}")
-                attendance_trend = 0.0              # Mã hóa thuộc tính enum với error handling
-            academic_status_map = {'good': 0, 'warning': 1, 'probation': 2, 'suspended': 3}
-            income_level_map = {'very_low': 0, 'low': 1, 'medium': 2, 'high': 3, 'very_high': 4}
-            scholarship_map = {'none': 0, 'partial': 1, 'full': 2}
-            
-            # Xử lý các thuộc tính có thể không tồn tại với getattr để tránh AttributeError
-            academic_status = academic_status_map.get(getattr(student, 'academic_status', None), 0)
-            family_income_level = income_level_map.get(getattr(student, 'family_income_level', None), 2)  # default medium
-            scholarship_status = scholarship_map.get(getattr(student, 'scholarship_status', None), 0)
-            
-            # Các thuộc tính không có trong model - sử dụng giá trị mặc định
-            previous_academic_warning = 0  # Không có trong model Student
-            
-            # Tổng hợp đặc trưng
-            features = {
-                'attendance_rate': attendance_rate,
-                'avg_gpa': avg_gpa,
-                'failed_subjects': failed_subjects,
-                'total_subjects': total_subjects,
-                'minor_violations': minor_violations,
-                'moderate_violations': moderate_violations,
-                'severe_violations': severe_violations,
-                'academic_status': academic_status,
-                'family_income_level': family_income_level,
-                'scholarship_status': scholarship_status,
-                'previous_academic_warning': previous_academic_warning,
-                'dropped_classes': dropped_classes,
-                'semester_count': semester_count,
-                'grade_trend': grade_trend,
-                'attendance_trend': attendance_trend
-            }
-            
-            return features
+                return None
+            return StudentFeatureExtractor(self.db, self.feature_names).row_to_dict(X[0])
             
         except Exception as e:
             print(f"Error extracting features for student {student_id}: {e}")
-            # Trả về default features thay vì None để tránh lỗi downstream
+            # Trả về features mặc định thay vì None
             return {
                 'attendance_rate': 100.0,
                 'avg_gpa': 0.0,
@@ -213,56 +107,68 @@ class MLDropoutRiskPredictionService:
                 'grade_trend': 0.0,
                 'attendance_trend': 0.0
             }
+    
+    def _label_high_risk(self, X: np.ndarray) -> np.ndarray:
+        """
+        Tạo nhãn nguy cơ cao cho toàn bộ ma trận đặc trưng
+        """
+        column = {name: X[:, i] for i, name in enumerate(self.feature_names)}
+        is_high_risk = (
+            (column['attendance_rate'] < 75) |
+            (column['avg_gpa'] < 5.0) |
+            (column['failed_subjects'] > 2) |
+            (column['severe_violations'] > 0) |
+            (column['moderate_violations'] > 2) |
+            (column['academic_status'] >= 2) |
+            (column['dropped_classes'] > 1)
+        )
+        return is_high_risk.astype(int)
+    
     def _prepare_training_data(self) -> Tuple[np.ndarray, np.ndarray]:
         """
-        Chuẩn bị dữ liệu huấn luyện với error handling
+        Chuẩn bị dữ liệu huấn luyện từ ma trận đặc trưng của toàn bộ sinh viên
         """
         try:
-            students = self.db.query(Student).all()
-            features_list = []
-            labels = []
-            
-            for student in students:
-                try:
-                    features = self._extract_student_features(student.student_id)
-                    if not features:
-                        continue
-                        
-                    # Tạo nhãn dựa trên các tiêu chí nguy cơ cao
-                    is_high_risk = (
-                        features['attendance_rate'] < 75 or
-                        features['avg_gpa'] < 5.0 or
-                        features['failed_subjects'] > 2 or
-                        features['severe_violations'] > 0 or
-                        features['moderate_violations'] > 2 or
-                        features['academic_status'] >= 2 or
-                        features['dropped_classes'] > 1
-                    )
-                    
-                    # Chuyển đổi features thành list theo thứ tự đã định
-                    feature_vector = [features[name] for name in self.feature_names]
-                    features_list.append(feature_vector)
-                    labels.append(1 if is_high_risk else 0)
-                    
-                except Exception as e:
-                    print(f"Error processing student {student.student_id} for training: {e}")
-                    continue
+            _, X = self._extract_features_batch()
             
-            if len(features_list) == 0:
+            if len(X) == 0:
                 print("No valid training data found")
                 return np.array([]), np.array([])
-                
-            return np.array(features_list), np.array(labels)
+            
+            return X, self._label_high_risk(X)
             
         except Exception as e:
             print(f"Error preparing training data: {e}")
             return np.array([]), np.array([])
     
-    def train_models(self) -> Dict[str, Any]:
+    def train_models(
+        self,
+        progress_callback: Optional[Callable[[int, str], None]] = None,
+        search_strategy: Optional[str] = None,
+        search_budget: Optional[int] = None,
+        warm_start: Optional[bool] = None
+    ) -> Dict[str, Any]:
         """
         Huấn luyện cả Random Forest và Logistic Regression
+        
+        Args:
+            progress_callback: Hàm nhận (phần trăm tiến độ, giai đoạn) để báo cáo tiến độ huấn luyện
+            search_strategy: Chiến lược tìm siêu tham số (grid, random, halving), mặc định theo cấu hình
+            search_budget: Số ứng viên tối đa cho chiến lược random
+            warm_start: Thu hẹp không gian tìm kiếm quanh best_params của mô hình trước
         """
+        def report(percent: int, stage: str):
+            if progress_callback:
+                progress_callback(percent, stage)
+        
+        strategy = search_strategy or settings.ML_SEARCH_STRATEGY
+        budget = search_budget or settings.ML_SEARCH_BUDGET
+        if warm_start is None:
+            warm_start = settings.ML_SEARCH_WARM_START
+        previous_params = self._get_previous_best_params() if warm_start else {}
+        
         print("Chuẩn bị dữ liệu huấn luyện...")
+        report(5, "preparing_data")
         X, y = self._prepare_training_data()
         
         if len(X) == 0:
@@ -283,6 +189,7 @@ class MLDropoutRiskPredictionService:
         
         # Huấn luyện Random Forest
         print("Huấn luyện Random Forest...")
+        report(20, "training_random_forest")
         rf_params = {
             'n_estimators': [100, 200, 300],
             'max_depth': [5, 10, 15, None],
@@ -290,35 +197,45 @@ class MLDropoutRiskPredictionService:
             'min_samples_leaf': [1, 2, 4]
         }
         
-        rf_grid = GridSearchCV(
+        rf_search = search_hyperparameters(
             RandomForestClassifier(random_state=42),
             rf_params,
+            X_train_scaled,
+            y_train,
+            strategy=strategy,
             cv=5,
-            scoring='roc_auc',
-            n_jobs=-1
+            budget=budget,
+            warm_start_params=previous_params.get('random_forest')
         )
-        rf_grid.fit(X_train_scaled, y_train)
-        self.rf_model = rf_grid.best_estimator_
+        self.rf_model = rf_search['best_estimator']
         
         # Huấn luyện Logistic Regression
         print("Huấn luyện Logistic Regression...")
+        report(70, "training_logistic_regression")
         lr_params = {
             'C': [0.1, 1, 10, 100],
             'penalty': ['l1', 'l2'],
             'solver': ['liblinear', 'saga']
         }
         
-        lr_grid = GridSearchCV(
+        lr_search = search_hyperparameters(
             LogisticRegression(random_state=42, max_iter=1000),
             lr_params,
+            X_train_scaled,
+            y_train,
+            strategy=strategy,
             cv=5,
-            scoring='roc_auc',
-            n_jobs=-1
+            budget=budget,
+            warm_start_params=previous_params.get('logistic_regression')
         )
-        lr_grid.fit(X_train_scaled, y_train)
-        self.lr_model = lr_grid.best_estimator_
+        self.lr_model = lr_search['best_estimator']
+        self.best_params = {
+            'random_forest': rf_search['best_params'],
+            'logistic_regression': lr_search['best_params']
+        }
         
         # Đánh giá mô hình
+        report(85, "evaluating")
         rf_pred = self.rf_model.predict(X_test_scaled)
         rf_pred_proba = self.rf_model.predict_proba(X_test_scaled)[:, 1]
         
@@ -329,13 +246,17 @@ class MLDropoutRiskPredictionService:
             'random_forest': {
                 'accuracy': accuracy_score(y_test, rf_pred),
                 'roc_auc': roc_auc_score(y_test, rf_pred_proba),
-                'best_params': rf_grid.best_params_,
+                'best_params': rf_search['best_params'],
+                'search_candidates': rf_search['candidates'],
+                'search_time_seconds': rf_search['search_time_seconds'],
                 'feature_importance': dict(zip(self.feature_names, self.rf_model.feature_importances_))
             },
             'logistic_regression': {
                 'accuracy': accuracy_score(y_test, lr_pred),
                 'roc_auc': roc_auc_score(y_test, lr_pred_proba),
-                'best_params': lr_grid.best_params_,
+                'best_params': lr_search['best_params'],
+                'search_candidates': lr_search['candidates'],
+                'search_time_seconds': lr_search['search_time_seconds'],
                 'coefficients': dict(zip(self.feature_names, self.lr_model.coef_[0]))
             },
             'training_info': {
@@ -344,10 +265,25 @@ class MLDropoutRiskPredictionService:
                 'test_samples': len(X_test),
                 'feature_count': len(self.feature_names),
                 'class_distribution': dict(zip(['Low Risk', 'High Risk'], np.bincount(y)))
+            },
+            'search': {
+                'strategy': strategy,
+                'budget': budget if strategy == RANDOM_SEARCH else None,
+                'warm_start': bool(previous_params),
+                'search_time_seconds': round(rf_search['search_time_seconds'] + lr_search['search_time_seconds'], 3)
             }
         }
           # Lưu mô hình
-        self._save_models()
+        report(95, "saving")
+        self._save_models(
+            metrics={
+                'random_forest': {k: results['random_forest'][k] for k in ('accuracy', 'roc_auc')},
+                'logistic_regression': {k: results['logistic_regression'][k] for k in ('accuracy', 'roc_auc')},
+                'training_info': {k: v for k, v in results['training_info'].items() if k != 'class_distribution'},
+                'search': results['search']
+            },
+            training_data_hash=compute_data_hash(X, y)
+        )
         
         print("Huấn luyện hoàn thành!")
         print(f"Random Forest - Accuracy: {results['random_forest']['accuracy']:.3f}, ROC-AUC: {results['random_forest']['roc_auc']:.3f}")
@@ -356,11 +292,19 @@ class MLDropoutRiskPredictionService:
         # Convert numpy types to native Python types for JSON serialization
         return convert_numpy_types(results)
     
-    def _save_models(self):
+    def _get_previous_best_params(self) -> Dict[str, Any]:
+        """
+        Lấy best_params của bộ mô hình hiện hành để khởi tạo tìm kiếm (warm start)
+        """
+        bundle = get_model_registry(self.models_dir, MODEL_FILE_PREFIX).get()
+        if bundle is None:
+            return {}
+        return bundle.data.get('best_params') or {}
+    
+    def _save_models(self, metrics: Optional[Dict[str, Any]] = None, training_data_hash: Optional[str] = None):
         """
-        Lưu mô hình đã huấn luyện
+        Lưu mô hình đã huấn luyện thành artifact có manifest (phiên bản, đặc trưng, chỉ số, hash dữ liệu)
         """
-        os.makedirs(self.models_dir, exist_ok=True)
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         
         model_data = {
@@ -368,12 +312,21 @@ class MLDropoutRiskPredictionService:
             'lr_model': self.lr_model,
             'scaler': self.scaler,
             'feature_names': self.feature_names,
+            'best_params': self.best_params,
             'timestamp': timestamp
         }
         
-        model_path = os.path.join(self.models_dir, f'ml_dropout_models_{timestamp}.pkl')
-        with open(model_path, 'wb') as f:
-            pickle.dump(model_data, f)
+        model_path = save_model_artifact(
+            self.models_dir,
+            MODEL_FILE_PREFIX,
+            model_data,
+            metrics=metrics,
+            training_data_hash=training_data_hash
+        )
+        
+        # Các request sau trong worker này dùng ngay bộ mô hình mới
+        bundle = get_model_registry(self.models_dir, MODEL_FILE_PREFIX).publish(model_data, model_path)
+        self.model_version = bundle.version
         
         print(f"Mô hình đã được lưu tại: {model_path}")
     
@@ -381,27 +334,18 @@ class MLDropoutRiskPredictionService:
         """
         Tải mô hình đã huấn luyện
         """
-        if not os.path.exists(self.models_dir):
+        # Registry dùng chung trong worker: chỉ đọc file khi có phiên bản mới hơn
+        bundle = get_model_registry(self.models_dir, MODEL_FILE_PREFIX).get()
+        if bundle is None:
             return False
-            
-        model_files = [f for f in os.listdir(self.models_dir) if f.startswith('ml_dropout_models_')]
-        if not model_files:
-            return False
-            
-        # Lấy file mới nhất
-        latest_model = sorted(model_files)[-1]
-        model_path = os.path.join(self.models_dir, latest_model)
         
         try:
-            with open(model_path, 'rb') as f:
-                model_data = pickle.load(f)
-                
+            model_data = bundle.data
             self.rf_model = model_data['rf_model']
             self.lr_model = model_data['lr_model']
             self.scaler = model_data['scaler']
             self.feature_names = model_data['feature_names']
-            
-            print(f"Đã tải mô hình từ: {model_path}")
+            self.model_version = bundle.version
             return True
             
         except Exception as e:
@@ -415,8 +359,8 @@ class MLDropoutRiskPredictionService:
             # Tải mô hình nếu chưa có
             if self.rf_model is None or self.lr_model is None:
                 if not self._load_models():
-                    print("Chưa có mô hình được huấn luyện. Đang huấn luyện mô hình mới...")
-                    self.train_models()
+                    # Không huấn luyện trong request: gửi job huấn luyện nền và báo cho caller
+                    raise ModelNotReady(training_jobs.submit(ML_MODELS_JOB))
             
             # Trích xuất đặc trưng
             features = self._extract_student_features(student_id)
@@ -432,6 +376,12 @@ class MLDropoutRiskPredictionService:
                 print(f"Error preparing feature vector for student {student_id}: {e}")
                 return None
             
+            # Trả về kết quả đã có nếu đặc trưng và phiên bản mô hình không đổi
+            cache_key = make_prediction_key(student_id, feature_vector[0], self.model_version, use_ensemble)
+            cached_result = get_cached_prediction(cache_key)
+            if cached_result is not None:
+                return cached_result
+            
             # Dự đoán với Random Forest
             try:
                 rf_proba = self.rf_model.predict_proba(feature_vector_scaled)[0, 1]
@@ -508,12 +458,151 @@ class MLDropoutRiskPredictionService:
             }
             
             # Convert numpy types to native Python types for JSON serialization
-            return convert_numpy_types(result)
+            result = convert_numpy_types(result)
+            cache_prediction(cache_key, result)
+            return result
             
+        except ModelNotReady:
+            raise
         except Exception as e:
             print(f"Error predicting dropout risk for student {student_id}: {e}")
             return None
     
+    def _score_matrix(self, X: np.ndarray, use_ensemble: bool = True) -> Dict[str, np.ndarray]:
+        """
+        Chấm điểm toàn bộ ma trận đặc trưng: chuẩn hóa một lần, mỗi mô hình gọi predict_proba một lần
+        """
+        X_scaled = self.scaler.transform(X)
+        
+        rf_proba = self.rf_model.predict_proba(X_scaled)[:, 1]
+        lr_proba = self.lr_model.predict_proba(X_scaled)[:, 1]
+        
+        # predict() của cả hai mô hình tương đương với xác suất lớp 1 > 0.5
+        rf_prediction = (rf_proba > 0.5).astype(int)
+        lr_prediction = (lr_proba > 0.5).astype(int)
+        
+        if use_ensemble:
+            # Trọng số: Random Forest 60%, Logistic Regression 40%
+            ensemble_proba = 0.6 * rf_proba + 0.4 * lr_proba
+            ensemble_prediction = (ensemble_proba > 0.5).astype(int)
+        else:
+            ensemble_proba = rf_proba
+            ensemble_prediction = rf_prediction
+        
+        return {
+            "rf_proba": rf_proba,
+            "rf_prediction": rf_prediction,
+            "lr_proba": lr_proba,
+            "lr_prediction": lr_prediction,
+            "ensemble_proba": ensemble_proba,
+            "ensemble_prediction": ensemble_prediction
+        }
+    
+    def predict_students_bulk(
+        self,
+        student_ids: Optional[List[int]] = None,
+        use_ensemble: bool = True,
+        save_results: bool = True
+    ) -> List[Dict[str, Any]]:
+        """
+        Dự đoán nguy cơ bỏ học cho nhiều sinh viên (hoặc tất cả) theo lô:
+        trích xuất đặc trưng theo lô, suy luận vector hóa và lưu kết quả trong một transaction
+        """
+        # Tải mô hình nếu chưa có
+        if self.rf_model is None or self.lr_model is None:
+            if not self._load_models():
+                # Không huấn luyện trong request: gửi job huấn luyện nền và báo cho caller
+                raise ModelNotReady(training_jobs.submit(ML_MODELS_JOB))
+        
+        ids, X = self._extract_features_batch(student_ids)
+        if not ids:
+            return []
+        
+        # Chỉ dự đoán cho sinh viên chưa có kết quả trong cache
+        cache_keys = [
+            make_prediction_key(student_id, row, self.model_version, use_ensemble)
+            for student_id, row in zip(ids, X)
+        ]
+        results = [get_cached_prediction(key) for key in cache_keys]
+        misses = [i for i, result in enumerate(results) if result is None]
+        if misses:
+            fresh_results = self._predict_matrix([ids[i] for i in misses], X[misses], use_ensemble, save_results)
+            for i, result in zip(misses, fresh_results):
+                cache_prediction(cache_keys[i], result)
+                results[i] = result
+        
+        return results
+    
+    def _predict_matrix(
+        self,
+        ids: List[int],
+        X: np.ndarray,
+        use_ensemble: bool = True,
+        save_results: bool = True
+    ) -> List[Dict[str, Any]]:
+        """
+        Suy luận vector hóa cho ma trận đặc trưng và lưu kết quả trong một transaction
+        """
+        scores = self._score_matrix(X, use_ensemble=use_ensemble)
+        risk_percentages = (scores["ensemble_proba"] * 100).tolist()
+        
+        extractor = StudentFeatureExtractor(self.db, self.feature_names)
+        features_list = [extractor.row_to_dict(row) for row in X]
+        risk_factors_list = [self._analyze_risk_factors(features) for features in features_list]
+        
+        # Lưu kết quả vào database trong một transaction
+        risk_ids = [None] * len(ids)
+        analysis_dates = [datetime.now()] * len(ids)
+        if save_results:
+            try:
+                dropout_risks = create_dropout_risks_bulk(self.db, [
+                    DropoutRiskCreate(
+                        student_id=student_id,
+                        risk_percentage=risk_percentage,
+                        risk_factors=risk_factors
+                    )
+                    for student_id, risk_percentage, risk_factors in zip(ids, risk_percentages, risk_factors_list)
+                ])
+                risk_ids = [risk.risk_id for risk in dropout_risks]
+                analysis_dates = [risk.analysis_date for risk in dropout_risks]
+            except Exception as e:
+                print(f"Error saving bulk dropout risks to database: {e}")
+                self.db.rollback()
+        
+        rf_proba = scores["rf_proba"].tolist()
+        lr_proba = scores["lr_proba"].tolist()
+        rf_prediction = scores["rf_prediction"].tolist()
+        lr_prediction = scores["lr_prediction"].tolist()
+        ensemble_prediction = scores["ensemble_prediction"].tolist()
+        
+        results = []
+        for i, student_id in enumerate(ids):
+            results.append({
+                "risk_id": risk_ids[i],
+                "student_id": student_id,
+                "risk_percentage": risk_percentages[i],
+                "risk_level": self._get_risk_level(risk_percentages[i]),
+                "prediction_details": {
+                    "random_forest": {
+                        "probability": rf_proba[i] * 100,
+                        "prediction": "High Risk" if rf_prediction[i] == 1 else "Low Risk"
+                    },
+                    "logistic_regression": {
+                        "probability": lr_proba[i] * 100,
+                        "prediction": "High Risk" if lr_prediction[i] == 1 else "Low Risk"
+                    },
+                    "ensemble": {
+                        "probability": risk_percentages[i],
+                        "prediction": "High Risk" if ensemble_prediction[i] == 1 else "Low Risk"
+                    }
+                },
+                "risk_factors": risk_factors_list[i],
+                "feature_analysis": self._get_feature_analysis(features_list[i]),
+                "analysis_date": analysis_dates[i]
+            })
+        
+        return results
+    
     def _analyze_risk_factors(self, features: Dict[str, Any]) -> Dict[str, bool]:
         """
         Phân tích các yếu tố rủi ro
@@ -627,30 +716,17 @@ class MLDropoutRiskPredictionService:
         # Convert numpy types to native Python types for JSON serialization
         return convert_numpy_types(result)
     
-    def predict_all_students(self) -> List[Dict[str, Any]]:
+    def predict_all_students(self, use_ensemble: bool = True) -> List[Dict[str, Any]]:
         """
-        Dự đoán nguy cơ bỏ học cho tất cả sinh viên với error handling
+        Dự đoán nguy cơ bỏ học cho tất cả sinh viên theo lô
         """
         try:
-            students = self.db.query(Student).all()
-            results = []
-            failed_predictions = 0
-            
-            for student in students:
-                try:
-                    result = self.predict_dropout_risk(student.student_id)
-                    if result:
-                        results.append(result)
-                    else:
-                        failed_predictions += 1
-                except Exception as e:
-                    print(f"Lỗi khi dự đoán cho sinh viên {student.student_id}: {e}")
-                    failed_predictions += 1
-                    continue
-            
-            print(f"Completed predictions for {len(results)} students. Failed: {failed_predictions}")
+            results = self.predict_students_bulk(use_ensemble=use_ensemble)
+            print(f"Completed predictions for {len(results)} students")
             return results
             
+        except ModelNotReady:
+            raise
         except Exception as e:
             print(f"Error in predict_all_students: {e}")
             return []
@@ -0,0 +1,200 @@
+import asyncio
+import multiprocessing
+import os
+import posixpath
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from app.core.config import settings
+
+# Các phiên bản ảnh thu nhỏ: tên -> cạnh dài tối đa (px), lưu dạng WebP
+THUMBNAIL_VARIANT = "thumb"
+IMAGE_VARIANTS: Dict[str, int] = {
+    THUMBNAIL_VARIANT: 128,
+    "medium": 640
+}
+WEBP_QUALITY = 80
+DERIVATIVE_EXT = ".webp"
+
+
+def _render_variants(source_path: str, targets: List[Tuple[int, str]], quality: int) -> None:
+    """
+    Chạy trong process con: tạo các ảnh WebP thu nhỏ từ ảnh gốc.
+    Tạo từ lớn đến nhỏ, mỗi phiên bản thu nhỏ từ phiên bản trước để giảm thời gian resize.
+
+    Args:
+        source_path: Đường dẫn ảnh gốc
+        targets: Danh sách (cạnh dài tối đa, đường dẫn file đích)
+        quality: Chất lượng WebP
+    """
+    from PIL import Image, ImageOps
+
+    targets = sorted(targets, key=lambda target: target[0], reverse=True)
+    with Image.open(source_path) as original:
+        # JPEG: giải mã thẳng ở độ phân giải thấp hơn thay vì đọc toàn bộ ảnh gốc
+        largest = targets[0][0]
+        original.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(original)
+
+        # Ảnh động (GIF/WebP): chỉ lấy khung đầu tiên
+        if image.mode not in ("RGB", "RGBA"):
+            has_alpha = image.mode in ("LA", "PA", "RGBa", "La") or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+
+        for size, target_path in targets:
+            image = image.copy()
+            image.thumbnail((size, size), Image.LANCZOS)
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            temp_path = f"{target_path}.part"
+            try:
+                image.save(temp_path, "WEBP", quality=quality, method=4)
+                os.replace(temp_path, target_path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+
+
+class ImageDerivativeService:
+    """
+    Tạo và cache ảnh thu nhỏ (WebP) của ảnh đã upload trong process pool,
+    để trang danh sách chỉ tải vài KB cho mỗi ảnh đại diện.
+    Ảnh thu nhỏ nằm trong UPLOAD_DIR/IMAGE_DERIVATIVE_DIR và được tạo lại khi ảnh gốc mới hơn.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        # Các lần tạo đang chạy theo ảnh gốc, để request trùng dùng chung kết quả
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    def _ensure_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: process con không kế thừa connection pool của process cha
+                context = multiprocessing.get_context("spawn")
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+            return self._executor
+
+    @staticmethod
+    def _upload_root() -> str:
+        return os.path.abspath(settings.UPLOAD_DIR)
+
+    def source_path(self, relative_path: str) -> str:
+        return self._inside_uploads(os.path.join(self._upload_root(), relative_path))
+
+    def derivative_relative_path(self, relative_path: str, variant: str) -> str:
+        relative_path = relative_path.replace('\\', '/')
+        directory, filename = posixpath.split(relative_path)
+        # Giữ nguyên phần mở rộng gốc để a.jpg và a.png không dùng chung ảnh thu nhỏ
+        return posixpath.join(settings.IMAGE_DERIVATIVE_DIR, directory, f"{filename}.{variant}{DERIVATIVE_EXT}")
+
+    def derivative_path(self, relative_path: str, variant: str) -> str:
+        return self._inside_uploads(
+            os.path.join(self._upload_root(), self.derivative_relative_path(relative_path, variant))
+        )
+
+    def _inside_uploads(self, path: str) -> str:
+        path = os.path.abspath(path)
+        root = self._upload_root()
+        if os.path.commonpath([root, path]) != root:
+            raise ValueError("Đường dẫn nằm ngoài thư mục uploads")
+        return path
+
+    def is_derivative(self, relative_path: str) -> bool:
+        return relative_path.replace('\\', '/').split('/', 1)[0] == settings.IMAGE_DERIVATIVE_DIR
+
+    def cached_variants(self, relative_path: str) -> Dict[str, str]:
+        """
+        Các phiên bản đã có và không cũ hơn ảnh gốc: tên -> đường dẫn tương đối
+        """
+        try:
+            source_mtime = os.path.getmtime(self.source_path(relative_path))
+        except (OSError, ValueError):
+            return {}
+
+        cached = {}
+        for variant in IMAGE_VARIANTS:
+            try:
+                if os.path.getmtime(self.derivative_path(relative_path, variant)) >= source_mtime:
+                    cached[variant] = self.derivative_relative_path(relative_path, variant)
+            except OSError:
+                continue
+        return cached
+
+    async def ensure(self, relative_path: str) -> Dict[str, str]:
+        """
+        Tạo các phiên bản còn thiếu trong process pool (nếu cần), trả về tên -> đường dẫn tương đối
+        """
+        relative_path = relative_path.replace('\\', '/')
+        if self.is_derivative(relative_path):
+            raise ValueError("Không tạo ảnh thu nhỏ từ ảnh thu nhỏ")
+        cached = self.cached_variants(relative_path)
+        if len(cached) == len(IMAGE_VARIANTS):
+            return cached
+
+        pending = self._pending.get(relative_path)
+        if pending is None:
+            pending = asyncio.ensure_future(self._render(relative_path, [
+                variant for variant in IMAGE_VARIANTS if variant not in cached
+            ]))
+            self._pending[relative_path] = pending
+            pending.add_done_callback(lambda _: self._pending.pop(relative_path, None))
+        await asyncio.shield(pending)
+        return self.cached_variants(relative_path)
+
+    async def _render(self, relative_path: str, variants: List[str]) -> None:
+        source_path = self.source_path(relative_path)
+        if not os.path.isfile(source_path):
+            raise FileNotFoundError(relative_path)
+
+        targets = [(IMAGE_VARIANTS[variant], self.derivative_path(relative_path, variant)) for variant in variants]
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._ensure_executor(), _render_variants, source_path, targets, WEBP_QUALITY)
+        except BrokenProcessPool:
+            # Process pool bị hỏng (process con bị kill): tạo lại và thử một lần nữa
+            with self._lock:
+                self._executor = None
+            await loop.run_in_executor(self._ensure_executor(), _render_variants, source_path, targets, WEBP_QUALITY)
+
+    def variant_urls(self, relative_path: str, cached: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """
+        URL của từng phiên bản: file tĩnh nếu đã có trong cache,
+        ngược lại là endpoint /uploads/view?variant=... để tạo lúc được yêu cầu lần đầu
+        """
+        relative_path = relative_path.replace('\\', '/')
+        if cached is None:
+            cached = self.cached_variants(relative_path)
+
+        subfolder, filename = posixpath.split(relative_path)
+        urls = {}
+        for variant in IMAGE_VARIANTS:
+            if variant in cached:
+                urls[variant] = f"/uploads/{cached[variant]}"
+            else:
+                query = {"variant": variant}
+                if subfolder:
+                    query["subfolder"] = subfolder
+                urls[variant] = f"{settings.API_V1_STR}/uploads/view/{filename}?{urlencode(query)}"
+        return urls
+
+    def delete(self, relative_path: str) -> None:
+        for variant in IMAGE_VARIANTS:
+            try:
+                os.remove(self.derivative_path(relative_path, variant))
+            except (OSError, ValueError):
+                pass
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+image_derivatives = ImageDerivativeService(max_workers=settings.IMAGE_DERIVATIVE_WORKERS)
@@ -0,0 +1,109 @@
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import bindparam, or_
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.models.models import User
+
+
+class LastLoginRecorder:
+    """
+    Ghi nhận thời điểm truy cập gần nhất của user trong bộ nhớ và ghi xuống database theo lô.
+
+    Mỗi user chỉ giữ một giá trị (mới nhất) giữa hai lần flush; thread nền flush định kỳ
+    bằng một câu UPDATE executemany nên xác thực request không cần mở transaction ghi.
+    """
+
+    def __init__(self, session_factory=SessionLocal, flush_interval: Optional[float] = None):
+        self.session_factory = session_factory
+        self.flush_interval = settings.LAST_LOGIN_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self._pending: Dict[int, datetime] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, user: User, at: Optional[datetime] = None) -> None:
+        """
+        Ghi nhận truy cập của user. Bỏ qua nếu giá trị đã lưu còn mới hơn một chu kỳ flush.
+        """
+        at = at or datetime.utcnow()
+        last_login = user.last_login
+        if last_login is not None and at - last_login < timedelta(seconds=self.flush_interval):
+            return
+
+        with self._lock:
+            previous = self._pending.get(user.user_id)
+            if previous is None or previous < at:
+                self._pending[user.user_id] = at
+
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def flush(self) -> int:
+        """
+        Ghi các giá trị đang chờ bằng một câu UPDATE executemany, trả về số user được ghi
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+
+            users = User.__table__
+            statement = users.update().where(
+                users.c.user_id == bindparam('b_user_id'),
+                or_(users.c.last_login.is_(None), users.c.last_login < bindparam('b_last_login'))
+            ).values(last_login=bindparam('b_last_login'))
+
+            db = self.session_factory()
+            try:
+                db.execute(statement, [
+                    {'b_user_id': user_id, 'b_last_login': at}
+                    for user_id, at in pending.items()
+                ])
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                print(f"Error flushing last_login updates: {e}")
+                # Trả lại các giá trị chưa ghi để lần flush sau thử lại
+                with self._lock:
+                    for user_id, at in pending.items():
+                        if self._pending.get(user_id) is None or self._pending[user_id] < at:
+                            self._pending[user_id] = at
+                return 0
+            finally:
+                db.close()
+
+            return len(pending)
+
+    def start(self) -> None:
+        """
+        Khởi động thread nền flush định kỳ
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="last-login-recorder", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Dừng thread nền và flush phần còn lại
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+            self._thread = None
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+
+# Recorder dùng chung trong worker
+last_login_recorder = LastLoginRecorder()
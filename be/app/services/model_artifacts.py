@@ -0,0 +1,248 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+import joblib
+import numpy as np
+
+from app.core.config import settings
+
+# Tên các file trong một thư mục artifact
+MANIFEST_FILE = 'manifest.json'
+LATEST_POINTER_SUFFIX = 'LATEST'
+ARTIFACT_FORMAT_VERSION = 1
+
+# Đối tượng lớn lưu không nén để có thể memory-map khi tải (rừng cây quyết định),
+# các đối tượng còn lại lưu nén
+MMAP_OBJECTS = ('rf_model',)
+COMPRESSED_OBJECTS = ('lr_model', 'scaler')
+COMPRESS_LEVEL = 3
+
+
+def compute_data_hash(X: np.ndarray, y: Optional[np.ndarray] = None) -> str:
+    """
+    Dấu vân tay của dữ liệu huấn luyện (SHA-256 trên shape và nội dung mảng)
+    """
+    digest = hashlib.sha256()
+    for array in (X, y):
+        if array is None:
+            continue
+        array = np.ascontiguousarray(array)
+        digest.update(str(array.shape).encode())
+        digest.update(str(array.dtype).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def latest_pointer_path(models_dir: str, prefix: str) -> str:
+    return os.path.join(models_dir, f'{prefix}{LATEST_POINTER_SUFFIX}')
+
+
+def read_latest_pointer(models_dir: str, prefix: str) -> Optional[str]:
+    """
+    Đường dẫn artifact mà file con trỏ LATEST đang trỏ tới (None nếu chưa có hoặc đã bị xóa)
+    """
+    try:
+        with open(latest_pointer_path(models_dir, prefix), 'r', encoding='utf-8') as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    path = os.path.join(models_dir, name)
+    if not name or not os.path.isfile(os.path.join(path, MANIFEST_FILE)):
+        return None
+    return path
+
+
+def _write_latest_pointer(models_dir: str, prefix: str, name: str) -> None:
+    pointer = latest_pointer_path(models_dir, prefix)
+    tmp_path = f'{pointer}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(name)
+    os.replace(tmp_path, pointer)
+
+
+def _to_jsonable(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {str(k): _to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_jsonable(v) for v in value]
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return value
+
+
+def save_model_artifact(
+    models_dir: str,
+    prefix: str,
+    data: Dict[str, Any],
+    metrics: Optional[Dict[str, Any]] = None,
+    training_data_hash: Optional[str] = None,
+    retention: Optional[int] = None
+) -> str:
+    """
+    Lưu bộ mô hình thành thư mục artifact có manifest rồi chuyển con trỏ LATEST sang nó.
+
+    Thư mục được ghi dưới tên tạm rồi đổi tên nên registry không bao giờ thấy artifact ghi dở.
+    Sau khi lưu, các artifact cũ vượt quá số lượng giữ lại (ML_MODEL_RETENTION) bị xóa.
+    `data` được bổ sung 'manifest' và 'timestamp' (phiên bản thực tế của artifact).
+    """
+    os.makedirs(models_dir, exist_ok=True)
+    version = data.get('timestamp') or datetime.now().strftime('%Y%m%d_%H%M%S')
+    name = f'{prefix}{version}'
+    suffix = 1
+    while os.path.exists(os.path.join(models_dir, name)):
+        suffix += 1
+        name = f'{prefix}{version}_{suffix}'
+    version = name[len(prefix):]
+
+    artifact_path = os.path.join(models_dir, name)
+    tmp_path = f'{artifact_path}.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    try:
+        files = {}
+        for key, obj in data.items():
+            if key in MMAP_OBJECTS:
+                filename = f'{key}.joblib'
+                joblib.dump(obj, os.path.join(tmp_path, filename))
+            elif key in COMPRESSED_OBJECTS:
+                filename = f'{key}.joblib'
+                joblib.dump(obj, os.path.join(tmp_path, filename), compress=COMPRESS_LEVEL)
+            else:
+                continue
+            files[key] = filename
+
+        manifest = {
+            'format_version': ARTIFACT_FORMAT_VERSION,
+            'version': version,
+            'created_at': datetime.now().isoformat(),
+            'feature_names': list(data.get('feature_names') or []),
+            'best_params': _to_jsonable(data.get('best_params') or {}),
+            'metrics': _to_jsonable(metrics or {}),
+            'training_data_hash': training_data_hash,
+            'files': files
+        }
+        with open(os.path.join(tmp_path, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        os.replace(tmp_path, artifact_path)
+        data['timestamp'] = version
+        data['manifest'] = manifest
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    _write_latest_pointer(models_dir, prefix, name)
+    prune_model_artifacts(models_dir, prefix, retention, keep=artifact_path)
+    return artifact_path
+
+
+def load_model_artifact(path: str, mmap: bool = True) -> Dict[str, Any]:
+    """
+    Tải bộ mô hình từ thư mục artifact (mảng của rừng cây được memory-map)
+    hoặc từ file .pkl định dạng cũ
+    """
+    if not os.path.isdir(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    with open(os.path.join(path, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    data: Dict[str, Any] = {}
+    for key, filename in manifest.get('files', {}).items():
+        mmap_mode = 'r' if mmap and key in MMAP_OBJECTS else None
+        data[key] = joblib.load(os.path.join(path, filename), mmap_mode=mmap_mode)
+
+    data['feature_names'] = manifest.get('feature_names')
+    data['best_params'] = manifest.get('best_params') or {}
+    data['timestamp'] = manifest.get('version')
+    data['manifest'] = manifest
+    return data
+
+
+def list_model_artifacts(models_dir: str, prefix: str) -> List[Dict[str, Any]]:
+    """
+    Liệt kê artifact (thư mục có manifest) và file .pkl cũ, mới nhất trước
+    """
+    if not os.path.isdir(models_dir):
+        return []
+
+    entries = []
+    pointer_name = latest_pointer_path(models_dir, prefix)
+    for filename in os.listdir(models_dir):
+        path = os.path.join(models_dir, filename)
+        if not filename.startswith(prefix) or path == pointer_name or filename.endswith('.tmp'):
+            continue
+        if os.path.isdir(path):
+            if not os.path.isfile(os.path.join(path, MANIFEST_FILE)):
+                continue
+            kind = 'artifact'
+        elif filename.endswith('.pkl'):
+            kind = 'legacy'
+        else:
+            continue
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            continue
+        entries.append({'name': filename, 'path': path, 'kind': kind, 'mtime': mtime})
+
+    entries.sort(key=lambda entry: (entry['mtime'], entry['name']), reverse=True)
+    return entries
+
+
+def read_manifest(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(path, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def prune_model_artifacts(
+    models_dir: str,
+    prefix: str,
+    retention: Optional[int] = None,
+    keep: Optional[str] = None
+) -> List[str]:
+    """
+    Xóa các artifact/file .pkl cũ, chỉ giữ lại `retention` bản mới nhất
+    (luôn giữ artifact đang được con trỏ LATEST trỏ tới)
+    """
+    retention = settings.ML_MODEL_RETENTION if retention is None else retention
+    if retention <= 0:
+        return []
+
+    protected = {os.path.abspath(p) for p in (keep, read_latest_pointer(models_dir, prefix)) if p}
+    removed = []
+    for entry in list_model_artifacts(models_dir, prefix)[retention:]:
+        if os.path.abspath(entry['path']) in protected:
+            continue
+        try:
+            if entry['kind'] == 'artifact':
+                shutil.rmtree(entry['path'])
+            else:
+                os.remove(entry['path'])
+            removed.append(entry['name'])
+        except OSError as e:
+            print(f"Không thể xóa artifact mô hình {entry['path']}: {e}")
+
+    # Thư mục tạm còn sót lại từ lần lưu bị gián đoạn
+    for filename in os.listdir(models_dir):
+        if filename.startswith(prefix) and filename.endswith('.tmp'):
+            path = os.path.join(models_dir, filename)
+            if os.path.isdir(path) and time.time() - os.path.getmtime(path) > 3600:
+                shutil.rmtree(path, ignore_errors=True)
+
+    return removed
@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple
+
+from app.core.config import settings
+from app.services.model_artifacts import list_model_artifacts, load_model_artifact, read_latest_pointer
+
+
+class ModelBundle:
+    """
+    Bộ mô hình đã tải (không thay đổi sau khi tạo) được chia sẻ giữa các request
+    """
+
+    def __init__(self, data: Dict[str, Any], path: str, mtime: float):
+        self.data = data
+        self.path = path
+        self.mtime = mtime
+        self.loaded_at = time.time()
+        self.version = str(data.get('timestamp') or os.path.splitext(os.path.basename(path))[0])
+
+
+class ModelRegistry:
+    """
+    Registry mô hình dùng chung trong một worker: tải bộ mô hình một lần,
+    định kỳ kiểm tra file mới hơn (theo mtime) và thay thế nguyên tử.
+
+    Các dự đoán đang chạy giữ tham chiếu tới bundle cũ nên không bị chặn khi hot reload.
+    """
+
+    def __init__(self, models_dir: str, prefix: str, check_interval: Optional[float] = None):
+        self.models_dir = models_dir
+        self.prefix = prefix
+        self.check_interval = settings.ML_MODEL_RELOAD_INTERVAL if check_interval is None else check_interval
+        self._bundle: Optional[ModelBundle] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[ModelBundle]:
+        """
+        Trả về bundle hiện tại, tải hoặc hot reload nếu đến hạn kiểm tra
+        """
+        bundle = self._bundle
+        if bundle is not None and time.monotonic() - self._last_check < self.check_interval:
+            return bundle
+
+        if bundle is not None:
+            # Một thread khác đang kiểm tra/tải lại: tiếp tục dùng bundle hiện tại
+            if not self._lock.acquire(blocking=False):
+                return bundle
+        else:
+            self._lock.acquire()
+
+        try:
+            if self._bundle is None or time.monotonic() - self._last_check >= self.check_interval:
+                self._refresh()
+            return self._bundle
+        finally:
+            self._lock.release()
+
+    def publish(self, data: Dict[str, Any], path: str) -> ModelBundle:
+        """
+        Đăng ký bộ mô hình vừa huấn luyện để worker hiện tại dùng ngay mà không cần đọc lại file
+        """
+        mtime = os.path.getmtime(path) if os.path.exists(path) else time.time()
+        bundle = ModelBundle(data, path, mtime)
+        with self._lock:
+            self._bundle = bundle
+            self._last_check = time.monotonic()
+        return bundle
+
+    def invalidate(self) -> None:
+        """
+        Buộc lần gọi get() tiếp theo kiểm tra lại thư mục mô hình
+        """
+        self._last_check = 0.0
+
+    def _find_latest(self) -> Optional[Tuple[str, float]]:
+        """
+        Artifact được con trỏ LATEST trỏ tới; nếu chưa có con trỏ thì lấy
+        artifact hoặc file .pkl cũ mới nhất theo mtime
+        """
+        path = read_latest_pointer(self.models_dir, self.prefix)
+        if path is None:
+            entries = list_model_artifacts(self.models_dir, self.prefix)
+            if not entries:
+                return None
+            path = entries[0]['path']
+
+        try:
+            return path, os.path.getmtime(path)
+        except OSError:
+            return None
+
+    def _refresh(self) -> None:
+        self._last_check = time.monotonic()
+        latest = self._find_latest()
+        if latest is None:
+            return
+
+        path, mtime = latest
+        current = self._bundle
+        if current is not None and current.path == path and current.mtime == mtime:
+            return
+
+        try:
+            data = load_model_artifact(path)
+        except Exception as e:
+            print(f"Lỗi khi tải mô hình từ {path}: {e}")
+            return
+
+        # Thay thế tham chiếu là thao tác nguyên tử
+        self._bundle = ModelBundle(data, path, mtime)
+        print(f"Đã tải mô hình từ: {path}")
+
+
+_registries: Dict[Tuple[str, str], ModelRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_model_registry(models_dir: str, prefix: str) -> ModelRegistry:
+    """
+    Lấy registry dùng chung cho một thư mục mô hình và tiền tố file
+    """
+    key = (os.path.abspath(models_dir), prefix)
+    registry = _registries.get(key)
+    if registry is None:
+        with _registries_lock:
+            registry = _registries.get(key)
+            if registry is None:
+                registry = ModelRegistry(key[0], prefix)
+                _registries[key] = registry
+    return registry
+
@@ -0,0 +1,95 @@
+import time
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import GridSearchCV, RandomizedSearchCV, HalvingGridSearchCV, ParameterGrid
+
+# Các chiến lược tìm kiếm siêu tham số được hỗ trợ
+GRID_SEARCH = "grid"
+RANDOM_SEARCH = "random"
+HALVING_SEARCH = "halving"
+SEARCH_STRATEGIES = (GRID_SEARCH, RANDOM_SEARCH, HALVING_SEARCH)
+
+
+def narrow_param_grid(param_grid: Dict[str, List[Any]], best_params: Optional[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """
+    Thu hẹp lưới tham số quanh best_params của lần huấn luyện trước:
+    mỗi tham số chỉ giữ giá trị cũ và các giá trị liền kề trong lưới
+    """
+    if not best_params:
+        return param_grid
+
+    narrowed = {}
+    for name, values in param_grid.items():
+        if name not in best_params or best_params[name] not in values:
+            narrowed[name] = values
+            continue
+        index = values.index(best_params[name])
+        narrowed[name] = values[max(0, index - 1):index + 2]
+    return narrowed
+
+
+def search_hyperparameters(
+    estimator,
+    param_grid: Dict[str, List[Any]],
+    X: np.ndarray,
+    y: np.ndarray,
+    strategy: str = GRID_SEARCH,
+    cv: int = 5,
+    budget: int = 20,
+    warm_start_params: Optional[Dict[str, Any]] = None,
+    random_state: int = 42
+) -> Dict[str, Any]:
+    """
+    Tìm siêu tham số tốt nhất theo chiến lược: grid (vét cạn), random (giới hạn số ứng viên)
+    hoặc halving (successive halving - loại dần ứng viên kém trên tập mẫu nhỏ)
+
+    Returns:
+        Dict gồm best_estimator, best_params, best_score, số ứng viên và thời gian tìm kiếm (giây)
+    """
+    if strategy not in SEARCH_STRATEGIES:
+        raise ValueError(f"Chiến lược tìm kiếm không hợp lệ: {strategy}")
+
+    grid = narrow_param_grid(param_grid, warm_start_params)
+    candidates = len(ParameterGrid(grid))
+
+    if strategy == RANDOM_SEARCH and budget < candidates:
+        search = RandomizedSearchCV(
+            estimator, grid, n_iter=budget, cv=cv, scoring='roc_auc',
+            n_jobs=-1, random_state=random_state
+        )
+        candidates = budget
+    elif strategy == HALVING_SEARCH:
+        halving_options = {}
+        if 'n_estimators' in grid:
+            # Với mô hình ensemble, số cây là tài nguyên rẻ hơn nhiều so với số mẫu:
+            # các ứng viên được đánh giá với ít cây trước, chỉ ứng viên tốt mới dùng đủ số cây
+            grid = {name: values for name, values in grid.items() if name != 'n_estimators'}
+            halving_options = {
+                'resource': 'n_estimators',
+                'max_resources': max(param_grid['n_estimators'])
+            }
+        search = HalvingGridSearchCV(
+            estimator, grid, factor=3, cv=cv, scoring='roc_auc',
+            n_jobs=-1, random_state=random_state, **halving_options
+        )
+        candidates = len(ParameterGrid(grid))
+    else:
+        search = GridSearchCV(estimator, grid, cv=cv, scoring='roc_auc', n_jobs=-1)
+
+    start = time.perf_counter()
+    search.fit(X, y)
+    search_time = time.perf_counter() - start
+
+    best_params = dict(search.best_params_)
+    if strategy == HALVING_SEARCH and 'n_estimators' in param_grid:
+        best_params['n_estimators'] = search.best_estimator_.n_estimators
+
+    return {
+        'best_estimator': search.best_estimator_,
+        'best_params': best_params,
+        'best_score': float(search.best_score_),
+        'candidates': candidates,
+        'search_time_seconds': round(search_time, 3)
+    }
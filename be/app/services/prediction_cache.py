@@ -0,0 +1,47 @@
+import copy
+import hashlib
+from typing import Dict, Any, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.utils.cache import TTLCache
+
+# Cache kết quả dự đoán ML dùng chung trong worker
+prediction_cache = TTLCache(
+    maxsize=settings.ML_PREDICTION_CACHE_SIZE,
+    ttl=settings.ML_PREDICTION_CACHE_TTL
+)
+
+
+def make_prediction_key(
+    student_id: int,
+    feature_vector: np.ndarray,
+    model_version: Optional[str],
+    use_ensemble: bool
+) -> Optional[tuple]:
+    """
+    Khóa cache gồm student_id, dấu vân tay của vector đặc trưng và phiên bản mô hình.
+    Trả về None nếu chưa xác định được phiên bản mô hình (không cache).
+    """
+    if not model_version:
+        return None
+    vector = np.round(np.asarray(feature_vector, dtype=float), 6)
+    fingerprint = hashlib.sha1(vector.tobytes()).hexdigest()
+    return (student_id, fingerprint, model_version, bool(use_ensemble))
+
+
+def get_cached_prediction(key: Optional[tuple]) -> Optional[Dict[str, Any]]:
+    if key is None:
+        return None
+    result = prediction_cache.get(key)
+    return copy.deepcopy(result) if result is not None else None
+
+
+def cache_prediction(key: Optional[tuple], result: Dict[str, Any]) -> None:
+    """
+    Chỉ cache kết quả đã được lưu vào database để lần gọi sau không tạo bản ghi trùng
+    """
+    if key is None or not result or result.get("risk_id") in (None, -1):
+        return
+    prediction_cache.set(key, copy.deepcopy(result))
@@ -0,0 +1,108 @@
+import threading
+from typing import Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import User, Teacher, Student
+from app.utils.cache import TTLCache
+
+
+class Principal:
+    """
+    Danh tính đã xác thực: bản sao user (tách khỏi session) cùng teacher_id/student_id
+    """
+
+    def __init__(self, user: User, teacher_id: Optional[int] = None, student_id: Optional[int] = None):
+        self.user = user
+        self.user_id = user.user_id
+        self.username = user.username
+        self.role = user.role
+        self.teacher_id = teacher_id
+        self.student_id = student_id
+
+
+class PrincipalCache:
+    """
+    Cache ngắn hạn các principal theo username (subject của JWT) để phần lớn request
+    xác thực mà không truy vấn bảng users/teachers/students
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._usernames: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def get(self, username: str) -> Optional[Principal]:
+        return self._cache.get(username)
+
+    def set(self, principal: Principal) -> None:
+        with self._lock:
+            self._usernames[principal.user_id] = principal.username
+        self._cache.set(principal.username, principal)
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self._lock:
+            username = self._usernames.pop(user_id, None)
+        if username is not None:
+            self._cache.delete(username)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._usernames.clear()
+        self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
+
+
+principal_cache = PrincipalCache(
+    maxsize=settings.AUTH_PRINCIPAL_CACHE_SIZE,
+    ttl=settings.AUTH_PRINCIPAL_CACHE_TTL
+)
+
+
+def load_principal(db: Session, username: str) -> Optional[Principal]:
+    """
+    Tải user cùng teacher_id/student_id trong một truy vấn và tách user khỏi session
+    """
+    row = db.query(User, Teacher.teacher_id, Student.student_id).outerjoin(
+        Teacher, Teacher.user_id == User.user_id
+    ).outerjoin(
+        Student, Student.user_id == User.user_id
+    ).filter(User.username == username).first()
+    if row is None:
+        return None
+
+    user, teacher_id, student_id = row
+    db.expunge(user)
+    return Principal(user, teacher_id=teacher_id, student_id=student_id)
+
+
+def resolve_principal(db: Session, username: str) -> Optional[Principal]:
+    """
+    Lấy principal từ cache, chỉ truy vấn database khi hết hạn hoặc chưa có
+    """
+    principal = principal_cache.get(username)
+    if principal is None:
+        principal = load_principal(db, username)
+        if principal is None:
+            return None
+        principal_cache.set(principal)
+    return principal
+
+
+def attach_user(db: Session, principal: Principal) -> User:
+    """
+    Gắn bản sao user của principal vào session của request mà không truy vấn lại
+    (bản trong cache không bị thay đổi)
+    """
+    return db.merge(principal.user, load=False)
+
+
+def invalidate_principal(user_id: Optional[int]) -> None:
+    """
+    Xóa principal của user khỏi cache (gọi khi user, trạng thái tài khoản hoặc hồ sơ thay đổi)
+    """
+    if user_id is not None:
+        principal_cache.invalidate_user(user_id)
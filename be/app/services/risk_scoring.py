@@ -0,0 +1,385 @@
+from typing import Dict, List, Any, Optional, Iterable, Tuple
+from datetime import datetime
+from sqlalchemy.orm import Session
+import numpy as np
+
+from app.crud.dropout_risk import create_dropout_risks_bulk
+from app.crud.student_feature import get_student_feature_matrix
+from app.schemas.schemas import DropoutRiskCreate
+from app.services.student_feature_extractor import StudentFeatureExtractor, DEFAULT_FEATURE_NAMES
+from app.services.model_registry import get_model_registry
+
+# Thư mục và tiền tố file mô hình Gradient Boosting của service dự báo kết hợp
+GRADIENT_BOOSTING_MODELS_DIR = "models"
+GRADIENT_BOOSTING_FILE_PREFIX = "dropout_risk_model_"
+
+RULE_BASED = "rule_based"
+GRADIENT_BOOSTING = "gradient_boosting"
+HYBRID = "hybrid"
+ML_ENSEMBLE = "ml_ensemble"
+
+# Trọng số các yếu tố rủi ro của bộ chấm điểm theo luật
+RULE_WEIGHTS = {
+    "low_gpa": 30,
+    "failed_subjects": 25,
+    "academic_warning": 20,
+    "poor_attendance": 25,
+    "disciplinary_issues": 15,
+    "dropped_classes": 10,
+    "financial_issues": 15
+}
+
+# Mức rủi ro tối thiểu theo tình trạng học tập (suspended, probation, warning)
+ACADEMIC_STATUS_FLOORS = ((3, 80.0), (2, 60.0), (1, 40.0))
+
+# Tỷ trọng của điểm theo luật khi kết hợp với Gradient Boosting
+HYBRID_RULE_WEIGHT = 0.7
+
+
+def get_risk_level(risk_percentage: float) -> str:
+    """
+    Xác định mức độ rủi ro
+    """
+    if risk_percentage >= 80:
+        return "Rất cao"
+    elif risk_percentage >= 60:
+        return "Cao"
+    elif risk_percentage >= 40:
+        return "Trung bình"
+    elif risk_percentage >= 20:
+        return "Thấp"
+    else:
+        return "Rất thấp"
+
+
+def _apply_academic_status_floor(risk: np.ndarray, academic_status: np.ndarray) -> np.ndarray:
+    risk = risk.copy()
+    for status_code, floor in ACADEMIC_STATUS_FLOORS:
+        mask = academic_status == status_code
+        risk[mask] = np.maximum(risk[mask], floor)
+    return np.minimum(risk, 100.0)
+
+
+class FeatureBatch:
+    """
+    Ma trận đặc trưng của một nhóm sinh viên, dùng chung cho mọi bộ chấm điểm trong một request
+    """
+
+    def __init__(self, db: Session, student_ids: List[int], matrix: np.ndarray, feature_names: List[str]):
+        self.db = db
+        self.student_ids = student_ids
+        self.matrix = matrix
+        self.feature_names = list(feature_names)
+        self._index = {name: i for i, name in enumerate(self.feature_names)}
+        self._rows: Optional[List[Dict[str, Any]]] = None
+
+    def __len__(self) -> int:
+        return len(self.student_ids)
+
+    def column(self, name: str) -> np.ndarray:
+        return self.matrix[:, self._index[name]]
+
+    def select(self, feature_names: Iterable[str]) -> np.ndarray:
+        """
+        Các cột theo thứ tự đặc trưng mà một mô hình yêu cầu
+        """
+        return self.matrix[:, [self._index[name] for name in feature_names]]
+
+    def rows(self) -> List[Dict[str, Any]]:
+        if self._rows is None:
+            extractor = StudentFeatureExtractor(self.db, self.feature_names)
+            self._rows = [extractor.row_to_dict(row) for row in self.matrix]
+        return self._rows
+
+
+class FeatureProvider:
+    """
+    Nạp đặc trưng theo lô từ bảng student_risk_features
+    (tính lại từ dữ liệu gốc nếu bảng chưa sẵn sàng)
+    """
+
+    def __init__(self, db: Session, feature_names: Optional[List[str]] = None):
+        self.db = db
+        self.feature_names = list(feature_names or DEFAULT_FEATURE_NAMES)
+
+    def load(self, student_ids: Optional[Iterable[int]] = None) -> FeatureBatch:
+        ids = None if student_ids is None else list(student_ids)
+        try:
+            found_ids, matrix = get_student_feature_matrix(self.db, ids, self.feature_names)
+        except Exception as e:
+            print(f"Feature store unavailable, extracting features from raw data: {e}")
+            found_ids, matrix = StudentFeatureExtractor(self.db, self.feature_names).extract_batch(ids)
+        return FeatureBatch(self.db, found_ids, matrix, self.feature_names)
+
+
+class ScorerUnavailable(Exception):
+    """
+    Bộ chấm điểm không dùng được (ví dụ chưa có mô hình được huấn luyện)
+    """
+
+
+class RiskScorer:
+    """
+    Bộ chấm điểm nguy cơ bỏ học. Mỗi bộ nhận cùng một FeatureBatch và trả về
+    risk_percentage (mảng NumPy), risk_factors và details cho từng sinh viên.
+    """
+
+    name: str = ""
+    # Các bộ chấm điểm khác cần chạy trước (kết quả được truyền vào qua `scores`)
+    requires: Tuple[str, ...] = ()
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.model_version: Optional[str] = None
+
+    def score(self, batch: FeatureBatch, scores: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class RuleBasedScorer(RiskScorer):
+    """
+    Chấm điểm theo trọng số các yếu tố rủi ro
+    """
+
+    name = RULE_BASED
+
+    def risk_factor_masks(self, batch: FeatureBatch) -> Dict[str, np.ndarray]:
+        return {
+            "low_gpa": batch.column("avg_gpa") < 6.0,
+            "failed_subjects": batch.column("failed_subjects") > 0,
+            "academic_warning": batch.column("previous_academic_warning") > 0,
+            "poor_attendance": batch.column("attendance_rate") < 80.0,
+            "disciplinary_issues": (
+                (batch.column("minor_violations") > 2) |
+                (batch.column("moderate_violations") > 0) |
+                (batch.column("severe_violations") > 0)
+            ),
+            "dropped_classes": batch.column("dropped_classes") > 0,
+            "financial_issues": (
+                (batch.column("family_income_level") < 2) &
+                (batch.column("scholarship_status") == 0)
+            )
+        }
+
+    def score(self, batch: FeatureBatch, scores: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        masks = self.risk_factor_masks(batch)
+        total_weight = sum(RULE_WEIGHTS.values())
+        risk_score = sum(RULE_WEIGHTS[factor] * mask.astype(float) for factor, mask in masks.items())
+        risk = _apply_academic_status_floor(risk_score / total_weight * 100, batch.column("academic_status"))
+
+        factor_lists = {factor: mask.tolist() for factor, mask in masks.items()}
+        return {
+            "risk_percentage": risk,
+            "risk_factors": [
+                {factor: values[i] for factor, values in factor_lists.items()}
+                for i in range(len(batch))
+            ]
+        }
+
+
+class GradientBoostingScorer(RiskScorer):
+    """
+    Xác suất nguy cơ cao từ mô hình Gradient Boosting đã huấn luyện của service dự báo
+    """
+
+    name = GRADIENT_BOOSTING
+    requires = (RULE_BASED,)
+
+    def score(self, batch: FeatureBatch, scores: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        bundle = get_model_registry(GRADIENT_BOOSTING_MODELS_DIR, GRADIENT_BOOSTING_FILE_PREFIX).get()
+        if bundle is None:
+            raise ScorerUnavailable("Chưa có mô hình Gradient Boosting được huấn luyện")
+        model_data = bundle.data
+        self.model_version = bundle.version
+
+        X = model_data["scaler"].transform(batch.select(model_data["features"]))
+        risk = model_data["model"].predict_proba(X)[:, 1] * 100
+        return {
+            "risk_percentage": risk,
+            "risk_factors": scores[RULE_BASED]["risk_factors"]
+        }
+
+
+class HybridScorer(RiskScorer):
+    """
+    Kết hợp điểm theo luật (70%) và Gradient Boosting (30%);
+    chỉ dùng điểm theo luật khi chưa có mô hình
+    """
+
+    name = HYBRID
+    requires = (RULE_BASED, GRADIENT_BOOSTING)
+
+    def score(self, batch: FeatureBatch, scores: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        rule_based = scores[RULE_BASED]
+        gradient_boosting = scores.get(GRADIENT_BOOSTING)
+        if gradient_boosting is None:
+            # Bản sao: run() ghi model_version vào kết quả, không được ghi đè kết quả của rule_based
+            return dict(rule_based)
+
+        self.model_version = gradient_boosting.get("model_version")
+        risk = (
+            HYBRID_RULE_WEIGHT * rule_based["risk_percentage"] +
+            (1 - HYBRID_RULE_WEIGHT) * gradient_boosting["risk_percentage"]
+        )
+        return {
+            "risk_percentage": _apply_academic_status_floor(risk, batch.column("academic_status")),
+            "risk_factors": rule_based["risk_factors"]
+        }
+
+
+class MLEnsembleScorer(RiskScorer):
+    """
+    Ensemble Random Forest + Logistic Regression của service ML
+    """
+
+    name = ML_ENSEMBLE
+
+    def score(self, batch: FeatureBatch, scores: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        from app.services.dropout_risk_ml_service import MLDropoutRiskPredictionService
+
+        ml_service = MLDropoutRiskPredictionService(self.db)
+        if not ml_service._load_models():
+            raise ScorerUnavailable("Chưa có mô hình ML được huấn luyện")
+        self.model_version = ml_service.model_version
+
+        result = ml_service._score_matrix(batch.select(ml_service.feature_names))
+        rf_proba = (result["rf_proba"] * 100).tolist()
+        lr_proba = (result["lr_proba"] * 100).tolist()
+        return {
+            "risk_percentage": result["ensemble_proba"] * 100,
+            "risk_factors": [ml_service._analyze_risk_factors(row) for row in batch.rows()],
+            "details": [
+                {"random_forest": rf, "logistic_regression": lr}
+                for rf, lr in zip(rf_proba, lr_proba)
+            ]
+        }
+
+
+SCORERS = {
+    RULE_BASED: RuleBasedScorer,
+    GRADIENT_BOOSTING: GradientBoostingScorer,
+    HYBRID: HybridScorer,
+    ML_ENSEMBLE: MLEnsembleScorer,
+}
+
+
+class RiskScoringEngine:
+    """
+    Động cơ chấm điểm nguy cơ bỏ học: nạp đặc trưng một lần cho cả nhóm sinh viên
+    rồi đưa cùng ma trận vào mọi bộ chấm điểm được yêu cầu
+    """
+
+    def __init__(self, db: Session, feature_provider: Optional[FeatureProvider] = None):
+        self.db = db
+        self.feature_provider = feature_provider or FeatureProvider(db)
+
+    def run(self, batch: FeatureBatch, scorer_names: Iterable[str]) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+        """
+        Chạy các bộ chấm điểm (kèm các bộ phụ thuộc) trên cùng một FeatureBatch
+
+        Returns:
+            Tuple gồm kết quả theo tên bộ chấm điểm và trạng thái của từng bộ
+            (available, model_version, error)
+        """
+        scores: Dict[str, Dict[str, Any]] = {}
+        status: Dict[str, Dict[str, Any]] = {}
+
+        def run_scorer(name: str) -> None:
+            if name in status:
+                return
+            scorer_class = SCORERS.get(name)
+            if scorer_class is None:
+                raise ValueError(f"Bộ chấm điểm không hợp lệ: {name}")
+            for dependency in scorer_class.requires:
+                run_scorer(dependency)
+
+            scorer = scorer_class(self.db)
+            try:
+                result = scorer.score(batch, scores) if len(batch) else {"risk_percentage": np.zeros(0), "risk_factors": []}
+            except ScorerUnavailable as e:
+                status[name] = {"available": False, "model_version": None, "error": str(e)}
+                return
+            result["model_version"] = scorer.model_version
+            scores[name] = result
+            status[name] = {"available": True, "model_version": scorer.model_version, "error": None}
+
+        for name in scorer_names:
+            run_scorer(name)
+        return scores, status
+
+    def score_students(
+        self,
+        student_ids: Optional[Iterable[int]],
+        scorer_names: Iterable[str],
+        save_with: Optional[str] = None,
+        include_features: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Chấm điểm nhiều sinh viên với các bộ chấm điểm được chọn
+
+        Args:
+            student_ids: Danh sách sinh viên (None = tất cả)
+            scorer_names: Tên các bộ chấm điểm (rule_based, gradient_boosting, hybrid, ml_ensemble)
+            save_with: Lưu kết quả của bộ chấm điểm này vào dropout_risks trong một transaction
+            include_features: Trả về cả vector đặc trưng của từng sinh viên
+        """
+        requested = list(dict.fromkeys(scorer_names))
+        if save_with and save_with not in requested:
+            requested.append(save_with)
+
+        batch = self.feature_provider.load(student_ids)
+        scores, status = self.run(batch, requested)
+
+        risk_ids = [None] * len(batch)
+        analysis_dates = [datetime.now()] * len(batch)
+        if save_with:
+            if save_with not in scores:
+                raise ValueError(f"Bộ chấm điểm {save_with} không khả dụng: {status[save_with]['error']}")
+            saved = self.save(batch, scores[save_with])
+            risk_ids = [risk.risk_id for risk in saved]
+            analysis_dates = [risk.analysis_date for risk in saved]
+
+        results = []
+        for i, student_id in enumerate(batch.student_ids):
+            student_scores = {}
+            for name in requested:
+                if name not in scores:
+                    continue
+                risk_percentage = float(scores[name]["risk_percentage"][i])
+                student_scores[name] = {
+                    "risk_percentage": risk_percentage,
+                    "risk_level": get_risk_level(risk_percentage),
+                    "risk_factors": scores[name]["risk_factors"][i]
+                }
+                if scores[name].get("details"):
+                    student_scores[name]["details"] = scores[name]["details"][i]
+
+            result = {
+                "student_id": student_id,
+                "risk_id": risk_ids[i],
+                "analysis_date": analysis_dates[i],
+                "scores": student_scores
+            }
+            if include_features:
+                result["features"] = batch.rows()[i]
+            results.append(result)
+
+        return {
+            "scorers": {name: status[name] for name in requested},
+            "results": results
+        }
+
+    def save(self, batch: FeatureBatch, score: Dict[str, Any]) -> List[Any]:
+        """
+        Lưu kết quả của một bộ chấm điểm vào bảng dropout_risks trong một transaction
+        """
+        return create_dropout_risks_bulk(self.db, [
+            DropoutRiskCreate(
+                student_id=student_id,
+                risk_percentage=float(risk_percentage),
+                risk_factors=risk_factors
+            )
+            for student_id, risk_percentage, risk_factors in zip(
+                batch.student_ids, score["risk_percentage"].tolist(), score["risk_factors"]
+            )
+        ])
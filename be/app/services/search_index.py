@@ -0,0 +1,460 @@
+import bisect
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.models.models import User, Student, Teacher
+
+# Trọng số của từng trường khi xếp hạng kết quả
+FIELD_WEIGHTS = {"code": 3.0, "full_name": 2.0, "email": 1.0}
+
+# Điểm của một từ khóa theo kiểu khớp
+EXACT_SCORE = 1.0
+PREFIX_SCORE = 0.6
+FUZZY_SCORE = 0.5
+FUZZY_MIN_SIMILARITY = 0.4
+# Từ khóa ngắn hơn chỉ khớp đúng (một ký tự khớp tiền tố với gần như mọi bản ghi)
+MIN_PREFIX_LENGTH = 2
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_CODE_PART_RE = re.compile(r"[a-z]+|[0-9]+")
+
+
+def normalize_text(text: Any) -> str:
+    """
+    Chuẩn hóa để so khớp không dấu: chữ thường, bỏ dấu tiếng Việt, đ -> d
+    """
+    text = str(text).lower().replace("đ", "d")
+    text = unicodedata.normalize("NFD", text)
+    return "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+
+
+def tokenize(text: Any) -> List[str]:
+    return _TOKEN_RE.findall(normalize_text(text)) if text else []
+
+
+def trigrams(token: str) -> Set[str]:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _field_tokens(field: str, value: Any) -> Set[str]:
+    tokens = set(tokenize(value))
+    if field == "code":
+        # "SV0012" cũng tìm được bằng "sv" hoặc "0012"
+        for token in list(tokens):
+            tokens.update(_CODE_PART_RE.findall(token))
+    return tokens
+
+
+class _FieldIndex:
+    """
+    Chỉ mục của một trường: từ -> id, danh sách từ đã sắp xếp (tìm theo tiền tố)
+    và trigram -> từ (tìm gần đúng)
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Set[int]] = defaultdict(set)
+        self.sorted_tokens: List[str] = []
+        self.trigram_tokens: Dict[str, Set[str]] = defaultdict(set)
+
+    def add(self, doc_id: int, tokens: Set[str], keep_sorted: bool = True) -> None:
+        for token in tokens:
+            ids = self.postings[token]
+            if not ids:
+                if keep_sorted:
+                    bisect.insort(self.sorted_tokens, token)
+                for gram in trigrams(token):
+                    self.trigram_tokens[gram].add(token)
+            ids.add(doc_id)
+
+    def sort_tokens(self) -> None:
+        # Khi dựng lại toàn bộ, sắp xếp một lần thay vì insort từng từ
+        self.sorted_tokens = sorted(self.postings)
+
+    def remove(self, doc_id: int, tokens: Set[str]) -> None:
+        for token in tokens:
+            ids = self.postings.get(token)
+            if ids is None:
+                continue
+            ids.discard(doc_id)
+            if not ids:
+                del self.postings[token]
+                position = bisect.bisect_left(self.sorted_tokens, token)
+                if position < len(self.sorted_tokens) and self.sorted_tokens[position] == token:
+                    del self.sorted_tokens[position]
+                for gram in trigrams(token):
+                    grams = self.trigram_tokens.get(gram)
+                    if grams is not None:
+                        grams.discard(token)
+                        if not grams:
+                            del self.trigram_tokens[gram]
+
+    def match(self, query_token: str) -> Dict[int, float]:
+        """
+        Điểm tốt nhất của mỗi id cho một từ khóa: khớp đúng hoặc khớp tiền tố
+        """
+        scores: Dict[int, float] = {}
+        _award(scores, self.postings.get(query_token, ()), EXACT_SCORE)
+
+        if len(query_token) >= MIN_PREFIX_LENGTH:
+            position = bisect.bisect_left(self.sorted_tokens, query_token)
+            while position < len(self.sorted_tokens) and self.sorted_tokens[position].startswith(query_token):
+                token = self.sorted_tokens[position]
+                if token != query_token:
+                    # Tiền tố càng gần độ dài của từ càng được ưu tiên
+                    _award(scores, self.postings[token], PREFIX_SCORE + 0.3 * len(query_token) / len(token))
+                position += 1
+        return scores
+
+    def fuzzy_match(self, query_token: str) -> Dict[int, float]:
+        """
+        So khớp gần đúng theo độ tương đồng trigram (gõ sai, thiếu ký tự)
+        """
+        scores: Dict[int, float] = {}
+        if len(query_token) < 3:
+            return scores
+        query_grams = trigrams(query_token)
+        shared: Dict[str, int] = defaultdict(int)
+        for gram in query_grams:
+            for token in self.trigram_tokens.get(gram, ()):
+                shared[token] += 1
+        for token, count in shared.items():
+            similarity = count / (len(query_grams) + len(trigrams(token)) - count)
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                _award(scores, self.postings[token], FUZZY_SCORE * similarity)
+        return scores
+
+
+def _award(scores: Dict[int, float], ids, score: float) -> None:
+    for doc_id in ids:
+        if scores.get(doc_id, 0.0) < score:
+            scores[doc_id] = score
+
+
+class _IndexState:
+    """
+    Dữ liệu của chỉ mục: tài liệu, từ của từng tài liệu và chỉ mục theo trường
+    """
+
+    def __init__(self):
+        self.docs: Dict[int, Dict[str, Any]] = {}
+        self.doc_tokens: Dict[int, Dict[str, Set[str]]] = {}
+        self.user_ids: Dict[int, int] = {}
+        self.fields = {field: _FieldIndex() for field in FIELD_WEIGHTS}
+
+    def add(self, document: Dict[str, Any], keep_sorted: bool = True) -> None:
+        doc_id = document["id"]
+        tokens = {field: _field_tokens(field, document.get(field)) for field in FIELD_WEIGHTS}
+        for field, field_tokens in tokens.items():
+            self.fields[field].add(doc_id, field_tokens, keep_sorted=keep_sorted)
+        self.docs[doc_id] = document
+        self.doc_tokens[doc_id] = tokens
+        if document.get("user_id") is not None:
+            self.user_ids[document["user_id"]] = doc_id
+
+    def remove(self, doc_id: int) -> None:
+        document = self.docs.pop(doc_id, None)
+        tokens = self.doc_tokens.pop(doc_id, None)
+        if document is None:
+            return
+        for field, field_tokens in tokens.items():
+            self.fields[field].remove(doc_id, field_tokens)
+        if self.user_ids.get(document.get("user_id")) == doc_id:
+            del self.user_ids[document["user_id"]]
+
+
+class SearchIndex:
+    """
+    Chỉ mục tìm kiếm trong bộ nhớ cho sinh viên hoặc giáo viên (mã, họ tên, email).
+
+    So khớp không dấu theo tiền tố và trigram, xếp hạng theo trọng số trường.
+    Các bản ghi thay đổi qua CRUD được đánh dấu và nạp lại ở lần tìm kiếm sau. Thay đổi từ worker khác
+    (bản ghi mới, user có updated_at mới hơn) được nạp bù sau tối đa sync_interval giây;
+    chỉ mục được dựng lại toàn bộ định kỳ (trong thread nền) để bỏ các bản ghi đã xóa.
+    """
+
+    def __init__(self, name: str, loader: Callable[..., List[Dict[str, Any]]],
+                 session_factory: Callable[[], Session] = SessionLocal, refresh_interval: Optional[float] = None,
+                 sync_interval: Optional[float] = None):
+        self.name = name
+        self._loader = loader
+        self.session_factory = session_factory
+        self.refresh_interval = settings.SEARCH_INDEX_REFRESH_INTERVAL if refresh_interval is None else refresh_interval
+        self.sync_interval = settings.SEARCH_INDEX_SYNC_INTERVAL if sync_interval is None else sync_interval
+        # Mốc đã nạp: updated_at lớn nhất của user và id lớn nhất trong chỉ mục
+        self._synced_at: Optional[float] = None
+        self._changed_since: Optional[datetime] = None
+        self._max_id: Optional[int] = None
+        self._lock = threading.Lock()
+        self._state = _IndexState()
+        self._built_at: Optional[float] = None
+        self._building = False
+        self._dirty_ids: Set[int] = set()
+        self._dirty_user_ids: Set[int] = set()
+
+    # ----- Bảo trì chỉ mục -----
+
+    def mark_changed(self, doc_id: Optional[int]) -> None:
+        if doc_id is not None:
+            with self._lock:
+                self._dirty_ids.add(doc_id)
+
+    def mark_user_changed(self, user_id: Optional[int]) -> None:
+        if user_id is not None:
+            with self._lock:
+                self._dirty_user_ids.add(user_id)
+
+    def invalidate(self) -> None:
+        """
+        Buộc dựng lại toàn bộ chỉ mục ở lần tìm kiếm sau
+        """
+        with self._lock:
+            self._built_at = None
+
+    def refresh(self, db: Session) -> None:
+        """
+        Dựng chỉ mục nếu chưa có; nếu đã cũ thì dựng lại trong thread nền và tạm dùng bản hiện tại.
+        Các bản ghi đã đánh dấu được nạp lại ngay. Truy vấn database không giữ lock
+        (có thể được gọi qua AsyncSession.run_sync).
+        """
+        with self._lock:
+            if self._built_at is None:
+                never_built, start_rebuild = True, False
+            else:
+                never_built = False
+                start_rebuild = (
+                    not self._building and time.monotonic() - self._built_at > self.refresh_interval
+                )
+                if start_rebuild:
+                    self._building = True
+            dirty_ids = set(self._dirty_ids)
+            dirty_ids.update(
+                self._state.user_ids[user_id] for user_id in self._dirty_user_ids if user_id in self._state.user_ids
+            )
+
+        if never_built:
+            self.rebuild(db)
+            return
+
+        if start_rebuild:
+            threading.Thread(target=self._rebuild_in_background, name=f"search-index-{self.name}", daemon=True).start()
+
+        if dirty_ids:
+            with self._lock:
+                self._dirty_ids.difference_update(dirty_ids)
+                self._dirty_user_ids.clear()
+            documents = self._loader(db, sorted(dirty_ids))
+            with self._lock:
+                for doc_id in dirty_ids:
+                    self._state.remove(doc_id)
+                for document in documents:
+                    self._state.add(document)
+
+        self._sync_changes(db)
+
+    def _sync_changes(self, db: Session) -> None:
+        """
+        Nạp bù bản ghi mới hoặc đổi tên/email ở worker khác kể từ mốc đã nạp (tối đa mỗi sync_interval giây)
+        """
+        with self._lock:
+            if self._synced_at is None or time.monotonic() - self._synced_at < self.sync_interval:
+                return
+            self._synced_at = time.monotonic()
+            changed_since, after_id = self._changed_since, self._max_id
+
+        documents = self._loader(db, None, changed_since=changed_since, after_id=after_id or 0)
+        if not documents:
+            return
+        with self._lock:
+            for document in documents:
+                self._state.remove(document["id"])
+                self._state.add(document)
+            self._advance_marks(documents)
+
+    def _advance_marks(self, documents: List[Dict[str, Any]]) -> None:
+        for document in documents:
+            updated_at = document.get("updated_at")
+            if updated_at is not None and (self._changed_since is None or updated_at > self._changed_since):
+                self._changed_since = updated_at
+            if self._max_id is None or document["id"] > self._max_id:
+                self._max_id = document["id"]
+
+    def rebuild(self, db: Session) -> None:
+        """
+        Nạp lại toàn bộ và thay chỉ mục; tìm kiếm vẫn dùng bản cũ trong lúc dựng
+        """
+        with self._lock:
+            # Thay đổi đánh dấu từ đây trở đi sẽ được nạp lại sau khi dựng xong
+            self._dirty_ids.clear()
+            self._dirty_user_ids.clear()
+        try:
+            state = _IndexState()
+            for document in self._loader(db, None):
+                state.add(document, keep_sorted=False)
+            for index in state.fields.values():
+                index.sort_tokens()
+        finally:
+            with self._lock:
+                self._building = False
+        with self._lock:
+            self._state = state
+            self._built_at = time.monotonic()
+            self._synced_at = self._built_at
+            self._changed_since, self._max_id = None, None
+            self._advance_marks(list(state.docs.values()))
+
+    def _rebuild_in_background(self) -> None:
+        db = self.session_factory()
+        try:
+            self.rebuild(db)
+        except Exception as e:
+            print(f"Error rebuilding {self.name} search index: {e}")
+        finally:
+            db.close()
+
+    # ----- Tìm kiếm -----
+
+    def search(self, query: str, field: Optional[str] = None, limit: Optional[int] = None) -> List[Tuple[Dict[str, Any], float]]:
+        """
+        Trả về (document, score) theo điểm giảm dần. Mọi từ khóa đều phải khớp.
+
+        Args:
+            query: Chuỗi tìm kiếm (có dấu hoặc không dấu)
+            field: Giới hạn trong một trường (code, full_name, email)
+            limit: Số kết quả tối đa
+        """
+        query_tokens = list(dict.fromkeys(tokenize(query)))
+        if not query_tokens:
+            return []
+        fields = [field] if field else list(FIELD_WEIGHTS)
+        normalized_query = " ".join(query_tokens)
+
+        with self._lock:
+            state = self._state
+            totals: Optional[Dict[int, float]] = None
+            for query_token in query_tokens:
+                token_scores = self._score_token(state, query_token, fields, fuzzy=False)
+                if not token_scores:
+                    # Không có từ nào khớp đúng/tiền tố: thử gần đúng
+                    token_scores = self._score_token(state, query_token, fields, fuzzy=True)
+                if totals is None:
+                    totals = token_scores
+                else:
+                    totals = {doc_id: totals[doc_id] + score for doc_id, score in token_scores.items() if doc_id in totals}
+                if not totals:
+                    return []
+
+            results = []
+            for doc_id, score in totals.items():
+                document = state.docs[doc_id]
+                # Ưu tiên khớp trọn mã hoặc họ tên bắt đầu bằng chuỗi tìm kiếm
+                if "code" in fields and " ".join(tokenize(document.get("code"))) == normalized_query:
+                    score += 10.0
+                elif "full_name" in fields and " ".join(tokenize(document.get("full_name"))).startswith(normalized_query):
+                    score += 1.0
+                results.append((document, round(score, 4)))
+
+        results.sort(key=lambda item: (-item[1], item[0]["id"]))
+        return results[:limit] if limit else results
+
+    @staticmethod
+    def _score_token(state: _IndexState, query_token: str, fields: List[str], fuzzy: bool) -> Dict[int, float]:
+        token_scores: Dict[int, float] = {}
+        for name in fields:
+            index = state.fields[name]
+            matches = index.fuzzy_match(query_token) if fuzzy else index.match(query_token)
+            weight = FIELD_WEIGHTS[name]
+            for doc_id, score in matches.items():
+                weighted = weight * score
+                if token_scores.get(doc_id, 0.0) < weighted:
+                    token_scores[doc_id] = weighted
+        return token_scores
+
+    def search_ids(self, db: Session, query: str, field: Optional[str] = None, limit: Optional[int] = None) -> List[int]:
+        """
+        Làm mới chỉ mục rồi trả về id các bản ghi khớp, theo thứ hạng (tối đa limit bản ghi)
+        """
+        self.refresh(db)
+        return [document["id"] for document, _ in self.search(query, field=field, limit=limit)]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "documents": len(self._state.docs),
+                "tokens": {field: len(index.postings) for field, index in self._state.fields.items()},
+                "age_seconds": round(time.monotonic() - self._built_at, 1) if self._built_at is not None else None,
+                "rebuilding": self._building,
+                "pending": len(self._dirty_ids) + len(self._dirty_user_ids)
+            }
+
+
+def _changed_filter(id_column, changed_since: Optional[datetime], after_id: Optional[int]):
+    """
+    Bản ghi có id lớn hơn after_id hoặc user có updated_at từ changed_since trở đi
+    """
+    conditions = []
+    if after_id is not None:
+        conditions.append(id_column > after_id)
+    if changed_since is not None:
+        conditions.append(User.updated_at >= changed_since)
+    return or_(*conditions) if conditions else None
+
+
+def _load_students(db: Session, student_ids: Optional[List[int]] = None,
+                   changed_since: Optional[datetime] = None, after_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    query = db.query(
+        Student.student_id, Student.user_id, Student.student_code, User.full_name, User.email, User.updated_at
+    ).outerjoin(User, User.user_id == Student.user_id)
+    if student_ids is not None:
+        query = query.filter(Student.student_id.in_(student_ids))
+    changed = _changed_filter(Student.student_id, changed_since, after_id)
+    if changed is not None:
+        query = query.filter(changed)
+    return [
+        {"id": row.student_id, "user_id": row.user_id, "code": row.student_code,
+         "full_name": row.full_name, "email": row.email, "updated_at": row.updated_at}
+        for row in query.all()
+    ]
+
+
+def _load_teachers(db: Session, teacher_ids: Optional[List[int]] = None,
+                   changed_since: Optional[datetime] = None, after_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    query = db.query(
+        Teacher.teacher_id, Teacher.user_id, Teacher.teacher_code, User.full_name, User.email, User.updated_at
+    ).outerjoin(User, User.user_id == Teacher.user_id)
+    if teacher_ids is not None:
+        query = query.filter(Teacher.teacher_id.in_(teacher_ids))
+    changed = _changed_filter(Teacher.teacher_id, changed_since, after_id)
+    if changed is not None:
+        query = query.filter(changed)
+    return [
+        {"id": row.teacher_id, "user_id": row.user_id, "code": row.teacher_code,
+         "full_name": row.full_name, "email": row.email, "updated_at": row.updated_at}
+        for row in query.all()
+    ]
+
+
+student_search_index = SearchIndex("students", _load_students)
+teacher_search_index = SearchIndex("teachers", _load_teachers)
+
+# Tên trường của API -> trường trong chỉ mục
+STUDENT_SEARCH_FIELD_MAP = {"student_code": "code", "full_name": "full_name", "name": "full_name", "email": "email"}
+TEACHER_SEARCH_FIELD_MAP = {"teacher_code": "code", "full_name": "full_name", "name": "full_name", "email": "email"}
+
+
+def mark_user_changed(user_id: Optional[int]) -> None:
+    """
+    Họ tên/email của user thay đổi: nạp lại sinh viên/giáo viên tương ứng
+    """
+    student_search_index.mark_user_changed(user_id)
+    teacher_search_index.mark_user_changed(user_id)
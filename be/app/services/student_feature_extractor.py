@@ -0,0 +1,268 @@
+from typing import Dict, List, Any, Optional, Tuple, Iterable
+from sqlalchemy.orm import Session
+from sqlalchemy import func, case
+import numpy as np
+
+from app.models.models import Student, Grade, DisciplinaryRecord, ClassStudent
+from app.models.attendance import Attendance
+
+# Thứ tự đặc trưng mặc định dùng cho các mô hình ML
+DEFAULT_FEATURE_NAMES = [
+    'attendance_rate', 'avg_gpa', 'failed_subjects', 'total_subjects',
+    'minor_violations', 'moderate_violations', 'severe_violations',
+    'academic_status', 'family_income_level', 'scholarship_status',
+    'previous_academic_warning', 'dropped_classes', 'semester_count',
+    'grade_trend', 'attendance_trend'
+]
+
+# Các đặc trưng dạng đếm/mã hóa, trả về dạng int khi chuyển sang dict
+INTEGER_FEATURES = {
+    'failed_subjects', 'total_subjects', 'minor_violations', 'moderate_violations',
+    'severe_violations', 'academic_status', 'family_income_level', 'scholarship_status',
+    'previous_academic_warning', 'dropped_classes', 'semester_count'
+}
+
+ACADEMIC_STATUS_MAP = {'good': 0, 'warning': 1, 'probation': 2, 'suspended': 3}
+INCOME_LEVEL_MAP = {'very_low': 0, 'low': 1, 'medium': 2, 'high': 3, 'very_high': 4}
+SCHOLARSHIP_MAP = {'none': 0, 'partial': 1, 'full': 2}
+
+# Số lượng student_id tối đa trong một mệnh đề IN
+ID_CHUNK_SIZE = 1000
+
+# Số buổi điểm danh gần nhất dùng để tính xu hướng (30 gần nhất + 30 trước đó)
+TREND_WINDOW = 30
+
+
+class StudentFeatureExtractor:
+    """
+    Trích xuất đặc trưng nguy cơ bỏ học cho nhiều sinh viên cùng lúc
+    bằng một số ít truy vấn GROUP BY thay vì 5 truy vấn cho mỗi sinh viên
+    """
+
+    def __init__(self, db: Session, feature_names: Optional[List[str]] = None):
+        self.db = db
+        self.feature_names = list(feature_names or DEFAULT_FEATURE_NAMES)
+
+    def extract_batch(
+        self,
+        student_ids: Optional[Iterable[int]] = None
+    ) -> Tuple[List[int], np.ndarray]:
+        """
+        Xây dựng ma trận đặc trưng cho danh sách sinh viên (hoặc toàn bộ sinh viên nếu student_ids=None)
+
+        Returns:
+            Tuple gồm danh sách student_id (theo thứ tự hàng) và ma trận NumPy
+            có các cột theo đúng thứ tự feature_names. Sinh viên không tồn tại bị bỏ qua.
+        """
+        if student_ids is None:
+            columns = self._extract_columns(None)
+        else:
+            ids = list(dict.fromkeys(student_ids))
+            columns = {}
+            for start in range(0, len(ids), ID_CHUNK_SIZE):
+                columns.update(self._extract_columns(ids[start:start + ID_CHUNK_SIZE]))
+
+        ordered_ids = list(columns.keys())
+        matrix = np.zeros((len(ordered_ids), len(self.feature_names)), dtype=float)
+        for row, student_id in enumerate(ordered_ids):
+            features = columns[student_id]
+            matrix[row] = [features.get(name, 0.0) for name in self.feature_names]
+
+        return ordered_ids, matrix
+
+    def extract_one(self, student_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Trích xuất đặc trưng cho một sinh viên, trả về None nếu không tìm thấy
+        """
+        ids, matrix = self.extract_batch([student_id])
+        if not ids:
+            return None
+        return self.row_to_dict(matrix[0])
+
+    def row_to_dict(self, row: np.ndarray) -> Dict[str, Any]:
+        """
+        Chuyển một hàng của ma trận đặc trưng thành dict theo feature_names
+        """
+        return {
+            name: int(value) if name in INTEGER_FEATURES else float(value)
+            for name, value in zip(self.feature_names, row.tolist())
+        }
+
+    def _extract_columns(self, student_ids: Optional[List[int]]) -> Dict[int, Dict[str, float]]:
+        """
+        Chạy các truy vấn tổng hợp cho một nhóm sinh viên và gộp kết quả theo student_id
+        """
+        def scoped(query, column):
+            if student_ids is None:
+                return query
+            return query.filter(column.in_(student_ids))
+
+        # Thông tin cơ bản của sinh viên
+        students = scoped(
+            self.db.query(
+                Student.student_id,
+                Student.academic_status,
+                Student.family_income_level,
+                Student.scholarship_status
+            ),
+            Student.student_id
+        ).order_by(Student.student_id).all()
+
+        features: Dict[int, Dict[str, float]] = {}
+        for student_id, academic_status, income_level, scholarship in students:
+            features[student_id] = {
+                'attendance_rate': 100.0,
+                'avg_gpa': 0.0,
+                'failed_subjects': 0,
+                'total_subjects': 0,
+                'minor_violations': 0,
+                'moderate_violations': 0,
+                'severe_violations': 0,
+                'academic_status': ACADEMIC_STATUS_MAP.get(academic_status, 0),
+                'family_income_level': INCOME_LEVEL_MAP.get(income_level, 2),  # default medium
+                'scholarship_status': SCHOLARSHIP_MAP.get(scholarship, 0),
+                # Không có trong model Student - sử dụng giá trị mặc định
+                'previous_academic_warning': 0,
+                'dropped_classes': 0,
+                'semester_count': 0,
+                'grade_trend': 0.0,
+                'attendance_trend': 0.0
+            }
+
+        if not features:
+            return features
+
+        # Điểm danh: tổng số buổi và số buổi có mặt
+        attendance_rows = scoped(
+            self.db.query(
+                Attendance.student_id,
+                func.count(Attendance.attendance_id),
+                func.sum(case((Attendance.status == 'present', 1), else_=0))
+            ),
+            Attendance.student_id
+        ).group_by(Attendance.student_id).all()
+
+        # Chỉ tính xu hướng cho sinh viên có từ 10 buổi điểm danh trở lên
+        trend_totals: Dict[int, int] = {}
+        for student_id, total, present in attendance_rows:
+            if student_id not in features or not total:
+                continue
+            features[student_id]['attendance_rate'] = float(present or 0) / total * 100
+            if total >= 10:
+                trend_totals[student_id] = int(total)
+
+        # Điểm số: GPA trung bình, số môn không đạt, tổng số môn
+        grade_rows = scoped(
+            self.db.query(
+                Grade.student_id,
+                func.count(Grade.grade_id),
+                func.avg(Grade.gpa),
+                func.sum(case((Grade.gpa < 5.0, 1), else_=0))
+            ),
+            Grade.student_id
+        ).group_by(Grade.student_id).all()
+
+        for student_id, total, avg_gpa, failed in grade_rows:
+            if student_id not in features:
+                continue
+            features[student_id]['total_subjects'] = int(total or 0)
+            features[student_id]['avg_gpa'] = float(avg_gpa) if avg_gpa is not None else 0.0
+            features[student_id]['failed_subjects'] = int(failed or 0)
+
+        # Vi phạm kỷ luật theo mức độ
+        disciplinary_rows = scoped(
+            self.db.query(
+                DisciplinaryRecord.student_id,
+                func.sum(case((DisciplinaryRecord.severity_level == 'minor', 1), else_=0)),
+                func.sum(case((DisciplinaryRecord.severity_level == 'moderate', 1), else_=0)),
+                func.sum(case((DisciplinaryRecord.severity_level == 'severe', 1), else_=0))
+            ),
+            DisciplinaryRecord.student_id
+        ).group_by(DisciplinaryRecord.student_id).all()
+
+        for student_id, minor, moderate, severe in disciplinary_rows:
+            if student_id not in features:
+                continue
+            features[student_id]['minor_violations'] = int(minor or 0)
+            features[student_id]['moderate_violations'] = int(moderate or 0)
+            features[student_id]['severe_violations'] = int(severe or 0)
+
+        # Thông tin lớp học: số lớp đã bỏ và số lớp đã tham gia
+        enrollment_rows = scoped(
+            self.db.query(
+                ClassStudent.student_id,
+                func.sum(case((ClassStudent.status == 'dropped', 1), else_=0)),
+                func.count(func.distinct(ClassStudent.class_id))
+            ),
+            ClassStudent.student_id
+        ).group_by(ClassStudent.student_id).all()
+
+        for student_id, dropped, class_count in enrollment_rows:
+            if student_id not in features:
+                continue
+            features[student_id]['dropped_classes'] = int(dropped or 0)
+            features[student_id]['semester_count'] = int(class_count or 0)
+
+        self._apply_grade_trend(features, student_ids)
+        self._apply_attendance_trend(features, trend_totals)
+
+        return features
+
+    def _apply_grade_trend(self, features: Dict[int, Dict[str, float]], student_ids: Optional[List[int]]) -> None:
+        """
+        Xu hướng điểm: so sánh GPA của 3 bản ghi điểm gần nhất (theo grade_id)
+        """
+        row_number = func.row_number().over(
+            partition_by=Grade.student_id,
+            order_by=Grade.grade_id.desc()
+        ).label('rn')
+        ranked = self.db.query(Grade.student_id, Grade.gpa, row_number)
+        if student_ids is not None:
+            ranked = ranked.filter(Grade.student_id.in_(student_ids))
+        ranked = ranked.subquery()
+
+        recent_rows = self.db.query(
+            ranked.c.student_id, ranked.c.gpa
+        ).filter(ranked.c.rn <= 3).order_by(ranked.c.student_id, ranked.c.rn).all()
+
+        recent_gpas: Dict[int, List[float]] = {}
+        for student_id, gpa in recent_rows:
+            if gpa is not None:
+                recent_gpas.setdefault(student_id, []).append(gpa)
+
+        for student_id, gpas in recent_gpas.items():
+            if student_id in features and len(gpas) >= 2:
+                features[student_id]['grade_trend'] = (gpas[0] - gpas[-1]) / len(gpas)
+
+    def _apply_attendance_trend(self, features: Dict[int, Dict[str, float]], totals: Dict[int, int]) -> None:
+        """
+        Xu hướng điểm danh: so sánh tỷ lệ có mặt của tối đa 30 buổi gần nhất với số buổi tương ứng trước đó
+        """
+        if not totals:
+            return
+
+        row_number = func.row_number().over(
+            partition_by=Attendance.student_id,
+            order_by=(Attendance.date.desc(), Attendance.attendance_id)
+        ).label('rn')
+        ranked = self.db.query(
+            Attendance.student_id, Attendance.status, row_number
+        ).filter(Attendance.student_id.in_(list(totals.keys()))).subquery()
+
+        # Chỉ cần tối đa 2 * TREND_WINDOW buổi gần nhất cho mỗi sinh viên
+        rows = self.db.query(
+            ranked.c.student_id, ranked.c.status
+        ).filter(ranked.c.rn <= 2 * TREND_WINDOW).order_by(ranked.c.student_id, ranked.c.rn).all()
+
+        statuses: Dict[int, List[str]] = {}
+        for student_id, status in rows:
+            statuses.setdefault(student_id, []).append(status)
+
+        for student_id, recent_statuses in statuses.items():
+            window = min(TREND_WINDOW, totals[student_id] // 2)
+            recent = recent_statuses[:window]
+            previous = recent_statuses[window:window * 2]
+            if recent and previous:
+                recent_rate = sum(1 for s in recent if s == 'present') / len(recent)
+                previous_rate = sum(1 for s in previous if s == 'present') / len(previous)
+                features[student_id]['attendance_trend'] = recent_rate - previous_rate
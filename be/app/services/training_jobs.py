@@ -0,0 +1,386 @@
+import json
+import multiprocessing
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Any, Optional, List
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.models.models import TrainingJobRecord
+
+# Loại job huấn luyện
+ML_MODELS_JOB = "ml_dropout_models"
+GRADIENT_BOOSTING_JOB = "dropout_risk_model"
+
+# Trạng thái job
+PENDING = "pending"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+# Số job đã kết thúc được giữ lại trong bảng training_jobs
+MAX_FINISHED_JOBS = 50
+
+
+class ModelNotReady(Exception):
+    """
+    Chưa có mô hình được huấn luyện; job huấn luyện nền đã được gửi (hoặc đang chạy)
+    """
+
+    def __init__(self, job: "TrainingJob"):
+        super().__init__("Mô hình đang được huấn luyện, vui lòng thử lại sau")
+        self.job = job
+
+
+def _report_progress(job_id: str, percent: int, stage: str) -> None:
+    """
+    Chạy trong process con: ghi tiến độ vào bảng training_jobs để mọi worker đọc được
+    """
+    db = SessionLocal()
+    try:
+        now = datetime.now()
+        record = db.get(TrainingJobRecord, job_id)
+        if record is None:
+            return
+        if record.status == PENDING:
+            record.status = RUNNING
+            record.started_at = now
+        record.progress = percent
+        record.stage = stage
+        record.heartbeat_at = now
+        db.commit()
+    except Exception as e:
+        print(f"Error reporting training progress for {job_id}: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+def _run_ml_training(job_id: str, **options) -> Dict[str, Any]:
+    """
+    Chạy trong process con: huấn luyện Random Forest và Logistic Regression
+    """
+    from app.services.dropout_risk_ml_service import MLDropoutRiskPredictionService
+
+    def report(percent: int, stage: str):
+        _report_progress(job_id, percent, stage)
+
+    db = SessionLocal()
+    try:
+        ml_service = MLDropoutRiskPredictionService(db)
+        return ml_service.train_models(progress_callback=report, **options)
+    finally:
+        db.close()
+
+
+def _run_gradient_boosting_training(job_id: str) -> Dict[str, Any]:
+    """
+    Chạy trong process con: huấn luyện mô hình Gradient Boosting của service dự báo
+    """
+    from app.services.dropout_risk_prediction import DropoutRiskPredictionService
+
+    _report_progress(job_id, 10, "training_gradient_boosting")
+
+    db = SessionLocal()
+    try:
+        model_data = DropoutRiskPredictionService(db)._train_ml_model()
+    finally:
+        db.close()
+
+    if not model_data:
+        raise ValueError("Không thể huấn luyện mô hình")
+
+    # Chỉ trả về metrics, đối tượng mô hình đã được lưu xuống file
+    return {
+        "accuracy": float(model_data.get("accuracy", 0.0)),
+        "roc_auc": float(model_data.get("roc_auc", 0.0)),
+        "features": list(model_data.get("features", [])),
+        "trained_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
+JOB_RUNNERS = {
+    ML_MODELS_JOB: _run_ml_training,
+    GRADIENT_BOOSTING_JOB: _run_gradient_boosting_training,
+}
+
+
+def _to_json(value: Any) -> Any:
+    # Kết quả huấn luyện có thể chứa kiểu NumPy/datetime, chuyển sang kiểu JSON trước khi lưu
+    return json.loads(json.dumps(value, default=lambda o: o.tolist() if hasattr(o, "tolist") else str(o)))
+
+
+class TrainingJob:
+    """
+    Thông tin một job huấn luyện chạy nền (bản đọc từ bảng training_jobs)
+    """
+
+    def __init__(self, kind: str, options: Optional[Dict[str, Any]] = None):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.options = options or {}
+        self.status = PENDING
+        self.progress = 0
+        self.stage = "queued"
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+
+    @classmethod
+    def from_record(cls, record: TrainingJobRecord) -> "TrainingJob":
+        job = cls(record.kind, record.options)
+        job.job_id = record.job_id
+        job.status = record.status
+        job.progress = record.progress
+        job.stage = record.stage
+        job.created_at = record.created_at
+        job.started_at = record.started_at
+        job.finished_at = record.finished_at
+        job.result = record.result
+        job.error = record.error
+        return job
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in (PENDING, RUNNING)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "options": self.options,
+            "status": self.status,
+            "progress": self.progress,
+            "stage": self.stage,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error
+        }
+
+
+class TrainingJobManager:
+    """
+    Quản lý job huấn luyện trong process pool để worker HTTP không bị chiếm khi huấn luyện.
+
+    Trạng thái job nằm trong bảng training_jobs nên mọi worker (và mọi máy chủ) đều thấy cùng
+    một danh sách job. Mỗi loại job chỉ có tối đa một job đang chạy: cột duy nhất active_kind
+    khiến yêu cầu trùng ở worker khác nhận lại job hiện có. Worker sở hữu job cập nhật
+    heartbeat_at định kỳ; job không được cập nhật quá TRAINING_JOB_STALE_AFTER giây
+    (worker đã dừng) được đánh dấu thất bại để có thể gửi job mới.
+    """
+
+    def __init__(self, max_workers: int, session_factory: Callable[[], Session] = SessionLocal):
+        self.max_workers = max_workers
+        self.session_factory = session_factory
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Các job do worker này chạy, cần gửi heartbeat
+        self._owned: Dict[str, Future] = {}
+        self._heartbeat: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def _ensure_executor(self) -> None:
+        if self._executor is None:
+            # spawn: process con không kế thừa connection pool của process cha
+            context = multiprocessing.get_context("spawn")
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+
+    def submit(self, kind: str, **options) -> TrainingJob:
+        """
+        Gửi job huấn luyện, trả về job đang chạy (ở bất kỳ worker nào) nếu đã có job cùng loại
+
+        Args:
+            kind: Loại job huấn luyện
+            options: Tham số truyền cho hàm huấn luyện (ví dụ chiến lược tìm kiếm siêu tham số)
+        """
+        if kind not in JOB_RUNNERS:
+            raise ValueError(f"Loại job không hợp lệ: {kind}")
+
+        with self._lock:
+            db = self.session_factory()
+            try:
+                self._expire_stale_jobs(db)
+                job = TrainingJob(kind, options)
+                db.add(TrainingJobRecord(
+                    job_id=job.job_id, kind=kind, active_kind=kind, options=_to_json(options),
+                    status=PENDING, progress=0, stage=job.stage,
+                    created_at=job.created_at, heartbeat_at=job.created_at
+                ))
+                try:
+                    db.commit()
+                except IntegrityError:
+                    # Đã có job cùng loại đang chạy
+                    db.rollback()
+                    active = db.query(TrainingJobRecord).filter(TrainingJobRecord.active_kind == kind).first()
+                    if active is None:
+                        raise
+                    return TrainingJob.from_record(active)
+
+                try:
+                    self._ensure_executor()
+                    try:
+                        future = self._executor.submit(JOB_RUNNERS[kind], job.job_id, **options)
+                    except BrokenProcessPool:
+                        # Process pool bị hỏng (process con bị kill): tạo lại
+                        self._executor = None
+                        self._ensure_executor()
+                        future = self._executor.submit(JOB_RUNNERS[kind], job.job_id, **options)
+                except Exception as e:
+                    self._finish(job.job_id, FAILED, error=str(e) or type(e).__name__)
+                    raise
+
+                self._owned[job.job_id] = future
+                self._start_heartbeat()
+            finally:
+                db.close()
+
+        future.add_done_callback(lambda f, job=job: self._on_done(job, f))
+        return job
+
+    def get(self, job_id: str) -> Optional[TrainingJob]:
+        """
+        Lấy job theo id với tiến độ mới nhất
+        """
+        db = self.session_factory()
+        try:
+            self._expire_stale_jobs(db)
+            record = db.get(TrainingJobRecord, job_id)
+            return TrainingJob.from_record(record) if record is not None else None
+        finally:
+            db.close()
+
+    def list(self) -> List[TrainingJob]:
+        db = self.session_factory()
+        try:
+            self._expire_stale_jobs(db)
+            records = db.query(TrainingJobRecord).order_by(
+                TrainingJobRecord.created_at.desc()
+            ).limit(MAX_FINISHED_JOBS + len(JOB_RUNNERS)).all()
+            return [TrainingJob.from_record(record) for record in records]
+        finally:
+            db.close()
+
+    def shutdown(self) -> None:
+        self._stopped.set()
+        self._heartbeat = None
+        if self._executor is not None:
+            # Các job chưa chạy bị hủy và được đánh dấu thất bại trong _on_done
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _start_heartbeat(self) -> None:
+        # Gọi khi đang giữ self._lock
+        if self._heartbeat is None:
+            self._stopped.clear()
+            self._heartbeat = threading.Thread(target=self._run_heartbeat, name="training-jobs-heartbeat", daemon=True)
+            self._heartbeat.start()
+
+    def _run_heartbeat(self) -> None:
+        while not self._stopped.wait(settings.TRAINING_JOB_HEARTBEAT_INTERVAL):
+            with self._lock:
+                job_ids = list(self._owned)
+                if not job_ids:
+                    self._heartbeat = None
+                    return
+            db = self.session_factory()
+            try:
+                db.query(TrainingJobRecord).filter(
+                    TrainingJobRecord.job_id.in_(job_ids),
+                    TrainingJobRecord.active_kind.isnot(None)
+                ).update({"heartbeat_at": datetime.now()}, synchronize_session=False)
+                db.commit()
+            except Exception as e:
+                print(f"Error updating training job heartbeat: {e}")
+                db.rollback()
+            finally:
+                db.close()
+
+    def _expire_stale_jobs(self, db: Session) -> None:
+        """
+        Đánh dấu thất bại các job đang chạy mà worker sở hữu không còn gửi heartbeat
+        """
+        deadline = datetime.now() - timedelta(seconds=settings.TRAINING_JOB_STALE_AFTER)
+        expired = db.query(TrainingJobRecord).filter(
+            TrainingJobRecord.active_kind.isnot(None),
+            TrainingJobRecord.heartbeat_at < deadline
+        ).update({
+            "status": FAILED,
+            "stage": "failed",
+            "error": "Worker chạy job đã dừng",
+            "finished_at": datetime.now(),
+            "active_kind": None
+        }, synchronize_session=False)
+        if expired:
+            db.commit()
+
+    def _finish(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        db = self.session_factory()
+        try:
+            now = datetime.now()
+            record = db.get(TrainingJobRecord, job_id)
+            if record is None:
+                return
+            record.status = status
+            record.stage = "completed" if status == COMPLETED else "failed"
+            if status == COMPLETED:
+                record.progress = 100
+            record.result = _to_json(result) if result is not None else None
+            record.error = error
+            record.started_at = record.started_at or record.created_at
+            record.finished_at = now
+            record.heartbeat_at = now
+            record.active_kind = None
+            db.commit()
+            self._trim_finished_jobs(db)
+        except Exception as e:
+            print(f"Error saving training job {job_id}: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def _on_done(self, job: TrainingJob, future: Future) -> None:
+        self._owned.pop(job.job_id, None)
+
+        if future.cancelled():
+            self._finish(job.job_id, FAILED, error="Job bị hủy khi tắt ứng dụng")
+            return
+        try:
+            result = future.result()
+        except Exception as e:
+            self._finish(job.job_id, FAILED, error=str(e) or type(e).__name__)
+            return
+        self._finish(job.job_id, COMPLETED, result=result)
+
+        # Worker hiện tại nhận mô hình mới ngay ở request tiếp theo,
+        # các worker khác nhận khi registry kiểm tra lại thư mục mô hình
+        from app.services.model_registry import get_model_registry
+        if job.kind == ML_MODELS_JOB:
+            from app.services.dropout_risk_ml_service import MODELS_DIR, MODEL_FILE_PREFIX
+            get_model_registry(MODELS_DIR, MODEL_FILE_PREFIX).invalidate()
+        elif job.kind == GRADIENT_BOOSTING_JOB:
+            from app.services.risk_scoring import GRADIENT_BOOSTING_MODELS_DIR, GRADIENT_BOOSTING_FILE_PREFIX
+            get_model_registry(GRADIENT_BOOSTING_MODELS_DIR, GRADIENT_BOOSTING_FILE_PREFIX).invalidate()
+
+    def _trim_finished_jobs(self, db: Session) -> None:
+        stale_ids = [
+            row[0] for row in db.query(TrainingJobRecord.job_id).filter(
+                TrainingJobRecord.active_kind.is_(None)
+            ).order_by(TrainingJobRecord.created_at.desc()).offset(MAX_FINISHED_JOBS).all()
+        ]
+        if stale_ids:
+            db.query(TrainingJobRecord).filter(
+                TrainingJobRecord.job_id.in_(stale_ids)
+            ).delete(synchronize_session=False)
+            db.commit()
+
+
+training_jobs = TrainingJobManager(max_workers=settings.ML_TRAINING_WORKERS)
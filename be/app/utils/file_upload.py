@@ -2,34 +2,61 @@ import os
 import uuid
 from fastapi import UploadFile, HTTPException, status
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, Tuple, BinaryIO
+from starlette.concurrency import run_in_threadpool
 
 from app.core.config import settings
 
 class FileUploader:
     @staticmethod
     def validate_image(file: UploadFile) -> None:
-        """Validate that uploaded file is an allowed image type and size"""
+        """Validate that uploaded file is an allowed image type (size is enforced while saving)"""
         # Check file type
         if file.content_type not in settings.ALLOWED_IMAGE_TYPES:
             raise HTTPException(
                 status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
                 detail=f"File type not allowed. Allowed types: {', '.join(settings.ALLOWED_IMAGE_TYPES)}"
             )
-        
-        # Check file size - we need to consume the file to check its size
-        file.file.seek(0, os.SEEK_END)
-        file_size = file.file.tell()
-        file.file.seek(0)  # Reset file pointer to beginning
-        
-        if file_size > settings.MAX_IMAGE_SIZE:
-            max_size_mb = settings.MAX_IMAGE_SIZE / (1024 * 1024)
-            raise HTTPException(
-                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                detail=f"File too large. Maximum allowed size: {max_size_mb} MB"
-            )    @staticmethod
-    def save_image(file: UploadFile, subfolder: str = "") -> str:
-        """Save image to disk and return its path"""
+    
+    @staticmethod
+    def _too_large() -> HTTPException:
+        max_size_mb = settings.MAX_IMAGE_SIZE / (1024 * 1024)
+        return HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File too large. Maximum allowed size: {max_size_mb} MB"
+        )
+    
+    @staticmethod
+    def _copy_stream(source: BinaryIO, file_path: str, max_size: int, chunk_size: int) -> int:
+        """
+        Copy source to file_path in fixed-size chunks, stopping as soon as max_size is exceeded.
+        Writes to a temporary file that is renamed into place, so no partial file is left behind.
+        Returns the number of bytes written.
+        """
+        temp_path = f"{file_path}.part"
+        size = 0
+        try:
+            with open(temp_path, "wb") as f:
+                while True:
+                    chunk = source.read(chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_size:
+                        raise FileUploader._too_large()
+                    f.write(chunk)
+            os.replace(temp_path, file_path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        return size
+    
+    @staticmethod
+    def save_image_with_size(file: UploadFile, subfolder: str = "") -> Tuple[str, int]:
+        """Stream image to disk, return its relative path and size in bytes"""
         # Create uploads directory if it doesn't exist
         upload_dir = Path(settings.UPLOAD_DIR)
         if subfolder:
@@ -39,7 +66,7 @@ class FileUploader:
         os.makedirs(upload_dir, exist_ok=True)
         
         # Generate unique filename
-        file_ext = os.path.splitext(file.filename)[1]
+        file_ext = os.path.splitext(file.filename or "")[1]
         if not file_ext:  # If no extension, default to jpg
             file_ext = ".jpg"
             
@@ -51,19 +78,32 @@ class FileUploader:
             # Reset file pointer to the beginning
             file.file.seek(0)
             
-            with open(file_path, "wb") as f:
-                f.write(file.file.read())
+            size = FileUploader._copy_stream(
+                file.file, file_path, settings.MAX_IMAGE_SIZE, settings.UPLOAD_CHUNK_SIZE
+            )
             
             # Return relative path for database storage
             if subfolder:
-                return f"{subfolder}/{unique_filename}".replace('\\', '/')
-            return unique_filename
+                return f"{subfolder}/{unique_filename}".replace('\\', '/'), size
+            return unique_filename, size
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"An error occurred while saving the file: {str(e)}"
             )
     
+    @staticmethod
+    def save_image(file: UploadFile, subfolder: str = "") -> str:
+        """Save image to disk and return its path"""
+        return FileUploader.save_image_with_size(file, subfolder)[0]
+    
+    @staticmethod
+    async def save_image_async(file: UploadFile, subfolder: str = "") -> Tuple[str, int]:
+        """Stream image to disk in a worker thread so async routes never block the event loop"""
+        return await run_in_threadpool(FileUploader.save_image_with_size, file, subfolder)
+    
     @staticmethod
     def get_image_url(image_path: str) -> str:
         """Convert relative image path to URL"""
@@ -1,11 +1,17 @@
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from starlette.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import os
 
 from app.api.v1.api import api_router
 from app.core.config import settings
+from app.services.training_jobs import training_jobs, ModelNotReady
+from app.services.image_derivatives import image_derivatives
+from app.services.last_login import last_login_recorder
+from app.db.metrics import RequestDBStats, current_request_stats, request_metrics
 
 # Tạo FastAPI application
 app = FastAPI(
@@ -30,6 +36,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Đếm số câu lệnh SQL và thời gian database của mỗi request
+@app.middleware("http")
+async def db_metrics_middleware(request: Request, call_next):
+    stats = RequestDBStats()
+    token = current_request_stats.set(stats)
+    try:
+        response = await call_next(request)
+    finally:
+        current_request_stats.reset(token)
+    request_metrics.record(stats)
+    response.headers["X-DB-Query-Count"] = str(stats.queries)
+    response.headers["X-DB-Time-Ms"] = f"{stats.duration * 1000:.1f}"
+    return response
+
+# Chưa có mô hình: job huấn luyện đã chạy nền, client thử lại sau
+@app.exception_handler(ModelNotReady)
+async def model_not_ready_handler(request: Request, exc: ModelNotReady):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc), "job": jsonable_encoder(exc.job.to_dict())},
+        headers={"Retry-After": str(settings.TRAINING_JOB_RETRY_AFTER)}
+    )
+
 # Đăng ký các API routes
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
@@ -40,6 +69,26 @@ os.makedirs(uploads_dir, exist_ok=True)
 # Mount static file server for uploads
 app.mount("/uploads", StaticFiles(directory=uploads_dir), name="uploads")
 
+# Bắt đầu flush last_login định kỳ
+@app.on_event("startup")
+def start_last_login_recorder():
+    last_login_recorder.start()
+
+# Dừng process pool huấn luyện khi tắt ứng dụng
+@app.on_event("shutdown")
+def shutdown_training_jobs():
+    training_jobs.shutdown()
+
+# Dừng process pool tạo ảnh thu nhỏ
+@app.on_event("shutdown")
+def shutdown_image_derivatives():
+    image_derivatives.shutdown()
+
+# Ghi nốt các last_login còn trong bộ đệm
+@app.on_event("shutdown")
+def shutdown_last_login_recorder():
+    last_login_recorder.stop()
+
 # Root endpoint
 @app.get("/")
 async def root():
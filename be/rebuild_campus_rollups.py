@@ -0,0 +1,31 @@
+"""
+Script to rebuild the campus rollups table (campus_rollups) from raw data.
+Use it after applying the migration, after importing data directly into the database,
+or from cron when CAMPUS_ROLLUP_RECOMPUTE_INTERVAL is set to 0.
+
+Usage:
+    python rebuild_campus_rollups.py
+"""
+import time
+
+from app.db.database import SessionLocal
+from app.crud.campus_rollup import rebuild_campus_rollups
+
+
+def main():
+    db = SessionLocal()
+    try:
+        start = time.time()
+        print("Rebuilding campus rollups...")
+        count = rebuild_campus_rollups(db)
+        print(f"Rebuilt {count} rollup rows in {time.time() - start:.1f}s")
+    except Exception as e:
+        db.rollback()
+        print(f"Error rebuilding campus rollups: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
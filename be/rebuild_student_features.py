@@ -0,0 +1,35 @@
+"""
+Script to rebuild the student risk feature store (student_risk_features) from raw data.
+Use it after applying the migration or after importing data directly into the database.
+
+Usage:
+    python rebuild_student_features.py [--chunk-size 1000]
+"""
+import argparse
+import time
+
+from app.db.database import SessionLocal
+from app.crud.student_feature import rebuild_student_features
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the student risk feature store")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Number of students per transaction")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        start = time.time()
+        print("Rebuilding student risk features...")
+        count = rebuild_student_features(db, chunk_size=args.chunk_size)
+        print(f"Rebuilt features for {count} students in {time.time() - start:.1f}s")
+    except Exception as e:
+        db.rollback()
+        print(f"Error rebuilding student features: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
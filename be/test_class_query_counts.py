@@ -0,0 +1,192 @@
+import asyncio
+import importlib
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.db.database import Base
+from app.models.models import User, Teacher, Student, Class, ClassStudent, Subject, Grade
+from app.models.attendance import Attendance
+from app.crud.student_feature import sync_student_features
+from app.schemas.schemas import ClassResponse, ClassStudentResponse
+from app.services.campus_rollups import rollup_refresher
+from app.services.prediction_cache import prediction_cache
+
+# Router modules (app.api.v1 re-exports the routers under the same names)
+classes_api = importlib.import_module("app.api.v1.classes")
+class_dropout_risk_api = importlib.import_module("app.api.v1.class_dropout_risk")
+class_dropout_risk_ml_api = importlib.import_module("app.api.v1.class_dropout_risk_ml")
+
+# Number of rows of the first and second measurement
+FEW, MANY = 4, 30
+
+ADMIN = User(user_id=0, username="admin", password_hash="x", role="admin", full_name="Admin", email="admin@example.com")
+
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'query_counts.db'}")
+    Base.metadata.create_all(engine)
+    # Rollup rebuilds run in a background thread and are not part of these endpoints
+    monkeypatch.setattr(rollup_refresher, "schedule", lambda: None)
+    # Trained models are written to ./models
+    monkeypatch.chdir(tmp_path)
+    prediction_cache.clear()
+    factory = sessionmaker(bind=engine)
+    db = factory()
+    db.add(Subject(subject_id=1, subject_code="S1", subject_name="Subject 1", credits=3))
+    db.commit()
+    db.close()
+    yield factory
+    prediction_cache.clear()
+    engine.dispose()
+
+
+def count_statements(session_factory, call):
+    """
+    Run call(db) in a new session and return (result, number of SQL statements executed)
+    """
+    statements = []
+    engine = session_factory.kw["bind"]
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    db = session_factory()
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        result = call(db)
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+        db.close()
+    return result, len(statements)
+
+
+def add_class_with_teacher(db, index):
+    user = User(username=f"teacher{index}", password_hash="x", role="teacher",
+                full_name=f"Teacher {index}", email=f"teacher{index}@example.com")
+    db.add(user)
+    db.flush()
+    teacher = Teacher(user_id=user.user_id, teacher_code=f"GV{index:04d}", department="CNTT")
+    db.add(teacher)
+    db.flush()
+    class_obj = Class(class_name=f"Class {index}", academic_year="2024-2025", semester="1",
+                      teacher_id=teacher.teacher_id, department="CNTT", max_students=1000, current_students=0)
+    db.add(class_obj)
+    db.flush()
+    return class_obj
+
+
+def add_students(db, class_id, start, count):
+    first_day = date(2024, 9, 1)
+    student_ids = []
+    for index in range(start, start + count):
+        user = User(username=f"student{index}", password_hash="x", role="student",
+                    full_name=f"Student {index}", email=f"student{index}@example.com")
+        db.add(user)
+        db.flush()
+        student = Student(user_id=user.user_id, student_code=f"SV{index:04d}",
+                          academic_status=["good", "good", "warning", "probation"][index % 4])
+        db.add(student)
+        db.flush()
+        student_ids.append(student.student_id)
+        db.add(ClassStudent(class_id=class_id, student_id=student.student_id, status="enrolled",
+                            enrollment_date=first_day))
+        db.add(Grade(student_id=student.student_id, subject_id=1, class_id=class_id, gpa=4.0 + index % 6))
+        for day in range(6):
+            db.add(Attendance(student_id=student.student_id, class_id=class_id,
+                              date=first_day + timedelta(days=day),
+                              status="absent" if index % 4 == 0 and day < 3 else "present"))
+    enrolled = db.query(ClassStudent).filter(ClassStudent.class_id == class_id).count()
+    db.query(Class).filter(Class.class_id == class_id).update({"current_students": enrolled})
+    # Stored risk features are kept in sync by the CRUD writes this seed bypasses
+    sync_student_features(db, student_ids)
+    db.commit()
+
+
+def test_read_classes_query_count_does_not_grow(session_factory):
+    def read_classes(db):
+        items = asyncio.run(classes_api.read_classes(
+            skip=0, limit=1000, department=None, academic_year=None, semester=None, db=db, current_user=ADMIN
+        ))
+        return [ClassResponse.model_validate(item).model_dump() for item in items]
+
+    counts = []
+    for total in (FEW, MANY):
+        db = session_factory()
+        for index in range(db.query(Class).count() + 1, total + 1):
+            add_class_with_teacher(db, index)
+        db.commit()
+        db.close()
+
+        items, statements = count_statements(session_factory, read_classes)
+        assert len(items) == total
+        assert all(item["teacher"]["user"] for item in items)
+        counts.append(statements)
+
+    assert counts[0] == counts[1]
+
+
+def test_read_class_students_query_count_does_not_grow(session_factory):
+    db = session_factory()
+    class_id = add_class_with_teacher(db, 1).class_id
+    db.commit()
+    db.close()
+
+    def read_class_students(db):
+        items = asyncio.run(classes_api.read_class_students(
+            class_id=class_id, skip=0, limit=1000, db=db, current_user=ADMIN
+        ))
+        return [ClassStudentResponse.model_validate(item).model_dump() for item in items]
+
+    counts = []
+    for start, count in ((1, FEW), (FEW + 1, MANY - FEW)):
+        db = session_factory()
+        add_students(db, class_id, start, count)
+        db.close()
+
+        items, statements = count_statements(session_factory, read_class_students)
+        assert len(items) == start + count - 1
+        assert all(item["student"]["user"] and item["class_obj"]["teacher"] for item in items)
+        counts.append(statements)
+
+    assert counts[0] == counts[1]
+
+
+def test_class_analytics_query_count_does_not_grow(session_factory):
+    from app.services.dropout_risk_ml_service import MLDropoutRiskPredictionService
+
+    db = session_factory()
+    class_id = add_class_with_teacher(db, 1).class_id
+    training_class_id = add_class_with_teacher(db, 2).class_id
+    db.commit()
+    add_students(db, class_id, 1, FEW)
+    add_students(db, training_class_id, 1000, 40)
+    # Small search budget: only the prediction path is measured here
+    MLDropoutRiskPredictionService(db).train_models(search_strategy="random", search_budget=1)
+    db.close()
+
+    endpoints = {
+        "analytics": lambda db: asyncio.run(class_dropout_risk_api.get_class_dropout_risk_analytics(
+            class_id=class_id, refresh=True, db=db, current_user=ADMIN
+        )),
+        "ml_analytics": lambda db: asyncio.run(class_dropout_risk_ml_api.get_class_dropout_risk_ml_analytics(
+            class_id=class_id, refresh=True, db=db, current_user=ADMIN
+        )),
+    }
+
+    counts = {name: [] for name in endpoints}
+    for start, count in ((None, None), (FEW + 1, MANY - FEW)):
+        if start is not None:
+            db = session_factory()
+            add_students(db, class_id, start, count)
+            db.close()
+        for name, endpoint in endpoints.items():
+            prediction_cache.clear()
+            _, statements = count_statements(session_factory, endpoint)
+            counts[name].append(statements)
+
+    assert counts["analytics"][0] == counts["analytics"][1]
+    assert counts["ml_analytics"][0] == counts["ml_analytics"][1]